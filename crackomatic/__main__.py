@@ -6,13 +6,14 @@ def init(args=None):
     init_db('sqlite:///' + args.db_path)
 
     from .log import init_log
-    sql = (args.operation != 'audit')
+    sql = (args.operation not in ['audit', 'worker', 'breach'])
     init_log('DEBUG' if args.debug else 'INFO', sql=sql)
 
     return args
 
 
 def run_web(args):
+    import signal
     import sys
     from logging import getLogger
 
@@ -24,6 +25,10 @@ def run_web(args):
 
     log = getLogger(__name__)
 
+    # Shut down cleanly when the service is stopped, so a running audit can
+    # be resumed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit())
+
     try:
         if args.key and args.cert:
             key, cert = args.key, args.cert
@@ -72,6 +77,18 @@ def main(args=None):
             print_audit_description()
         else:
             perform_audit(args.audit_file, interactive=args.interactive)
+    elif args.operation == 'worker':
+        import getpass
+        import os
+        import shlex
+        from .distributed import parse_address, run_worker
+        key = os.environ.get('CRACKOMATIC_WORKER_KEY') or \
+            getpass.getpass("Worker key: ")
+        run_worker(parse_address(args.address), key.encode(),
+                   args.binary_path, shlex.split(args.args), once=args.once)
+    elif args.operation == 'breach':
+        from .breach import build_index
+        build_index(args.corpus, args.index)
     elif args.operation == 'user':
         from .user import perform_user_action
         perform_user_action(args.action, args.username)
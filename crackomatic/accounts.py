@@ -0,0 +1,128 @@
+"""Decide which accounts are worth cracking
+
+Machine accounts, trust accounts and krbtgt have random passwords and
+disabled or stale accounts can't be used to log on, so cracking them wastes
+time and skews the report. Accounts are classified by the flags which
+pdbedit prints for each account and optionally by the userAccountControl
+and lastLogonTimestamp attributes from LDAP.
+"""
+
+import collections
+from datetime import datetime as dt, timedelta
+from logging import getLogger
+
+log = getLogger(__name__)
+
+# Account flags as printed by pdbedit, see smbpasswd(5)
+FLAG_DISABLED = 'D'
+FLAG_INTERDOMAIN_TRUST = 'I'
+FLAG_SERVER_TRUST = 'S'
+FLAG_WORKSTATION_TRUST = 'W'
+
+# Bits of userAccountControl
+UF_ACCOUNTDISABLE = 0x2
+UF_INTERDOMAIN_TRUST_ACCOUNT = 0x800
+UF_WORKSTATION_TRUST_ACCOUNT = 0x1000
+UF_SERVER_TRUST_ACCOUNT = 0x2000
+
+LDAP_ATTRIBUTES = ['sAMAccountName', 'userAccountControl',
+                   'lastLogonTimestamp']
+LDAP_FILTER = '(objectClass=user)'
+
+# Categories of accounts which can be skipped, and the config option that
+# enables it
+CATEGORIES = {
+    'machine': 'skip_machine_accounts',
+    'trust': 'skip_trust_accounts',
+    'disabled': 'skip_disabled_accounts',
+    'stale': 'stale_days',
+}
+
+
+def parse_flags(field):
+    """Turn a field like '[DU         ]' into a set of flags"""
+    return set(field.strip().strip('[]').replace(' ', ''))
+
+
+def parse_filetime(value):
+    """Convert a Windows timestamp (100ns intervals since 1601) into a
+    datetime or None if it is not set"""
+    value = int(value)
+    if not value:
+        return None
+    return dt(1601, 1, 1) + timedelta(microseconds=value // 10)
+
+
+def parse_ldap_entries(entries):
+    """Map the upper-case account names in the result of an LDAP query to
+    their userAccountControl and the time of their last logon"""
+    result = {}
+    for attributes in entries.values():
+        if 'sAMAccountName' not in attributes:
+            continue
+        name = attributes['sAMAccountName'][0].decode().upper()
+        uac = attributes.get('userAccountControl', [b'0'])[0]
+        last_logon = attributes.get('lastLogonTimestamp', [b'0'])[0]
+        result[name] = (int(uac), parse_filetime(last_logon))
+    return result
+
+
+def classify(user, flags, directory=None, stale_before=None):
+    """Return the set of categories an account belongs to
+
+    `directory` is the result of `parse_ldap_entries`. Accounts that never
+    logged on are not considered stale, because new accounts with initial
+    passwords are exactly what an audit should find."""
+    name = user.rpartition('\\')[2]
+    uac, last_logon = (directory or {}).get(name.upper(), (0, None))
+    result = set()
+    if FLAG_INTERDOMAIN_TRUST in flags \
+            or uac & UF_INTERDOMAIN_TRUST_ACCOUNT \
+            or name.lower() == 'krbtgt' or name.lower().startswith('krbtgt_'):
+        # The latter are the krbtgt accounts of read-only DCs
+        result.add('trust')
+    elif FLAG_WORKSTATION_TRUST in flags or FLAG_SERVER_TRUST in flags \
+            or uac & (UF_WORKSTATION_TRUST_ACCOUNT | UF_SERVER_TRUST_ACCOUNT) \
+            or name.endswith('$'):
+        result.add('machine')
+    if FLAG_DISABLED in flags or uac & UF_ACCOUNTDISABLE:
+        result.add('disabled')
+    if stale_before and last_logon and last_logon < stale_before:
+        result.add('stale')
+    return result
+
+
+def get_skipped_categories(config):
+    """Return the categories of accounts the cracker config asks to skip"""
+    return {c for c, option in CATEGORIES.items() if config.get(option)}
+
+
+def filter_records(records, skip, directory=None, stale_before=None,
+                   skipped=None):
+    """Generate the `HashRecord`s whose accounts are not in one of the given
+    categories
+
+    The skipped accounts are counted by category in the Counter `skipped`,
+    if given. The password history of skipped accounts is removed as well,
+    which relies on it following the current hashes like in the output of
+    `smb.get_hashes`."""
+    removed = set()
+    if skipped is None:
+        skipped = collections.Counter()
+    for record in records:
+        history = record.history
+        if history:
+            if history[0] not in removed:
+                yield record
+            continue
+        categories = classify(record.user, parse_flags(record.flags),
+                              directory, stale_before) & skip
+        if categories:
+            removed.add(record.user)
+            skipped.update(categories)
+        else:
+            yield record
+    if skipped:
+        log.info("Skipped accounts: %s" % ', '.join(
+            "%d %s" % (n, c) for c, n in sorted(skipped.items())
+        ))
@@ -110,6 +110,59 @@ audit_group.add_argument(
     help="Print a description of all required fields and exit;",
 )
 
+# Add worker subparser
+# ====================
+
+
+parser_worker = subparsers.add_parser(
+    'worker',
+    help="Crack a part of the keyspace of audits run by another instance",
+)
+
+parser_worker.add_argument(
+    'address',
+    help="Address and port of the coordinating instance (host:port); the"
+         " key is read from the environment variable CRACKOMATIC_WORKER_KEY"
+         " or prompted for",
+)
+
+parser_worker.add_argument(
+    '-b', '--binary-path', required=True,
+    help="Path to the cracker binary on this machine",
+)
+
+parser_worker.add_argument(
+    '-a', '--args', default='',
+    help="Additional arguments for the cracker on this machine",
+)
+
+parser_worker.add_argument(
+    '-1', '--once', default=False, action='store_true',
+    help="Exit after one audit instead of waiting for the next one",
+)
+
+
+# Add breach subparser
+# ====================
+
+
+parser_breach = subparsers.add_parser(
+    'breach',
+    help="Convert a corpus of breached NT hashes into a binary index",
+)
+
+parser_breach.add_argument(
+    'corpus',
+    help="Path to a list of NT hashes ordered by hash with their"
+         " prevalence, e.g. Pwned Passwords (HASH:COUNT)",
+)
+
+parser_breach.add_argument(
+    'index',
+    help="Path to the resulting index file",
+)
+
+
 # Add user subparser
 # ==================
 
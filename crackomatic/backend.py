@@ -1,5 +1,6 @@
+import collections
 from logging import getLogger
-from threading import Lock, Thread
+from threading import Lock, RLock, Thread
 from datetime import datetime as dt, timedelta
 from uuid import uuid4
 from time import sleep
@@ -9,13 +10,38 @@ from sqlalchemy import func
 from babel.dates import format_timedelta
 
 from ._version import __version__
-from .job import Job
+from .job import Job, can_resume, notifications_pending, remove_work_dir
+from .engines import get_engine_info, get_line_counts, count_files
+from .estimate import estimate, plan_files, NotCounted
+from .plan import parse_attack_plan
 from .models import Meta, session_scope, Audit, Log, freeze, Config
 from .config import CrackomaticConfig
-from .constants import AuditState, AuditFrequency, FINISHED_STATES
+from .constants import AuditState, AuditFrequency, FINISHED_STATES, \
+    RUNNING_STATES
 
 log = getLogger(__name__)
 
+# Time between two runs of a recurring audit
+INTERVALS = {
+    AuditFrequency.DAILY: timedelta(days=1),
+    AuditFrequency.WEEKLY: timedelta(days=7),
+    AuditFrequency.MONTHLY: timedelta(days=30),
+    AuditFrequency.QUARTERLY: timedelta(days=90),
+    AuditFrequency.YEARLY: timedelta(days=365),
+}
+# Maximum number of unscheduled audits waiting for a free slot
+MAX_QUEUED = 16
+
+
+def format_speed(speed):
+    if speed > 10**9:
+        return "%.01fG" % (speed/10**9)
+    elif speed > 10**6:
+        return "%.01fM" % (speed/10**6)
+    elif speed > 10**3:
+        return "%.01fK" % (speed/10**3)
+    return str(speed)
+
 
 class Backend(object):
     _SINGLETON = False
@@ -44,8 +70,18 @@ class Backend(object):
                 s.add(config)
         self.config = CrackomaticConfig(json.loads(config_json))
 
-        self._job_lock = Lock()
-        self._job = None
+        # Running jobs by audit ID
+        self._jobs = collections.OrderedDict()
+        # Audits waiting for a free slot: the audit, its password and
+        # whether it is resumed
+        self._queue = []
+        self._jobs_lock = RLock()
+        self._stopping = False
+        # Jobs using the same cracker share one of these, see `Job.crack`
+        self._crack_locks = {}
+
+        self.restore_interrupted_audits()
+        self.probe_engine()
 
         if with_cronjob:
             self._cron_thread_running = False
@@ -55,24 +91,40 @@ class Backend(object):
             )
             self._cron_thread.start()
 
+    @property
+    def _job(self):
+        """The oldest running job, if any"""
+        with self._jobs_lock:
+            return next(iter(self._jobs.values()), None)
+
+    @property
+    def max_jobs(self):
+        """Number of audits which may run at the same time"""
+        return int((self.config['cracker'] or {}).get('max_jobs') or 1)
+
+    def _get_crack_lock(self):
+        """Return the lock of the cracker in the current config
+
+        Workers connect to one address, so all distributed audits share a
+        lock as well."""
+        config = self.config['cracker'] or {}
+        if int(config.get('workers') or 0):
+            key = ('workers', config.get('coordinator_address'))
+        else:
+            key = (config.get('cracker'), config.get('binary_path'))
+        return self._crack_locks.setdefault(key, Lock())
+
     def clean_up_after_job(self, audit_uuid):
         """Clear Job object and possibly reschedule the audit"""
         try:
-            delta = {
-                AuditFrequency.DAILY: timedelta(days=1),
-                AuditFrequency.WEEKLY: timedelta(days=7),
-                AuditFrequency.MONTHLY: timedelta(days=30),
-                AuditFrequency.QUARTERLY: timedelta(days=90),
-                AuditFrequency.YEARLY: timedelta(days=365),
-            }
             with session_scope() as s:
                 old_audit = s.query(Audit).filter(
                     (Audit.uuid == audit_uuid)
                 ).one()
-                old_audit.report = self._job.report
+                old_audit.report = self._jobs[audit_uuid].report
                 dct = {}
                 # Copy audit if reschedule necessary
-                if old_audit.frequency in delta:
+                if old_audit.frequency in INTERVALS:
                     # Copy these attributes
                     for attr in [
                         'user',
@@ -88,26 +140,101 @@ class Backend(object):
                         'message',
                         'include_cracked',
                         'frequency',
+                        'max_duration',
+                        'window_start',
+                        'window_end',
+                        'priority_filter',
+                        'sample_size',
+                        'child_domains',
                     ]:
                         dct[attr] = getattr(old_audit, attr)
+                    interval = INTERVALS[old_audit.frequency]
                     new_audit = Audit(
                         **dct,
                         uuid=uuid4().hex,
                         state=AuditState.SCHEDULED,
-                        start=old_audit.start + delta[old_audit.frequency],
+                        start=old_audit.start + interval,
                     )
                     s.add(new_audit)
         except Exception as e:
             log.error("Rescheduling failed, audit id: %s" % audit_uuid)
             log.exception(e)
         finally:
-            self._job = None
+            with self._jobs_lock:
+                self._jobs.pop(audit_uuid, None)
+                self._start_queued()
+
+    def _start_queued(self):
+        """Start queued audits while there are free slots"""
+        with self._jobs_lock:
+            while self._queue and not self._stopping \
+                    and len(self._jobs) < self.max_jobs:
+                audit, password, resume = self._queue.pop(0)
+                if not self._start_job(audit, password=password,
+                                       resume=resume):
+                    # Nothing else would ever start it
+                    self._fail_audit(audit.uuid)
+
+    def _fail_audit(self, audit_uuid):
+        with session_scope() as s:
+            s.query(Audit).filter(
+                (Audit.uuid == audit_uuid)
+            ).one().state = AuditState.FAILED
+
+    def restore_interrupted_audits(self):
+        """Resume audits which were running when the application exited
+
+        Audits which can't be resumed are marked as failed. Failed audits
+        which could not send their notifications are resumed as well, so
+        only the notifications are repeated."""
+        with session_scope(expire_on_commit=False) as s:
+            audits = s.query(Audit).filter(
+                (Audit.state.in_(map(int, RUNNING_STATES)))
+            ).order_by(Audit.start.desc()).all()
+            audits += [a for a in s.query(Audit).filter(
+                (Audit.state == AuditState.FAILED)
+            ).all() if notifications_pending(a.uuid)]
+            audits = [self._prepare_audit(a) for a in audits]
+            # Unscheduled audits which were still queued
+            queued = s.query(Audit).filter(
+                (Audit.state == AuditState.SCHEDULED) & (Audit.start == None)  # noqa
+            ).all()
+            for audit in queued:
+                log.error("Audit with ID %s was queued and has been"
+                          " dropped" % audit.uuid)
+                audit.state = AuditState.FAILED
+        for audit in audits:
+            if can_resume(audit.uuid):
+                if not audit.password:
+                    log.warning("The password of audit with ID %s was not"
+                                " stored; users can't be notified" %
+                                audit.uuid)
+                with self._jobs_lock:
+                    self._queue.append((audit, None, True))
+            else:
+                log.error("Audit with ID %s was interrupted and can't be"
+                          " resumed" % audit.uuid)
+                self._fail_audit(audit.uuid)
+                remove_work_dir(audit.uuid)
+        self._start_queued()
 
     def clean_up(self):
         """Clean up when application exits: terminate threads, etc."""
-        if self._job:
-            log.info("Shutting down, waiting for job to finish...")
-            self._job_lock.acquire()
+        with self._jobs_lock:
+            self._stopping = True
+            jobs = list(self._jobs.values())
+            queue, self._queue = self._queue, []
+        for audit, _, resume in queue:
+            # Resumed audits can be resumed on the next start again
+            if not resume:
+                log.error("Dropping queued audit with ID %s" % audit.uuid)
+                self._fail_audit(audit.uuid)
+        if jobs:
+            log.info("Shutting down, suspending %d job(s)..." % len(jobs))
+            for job in jobs:
+                job.suspend()
+            for job in jobs:
+                job.wait_until_finished()
         self._cron_thread_running = False
         sleep(1)  # wait for db to shut down
 
@@ -130,6 +257,11 @@ class Backend(object):
         else:
             values['start'] = None
         values['end'] = None
+        values['max_duration'] = int(values.get('max_duration') or 0) or None
+        values['sample_size'] = int(values.get('sample_size') or 0) or None
+        for k in ['window_start', 'window_end', 'priority_filter',
+                  'child_domains']:
+            values[k] = values.get(k) or None
         values['include_cracked'] = (
             'include_cracked' in values and
             values['include_cracked'] == 'y'
@@ -140,18 +272,18 @@ class Backend(object):
             s.add(audit)
             audit = freeze(audit)
         if password:
-            # Start right away
-            if self._job:
-                with session_scope() as s:
-                    audit = s.query(Audit).filter(
-                        (Audit.uuid == audit_uuid)
-                    ).one()
-                    audit.state = AuditState.FAILED
-                raise RuntimeError(
-                    "Cracker is already running, can't start job for"
-                    " unscheduled audit with ID %s" % audit_uuid
-                )
-            self._start_job(audit, password=password)
+            # Start right away or as soon as another audit has finished
+            with self._jobs_lock:
+                if len(self._queue) >= MAX_QUEUED:
+                    self._fail_audit(audit_uuid)
+                    raise RuntimeError(
+                        "Too many audits are queued, can't start job for"
+                        " unscheduled audit with ID %s" % audit_uuid
+                    )
+                if len(self._jobs) >= self.max_jobs:
+                    log.info("Queuing audit with ID %s" % audit_uuid)
+                self._queue.append((audit, password, False))
+                self._start_queued()
         return audit_uuid
 
     def delete_audit(self, audit_uuid):
@@ -159,6 +291,13 @@ class Backend(object):
             s.query(Audit).filter(
                 (Audit.uuid == audit_uuid)
             ).delete()
+        # Failed audits keep their data if the notifications are pending
+        with self._jobs_lock:
+            active = audit_uuid in self._jobs or any(
+                audit.uuid == audit_uuid for audit, _, _ in self._queue
+            )
+        if not active:
+            remove_work_dir(audit_uuid)
 
     def update_audit_state(self, audit):
         with session_scope(expire_on_commit=False) as s:
@@ -169,23 +308,29 @@ class Backend(object):
             db_audit.start = audit.start
             db_audit.end = audit.end
 
-    def _start_job(self, audit, password=None):
+    def _start_job(self, audit, password=None, resume=False):
+        """Return True if the job has been started"""
         errs = self.config.get_errors()
         if sum(errs.values()):
             log.error("Can't start job for audit with ID %s "
                       "because of errors: %s" % (audit.uuid, str(errs)))
-            return
+            return False
         log.info("Starting job for audit with ID %s" % audit.uuid)
-        self._job = Job(
+        job = Job(
             audit,
-            self._job_lock,
+            Lock(),
             self.config['cracker'],
             self.config['email'],
             cb_update=self.update_audit_state,
             cb_cleanup=self.clean_up_after_job,
             password=password,
+            resume=resume,
+            crack_lock=self._get_crack_lock(),
         )
-        self._job.start()
+        with self._jobs_lock:
+            self._jobs[audit.uuid] = job
+        job.start()
+        return True
 
     def check_scheduled_audits(self):
         self._cron_thread_running = True
@@ -193,11 +338,15 @@ class Backend(object):
             sleep(1)
             try:
                 audits = self.get_scheduled_audits()
-                if not audits or self._job:
-                    continue
-                audit = audits[0]
-                if audit.start < dt.now():
-                    self._start_job(audit)
+                with self._jobs_lock:
+                    # Queued audits have no start date
+                    for audit in audits:
+                        if len(self._jobs) >= self.max_jobs \
+                                or self._stopping:
+                            break
+                        if audit.start and audit.start < dt.now() \
+                                and audit.uuid not in self._jobs:
+                            self._start_job(audit)
             except Exception as e:
                 log.error(str(e))
                 log.exception(e)
@@ -222,6 +371,101 @@ class Backend(object):
         with session_scope() as s:
             config = s.query(Config).one()
             config.config_json = self.config.to_json()
+        if section == 'cracker':
+            self.probe_engine()
+
+    def probe_engine(self):
+        """Probe the configured cracker and count the lines of its wordlists
+        in the background, so its capabilities are known before the first
+        audit"""
+        config = self.config['cracker']
+        if not config or not config.get('binary_path'):
+            return
+        Thread(
+            target=self._probe_engine,
+            args=(config,),
+            daemon=True,
+        ).start()
+
+    def _probe_engine(self, config):
+        engine, binary_path = config['cracker'], config['binary_path']
+        try:
+            get_engine_info(engine, binary_path)
+        except Exception as e:
+            log.error("Could not probe %s at %s: %s"
+                      % (engine, binary_path, e))
+        try:
+            count_files(self._plan_files(config))
+        except Exception as e:
+            log.error("Could not count the lines of the wordlists: %s" % e)
+
+    def _plan_files(self, config):
+        return plan_files(parse_attack_plan(
+            config.get('attack_plan'),
+            config.get('wordlist_path'),
+            config.get('rule_path'),
+            config.get('cracker'),
+        ))
+
+    def get_engine_info(self):
+        """Return the capabilities of the configured cracker if it has been
+        probed already"""
+        config = self.config['cracker']
+        if not config or not config.get('binary_path'):
+            return None
+        try:
+            return get_engine_info(
+                config['cracker'],
+                config['binary_path'],
+                probe=False,
+            )
+        except Exception:
+            return None
+
+    def estimate_audit(self, domain, frequency=None, max_duration=None):
+        """Estimate how long cracking the hashes of a domain will take
+
+        The number of hashes is taken from the last audit of the domain.
+        Warn if the audit would not finish before its next run or within its
+        time budget."""
+        engine = self.get_engine_info()
+        speed = engine.speed if engine else None
+        with session_scope(expire_on_commit=False) as s:
+            audit = s.query(Audit).filter(
+                (Audit.domain == domain)
+                & (Audit.state == int(AuditState.FINISHED))
+            ).order_by(Audit.end.desc()).first()
+            report = freeze(audit.report) if audit and audit.report \
+                else None
+        config = self.config['cracker'] or {}
+        try:
+            result = estimate(config, speed,
+                              get_line_counts(self._plan_files(config)),
+                              report)
+        except NotCounted:
+            # Counting large wordlists would block the request
+            return dict(
+                candidates=None,
+                warning="The wordlists have not been counted yet",
+            )
+        result['warning'] = None
+        if result['duration'] is None:
+            result['warning'] = "The cracker has not been benchmarked yet"
+            return result
+        duration = timedelta(seconds=result['duration'])
+        result['duration_text'] = format_timedelta(duration, format='short')
+        result['speed_text'] = format_speed(speed)
+        try:
+            interval = INTERVALS.get(AuditFrequency(int(frequency)))
+        except (TypeError, ValueError):
+            interval = None
+        if interval and duration > interval:
+            result['warning'] = "The audit would still be running when it" \
+                " is due again"
+        elif max_duration and duration > timedelta(hours=int(max_duration)):
+            result['warning'] = "Cracking will be stopped before all" \
+                " candidates have been tried"
+        return result
 
     def get_event_count(self):
         with session_scope(expire_on_commit=False) as s:
@@ -315,7 +559,8 @@ class Backend(object):
         )
 
     def _get_idle_status_tiles(self):
-        next_audit = self.get_scheduled_audits()
+        # Queued audits have no start date
+        next_audit = [a for a in self.get_scheduled_audits() if a.start]
         if next_audit:
             next_audit = next_audit[-1]
             next_audit = next_audit.start - dt.now()
@@ -335,8 +580,7 @@ class Backend(object):
         ]
         return tiles
 
-    def _get_busy_status_tiles(self):
-        j = self._job
+    def _get_busy_status_tiles(self, j):
         tiles = [
             dict(
                 title="Running",
@@ -348,7 +592,12 @@ class Backend(object):
                 subtitle="Stage",
             ),
         ]
-        if j.audit.state == AuditState.CRACKING and j.cracker:
+        if j.waiting:
+            tiles.append(dict(
+                title="Waiting",
+                subtitle="Another audit is cracking",
+            ))
+        elif j.audit.state == AuditState.CRACKING and j.cracker:
             status = j.cracker.get_status()
             if isinstance(status, str):
                 tiles += [
@@ -367,15 +616,7 @@ class Backend(object):
                     ),
                 ]
                 return tiles
-            speed = status['speed']
-            if speed > 10**9:
-                speed = "%.01fG" % (speed/10**9)
-            elif speed > 10**6:
-                speed = "%.01fM" % (speed/10**6)
-            elif speed > 10**3:
-                speed = "%.01fK" % (speed/10**3)
-            else:
-                speed = str(speed)
+            speed = format_speed(status['speed'])
             started = dt.now() - j.audit.start
             started = format_timedelta(started, format='short')
             eta = status['ETA'] - dt.now()
@@ -403,29 +644,62 @@ class Backend(object):
                     subtitle="ETA",
                 ),
             ]
+            if status.get('stages', 1) > 1:
+                tiles.append(dict(
+                    title='%d/%d' % (status['stage'], status['stages']),
+                    subtitle="Attack stage",
+                ))
+            tiles.append(dict(
+                title=j.get_cracked_accounts(),
+                subtitle="Cracked accounts",
+            ))
         return tiles
 
+    def get_status_history(self, audit_uuid):
+        """Return the status samples of the cracker if the audit is
+        running"""
+        j = self._jobs.get(audit_uuid)
+        if j and j.cracker:
+            return list(j.cracker.status_history)
+        return []
+
     def get_status(self):
-        try:
-            if not self._job or self._job.audit.state in FINISHED_STATES:
-                tiles = self._get_idle_status_tiles()
-            else:
-                tiles = self._get_busy_status_tiles()
-        except Exception as e:
-            log.exception(e)
-            tiles += [
-                dict(
-                    title="Error",
-                    subtitle="Could not determine current status",
-                    color='danger',
-                ),
-            ]
-        current = dict(
-            title="Current",
-            tiles=tiles,
-        )
+        with self._jobs_lock:
+            jobs = [j for j in self._jobs.values()
+                    if j.audit.state not in FINISHED_STATES]
+            queued = len(self._queue)
+        result = []
+        # One section per running audit
+        for j in jobs or [None]:
+            tiles = []
+            try:
+                if j:
+                    tiles = self._get_busy_status_tiles(j)
+                else:
+                    tiles = self._get_idle_status_tiles()
+            except Exception as e:
+                log.exception(e)
+                tiles += [
+                    dict(
+                        title="Error",
+                        subtitle="Could not determine current status",
+                        color='danger',
+                    ),
+                ]
+            title = "Current"
+            if len(jobs) > 1:
+                title = "Current: %s" % j.audit.domain
+            result.append(dict(
+                title=title,
+                tiles=tiles,
+            ))
+        if queued:
+            result[-1]['tiles'].append(dict(
+                title=queued,
+                subtitle="Queued audits",
+            ))
         last_audit = self._get_last_audit_stats()
 
         if last_audit:
-            return [current, last_audit]
-        return [current]
+            result.append(last_audit)
+        return result
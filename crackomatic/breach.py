@@ -0,0 +1,110 @@
+"""Check NT hashes against a corpus of breached passwords
+
+The corpus is expected in the format of the NTLM version of Pwned Passwords
+"ordered by hash", i.e. lines of the form ``HASH:COUNT`` sorted by hash. It
+is converted once into a binary index of fixed-size records, which is
+memory-mapped and binary-searched, so it never needs to fit into memory and
+no network access is required.
+"""
+
+from logging import getLogger
+import mmap
+import os
+import struct
+
+from .hashes import is_hash
+
+log = getLogger(__name__)
+
+# The raw NT hash followed by the number of times it has been seen
+RECORD = struct.Struct('>16sI')
+MAX_COUNT = 2**32 - 1
+
+
+def build_index(corpus_path, index_path):
+    """Convert a corpus in text format into a binary index
+
+    Return the number of records."""
+    count = 0
+    previous = b''
+    tmp_path = index_path + '.tmp'
+    with open(corpus_path, 'r') as src, open(tmp_path, 'wb') as dst:
+        for line in src:
+            nt, _, prevalence = line.strip().partition(':')
+            if not nt:
+                continue
+            digest = bytes.fromhex(nt)
+            if digest <= previous:
+                raise ValueError("The corpus is not ordered by hash"
+                                 " (line %d)" % (count + 1))
+            dst.write(RECORD.pack(
+                digest,
+                min(int(prevalence or 1), MAX_COUNT),
+            ))
+            previous = digest
+            count += 1
+    os.replace(tmp_path, index_path)
+    log.info("Wrote %d records to %s" % (count, index_path))
+    return count
+
+
+class BreachIndex(object):
+    """A memory-mapped binary index of breached NT hashes"""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size % RECORD.size:
+            self._file.close()
+            raise ValueError("%s is not a breach index" % path)
+        self._count = size // RECORD.size
+        self._mmap = None
+        if size:
+            self._mmap = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self._count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._mmap:
+            self._mmap.close()
+        self._file.close()
+
+    def _digest_at(self, i):
+        offset = i * RECORD.size
+        return self._mmap[offset:offset + 16]
+
+    def lookup(self, nt_hashes):
+        """Return a dictionary mapping those NT hashes which appear in the
+        corpus to their prevalence
+
+        Placeholders of missing hashes are skipped."""
+        result = {}
+        if not self._count:
+            return result
+        low = 0
+        # Each hash can't be found before the previous one if they are
+        # sorted, which narrows down the search
+        for nt in sorted(set(h.lower() for h in nt_hashes if is_hash(h))):
+            digest = bytes.fromhex(nt)
+            high = self._count
+            while low < high:
+                middle = (low + high) // 2
+                if self._digest_at(middle) < digest:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low == self._count:
+                break
+            if self._digest_at(low) == digest:
+                result[nt] = RECORD.unpack_from(
+                    self._mmap, low * RECORD.size
+                )[1]
+        return result
@@ -0,0 +1,78 @@
+from logging import getLogger
+
+from .crypto import encrypt, decrypt, fingerprint
+from .models import session_scope, CrackedHash, ResistedHash
+
+log = getLogger(__name__)
+
+# SQLite only allows a limited number of parameters per query
+_CHUNK_SIZE = 500
+
+
+def _query_fingerprints(s, fingerprints, model=CrackedHash, *criteria):
+    fingerprints = list(fingerprints)
+    for i in range(0, len(fingerprints), _CHUNK_SIZE):
+        yield from s.query(model).filter(
+            model.fingerprint.in_(fingerprints[i:i+_CHUNK_SIZE]),
+            *criteria
+        )
+
+
+def lookup_cracked(nt_hashes):
+    """Return a dictionary mapping previously cracked NT hashes to their
+    passwords"""
+    fingerprints = {fingerprint(h): h for h in nt_hashes}
+    result = {}
+    with session_scope() as s:
+        for entry in _query_fingerprints(s, fingerprints):
+            password = decrypt(entry.password.encode()).decode()
+            result[fingerprints[entry.fingerprint]] = password
+    log.debug("Found %d of %d hashes in the cache"
+              % (len(result), len(fingerprints)))
+    return result
+
+
+def store_cracked(passwords):
+    """Remember a dictionary mapping NT hashes to passwords"""
+    fingerprints = {fingerprint(h): p for h, p in passwords.items()}
+    with session_scope() as s:
+        known = set(e.fingerprint
+                    for e in _query_fingerprints(s, fingerprints))
+        for fp, password in fingerprints.items():
+            if fp in known:
+                continue
+            s.add(CrackedHash(
+                fingerprint=fp,
+                password=encrypt(password.encode()).decode(),
+            ))
+    log.debug("Stored %d new hashes in the cache"
+              % (len(fingerprints) - len(known)))
+
+
+def lookup_resisted(nt_hashes, plan):
+    """Return the set of NT hashes which have resisted the attack plan with
+    the given fingerprint before"""
+    fingerprints = {fingerprint(h): h for h in nt_hashes}
+    with session_scope() as s:
+        result = set(
+            fingerprints[e.fingerprint] for e in _query_fingerprints(
+                s, fingerprints, ResistedHash, ResistedHash.plan == plan,
+            )
+        )
+    log.debug("%d of %d hashes resisted the attack plan before"
+              % (len(result), len(fingerprints)))
+    return result
+
+
+def store_resisted(nt_hashes, plan):
+    """Remember that NT hashes resisted the attack plan with the given
+    fingerprint"""
+    fingerprints = set(fingerprint(h) for h in nt_hashes)
+    with session_scope() as s:
+        known = set(e.fingerprint for e in _query_fingerprints(
+            s, fingerprints, ResistedHash, ResistedHash.plan == plan,
+        ))
+        for fp in fingerprints - known:
+            s.add(ResistedHash(fingerprint=fp, plan=plan))
+    log.debug("Stored %d new hashes which resisted the attack plan"
+              % len(fingerprints - known))
@@ -0,0 +1,96 @@
+"""Encrypted checkpoints of the stages of an audit
+
+Each stage of a job saves its results in the working directory of the
+audit: the replicated hashes, the cracked passwords and the report. An
+audit which is interrupted resumes after the last completed stage, so a
+restart during the e-mail stage does not cost the replication and the
+cracking again. Hashes and passwords are as good as the real thing, so the
+files are encrypted with the secret key in the data directory.
+
+Large files are written as a sequence of tokens, one per line, each holding
+a chunk of the data. This way they can be written and read while the data
+is being streamed.
+"""
+
+import json
+from logging import getLogger
+import os
+
+from .crypto import encrypt, decrypt
+
+log = getLogger(__name__)
+
+# Bytes of plain text per token
+CHUNK_SIZE = 2**20
+
+
+class Writer(object):
+    """Write text to an encrypted file
+
+    The file only appears under its name once it is complete, so an
+    interrupted write is not mistaken for a checkpoint."""
+
+    def __init__(self, path):
+        self.path = path
+        self._tmp_path = path + '.tmp'
+        fd = os.open(self._tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                     0o600)
+        self._file = os.fdopen(fd, 'wb')
+        self._buffer = []
+        self._size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type:
+            self._file.close()
+            os.remove(self._tmp_path)
+        else:
+            self.close()
+
+    def write(self, text):
+        data = text.encode()
+        self._buffer.append(data)
+        self._size += len(data)
+        if self._size >= CHUNK_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            self._file.write(encrypt(b''.join(self._buffer)) + b'\n')
+        self._buffer = []
+        self._size = 0
+
+    def close(self):
+        self._flush()
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+
+def read_lines(path):
+    """Generate the lines of a file written by `Writer`"""
+    with open(path, 'rb') as f:
+        for token in f:
+            token = token.strip()
+            if not token:
+                continue
+            # Not splitlines(), which also splits at other characters
+            lines = decrypt(token).decode().split('\n')
+            if not lines[-1]:
+                lines.pop()
+            yield from lines
+
+
+def save(path, data):
+    """Save data which can be serialized as JSON"""
+    with Writer(path) as f:
+        f.write(json.dumps(data))
+    log.debug("Saved checkpoint %s" % path)
+
+
+def load(path):
+    """Return the data saved with `save` or None if there is none"""
+    if not os.path.exists(path):
+        return None
+    return json.loads('\n'.join(read_lines(path)))
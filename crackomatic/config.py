@@ -3,7 +3,65 @@ import json
 from wtforms import HiddenField
 from flask_wtf import FlaskForm
 import wtforms
-from wtforms.validators import DataRequired
+from wtforms.validators import DataRequired, ValidationError
+
+from .plan import parse_attack_plan
+from .distributed import parse_address
+
+
+def validate_attack_plan(form, field):
+    try:
+        parse_attack_plan(
+            field.data,
+            form.wordlist_path.data,
+            form.rule_path.data,
+            form.cracker.data,
+        )
+    except ValueError as e:
+        raise ValidationError(str(e))
+
+
+def validate_stale_days(form, field):
+    if not field.data:
+        return
+    try:
+        days = int(field.data)
+    except ValueError:
+        raise ValidationError("Not a number")
+    if days < 1:
+        raise ValidationError("Must be positive")
+    if not form.ldap_accounts.data:
+        raise ValidationError("Requires account details from LDAP")
+
+
+def validate_workers(form, field):
+    if not field.data:
+        return
+    try:
+        workers = int(field.data)
+    except ValueError:
+        raise ValidationError("Not a number")
+    if workers < 0:
+        raise ValidationError("Must not be negative")
+    if workers:
+        if not form.worker_key.data:
+            raise ValidationError("Workers require a key")
+        try:
+            parse_address(form.coordinator_address.data)
+        except ValueError:
+            raise ValidationError("Workers require a coordinator address of"
+                                  " the form 'host:port'")
+
+
+def validate_max_jobs(form, field):
+    if not field.data:
+        return
+    try:
+        jobs = int(field.data)
+    except ValueError:
+        raise ValidationError("Not a number")
+    if jobs < 1:
+        raise ValidationError("Must be positive")
 
 
 cracker_fields = [
@@ -51,6 +109,143 @@ cracker_fields = [
             placeholder="/usr/share/hashcat/rules/OneRule.rule",
         ),
     ),
+    wtforms.TextAreaField(
+        "Attack Plan",
+        description=dict(
+            id='attack_plan',
+            help="Optional list of stages in JSON; each stage is one of the"
+                 " attacks 'wordlist', 'rules', 'mask', 'hybrid' or"
+                 " 'combinator' and may be limited by 'max_runtime' in"
+                 " seconds or 'max_candidates' (see the documentation)",
+            placeholder='[{"attack": "wordlist"}, {"attack": "mask", "mask": "?u?l?l?l?l?d?d", "max_runtime": 3600}, {"attack": "rules"}]',  # noqa
+        ),
+        validators=[validate_attack_plan],
+    ),
+    wtforms.BooleanField(
+        "Remember cracked hashes",
+        description=dict(
+            id='use_cache',
+            help="Store recovered passwords encrypted in the database, so"
+                 " recurring audits don't have to crack them again",
+        ),
+    ),
+    wtforms.BooleanField(
+        "Skip hashes that resisted before",
+        description=dict(
+            id='skip_resisted',
+            help="Remember which hashes resisted the whole attack plan, so"
+                 " recurring audits only crack new or changed hashes until"
+                 " the plan or its files change",
+        ),
+    ),
+    wtforms.StringField(
+        "Breach Index Path",
+        description=dict(
+            id='breach_index',
+            help="Optional path to an index of breached NT hashes; accounts"
+                 " using them are reported and notified even if their"
+                 " password was not cracked (see the documentation)",
+            placeholder="/var/lib/crackomatic/pwned-passwords-ntlm.idx",
+        ),
+    ),
+    wtforms.BooleanField(
+        "Organisation wordlist",
+        description=dict(
+            id='targeted_wordlist',
+            help="Before anything else, try a wordlist generated from the"
+                 " company names, departments, cities, names and"
+                 " descriptions in the directory",
+        ),
+    ),
+    wtforms.BooleanField(
+        "Password history",
+        description=dict(
+            id='password_history',
+            help="Also crack the hashes of previous passwords to find"
+                 " accounts which change their password predictably",
+        ),
+    ),
+    wtforms.BooleanField(
+        "Skip machine accounts",
+        description=dict(
+            id='skip_machine_accounts',
+            help="Don't crack computer accounts, whose passwords are random",
+        ),
+    ),
+    wtforms.BooleanField(
+        "Skip trust accounts",
+        description=dict(
+            id='skip_trust_accounts',
+            help="Don't crack interdomain trust accounts and krbtgt, whose"
+                 " passwords are random",
+        ),
+    ),
+    wtforms.BooleanField(
+        "Skip disabled accounts",
+        description=dict(
+            id='skip_disabled_accounts',
+            help="Don't crack accounts which can't be used to log on",
+        ),
+    ),
+    wtforms.BooleanField(
+        "Account details from LDAP",
+        description=dict(
+            id='ldap_accounts',
+            help="Also classify accounts by their userAccountControl and"
+                 " lastLogonTimestamp attributes in the directory",
+        ),
+    ),
+    # See the comment on the SMTP port
+    wtforms.StringField(
+        "Skip stale accounts",
+        description=dict(
+            id='stale_days',
+            help="Optional number of days without a logon after which an"
+                 " account is not cracked (requires account details from"
+                 " LDAP)",
+            placeholder="180",
+        ),
+        validators=[validate_stale_days],
+    ),
+    wtforms.StringField(
+        "Coordinator Address",
+        description=dict(
+            id='coordinator_address',
+            help="Address and port on which to wait for workers",
+            placeholder="0.0.0.0:4567",
+        ),
+    ),
+    wtforms.PasswordField(
+        "Worker Key",
+        description=dict(
+            id='worker_key',
+            help="Shared secret the workers use to authenticate",
+        ),
+    ),
+    # See the comment on the SMTP port
+    wtforms.StringField(
+        "Workers",
+        description=dict(
+            id='workers',
+            help="Number of workers which split the keyspace of each audit"
+                 " among them; leave empty to crack on this machine only (see"
+                 " the documentation)",
+            placeholder="0",
+        ),
+        validators=[validate_workers],
+    ),
+    # See the comment on the SMTP port
+    wtforms.StringField(
+        "Concurrent audits",
+        description=dict(
+            id='max_jobs',
+            help="Number of audits which may run at the same time; only one"
+                 " of them cracks at a time, the others replicate, wait or"
+                 " send e-mails",
+            placeholder="1",
+        ),
+        validators=[validate_max_jobs],
+    ),
 ]
 
 
@@ -21,6 +21,14 @@ class AuditState(IntEnum):
     FINISHED = auto()
 
 
+RUNNING_STATES = [
+    AuditState.REPLICATING,
+    AuditState.CRACKING,
+    AuditState.ANALYZING,
+    AuditState.SENDING_EMAILS,
+]
+
+
 FINISHED_STATES = [
     AuditState.FINISHED,
     AuditState.ABORTED,
@@ -1,25 +1,102 @@
+from collections import deque, namedtuple
 from datetime import datetime as dt, timedelta, date
 import os
-from threading import Thread, Lock
-import time
+from threading import Thread, Lock, Event
 import re
 import signal
 from subprocess import Popen, PIPE, run
 from logging import getLogger
 
+from .estimate import count_lines, mask_keyspace
+from .plan import ATTACKS, default_stage
+
 log = getLogger(__name__)
 
+# The output of a cracker can grow indefinitely, so we only keep a tail of
+# this many lines per stream
+OUTPUT_LINES = 1000
+# Number of parsed status updates to keep
+STATUS_EVENTS = 1000
+# Seconds between two status updates of the cracker
+STATUS_INTERVAL = 10
+# Maximum number of status samples to keep for plotting
+HISTORY_SIZE = 500
+# Seconds between two reads of the potfile
+POTFILE_INTERVAL = 2
+
+StatusSample = namedtuple('StatusSample', 'time devices progress guesses')
+
+
+class TimeSeries(object):
+    """A list of samples with a bounded length
+
+    When the list is full, every other sample is dropped and the minimum
+    interval between samples is doubled, so it covers runs of any length.
+    """
+
+    def __init__(self, size=HISTORY_SIZE, interval=STATUS_INTERVAL/2):
+        self._size = size
+        self._interval = interval
+        self._samples = []
+
+    def __iter__(self):
+        return iter(list(self._samples))
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, sample):
+        if self._samples:
+            delta = sample.time - self._samples[-1].time
+            if delta.total_seconds() < self._interval:
+                return
+        self._samples.append(sample)
+        if len(self._samples) >= self._size:
+            self._samples = self._samples[::2]
+            self._interval *= 2
+
+
+def decode_password(password):
+    """Decode passwords which the crackers have written in hex"""
+    m = re.match(r'^\$HEX(\[([0-9a-fA-F]*)\]|\$([0-9a-fA-F]*))$', password)
+    if m:
+        return bytes.fromhex(m[2] or m[3] or '').decode('utf8', 'replace')
+    return password
+
+
+def parse_potfile_line(line):
+    """Return a tuple of NT hash and password, or None if the line does not
+    contain an NT hash"""
+    nt, sep, password = line.rstrip('\n').partition(':')
+    if nt.startswith('$NT$'):
+        nt = nt[4:]
+    nt = nt.lower()
+    if not sep or not re.match('^[0-9a-f]{32}$', nt):
+        return None
+    return nt, decode_password(password)
+
 
 def get_cracker(engine, *args, **kwargs):
-    engine = {'John': John, 'Hashcat': Hashcat}[engine]
+    engine = ENGINES[engine]
     return engine(*args, **kwargs)
 
 
 class Cracker(Thread):
     password_regex = ''
+    # The signal which makes the process save its session and exit
+    checkpoint_signal = signal.SIGTERM
+    # Extension of the file in which the process saves its session
+    restore_suffix = '.rec'
+
+    supported_attacks = list(ATTACKS)
+    # Whether each core is a part of the keyspace of its own when it is
+    # split across workers
+    part_per_core = False
 
     def __init__(self, hash_file, wordlist, rules, bin_path,
-                 root_dir='/tmp', args=[]):
+                 root_dir='/tmp', args=[], stages=None, restore=False,
+                 partition=None, cb_cracked=None, version=None,
+                 hash_type='nt'):
         log.debug("Initializing cracker")
         self._run_lock = Lock()
         self._run_lock.acquire()
@@ -29,106 +106,474 @@ class Cracker(Thread):
         self._rules = rules
         self._bin_path = bin_path
         self._args = args
+        # All stages share one potfile, so cracked hashes drop out of
+        # subsequent stages
+        self.stages = stages or [default_stage(wordlist, rules)]
+        self.stage = 0
+        self._aborted = False
+        # Set if we should stop and keep what has been cracked so far
+        self._finishing = False
+        # Cleared while paused
+        self._resume = Event()
+        self._resume.set()
+        # Set if the process was interrupted and needs to be restored
+        self._interrupted = False
+        # Set if we should save the session and exit, so a later instance
+        # can restore it
+        self._suspended = False
+        # Restore the session of an earlier instance in the same directory
+        self._restore = restore
+        # Tuple (first, last, total): only attack the parts first to last
+        # of the keyspace split into total parts
+        self._partition = partition
+        # 'nt' or 'lm'
+        self._hash_type = hash_type
 
         self._potfile = os.path.join(root_dir, 'potfile')
+        self._session = os.path.join(root_dir, 'session')
+        self._stage_file = os.path.join(root_dir, 'stage')
 
         self._process = None
 
         self.passwords = {}
-        self.output = {
-            'stdout': '',
-            'stderr': '',
+        # NT hashes cracked so far, read from the potfile while running
+        self.cracked = {}
+        self.cb_cracked = cb_cracked  # cb = callback
+        self._potfile_offset = 0
+        self._potfile_lock = Lock()
+        self._output = {
+            'stdout': deque(maxlen=OUTPUT_LINES),
+            'stderr': deque(maxlen=OUTPUT_LINES),
         }
-        self.version = self._get_version()
+        self._capture_threads = []
+        # Parsed status lines, each with a time stamp and sequence number
+        self.status_events = deque(maxlen=STATUS_EVENTS)
+        self._status_count = 0
+        # Latest status sample as a tuple of time stamp and status
+        self._status_sample = None
+        self.status_history = TimeSeries()
+        self._status_updated = Event()
+        self._stopped = Event()
+        # Running the binary to determine the version takes a moment, so
+        # it can be passed from the engine registry
+        self.version = version or self._get_version()
         self.start()
 
+    def _get_version(self):
+        return self.probe_version(self._bin_path)
+
+    def _get_lm_passwords(self):
+        """Combine the cracked halves of the LM hashes
+
+        Return a dictionary mapping the user names in the hash file to the
+        upper case passwords."""
+        from .lm import parse_potfile, combine
+
+        halves = parse_potfile(self._potfile)
+        result = {}
+        with open(self._hash_file, 'r') as f:
+            for line in f:
+                fields = line.split(':')
+                password = combine(halves, fields[2])
+                if password is not None:
+                    result[fields[0]] = password
+        return result
+
+    @classmethod
+    def probe_version(cls, bin_path):
+        """Run the binary and return its version"""
+        raise NotImplementedError
+
+    @classmethod
+    def probe_devices(cls, bin_path):
+        """Return a list of names of the devices the engine can use"""
+        raise NotImplementedError
+
+    @classmethod
+    def probe_speed(cls, bin_path):
+        """Run a benchmark and return the number of NT hashes per second
+        this machine can compute"""
+        raise NotImplementedError
+
     def abort(self):
-        self._process.terminate()
+        self._aborted = True
+        self._resume.set()
+        if self._process:
+            self._process.terminate()
+
+    def _checkpoint(self):
+        """Make the process save its session and exit"""
+        if self._process and self._process.returncode is None:
+            self._interrupted = True
+            try:
+                # Signal all forked processes as well
+                os.killpg(self._process.pid, self.checkpoint_signal)
+            except ProcessLookupError:
+                pass
 
-    def wait_until_finished(self):
-        self._run_lock.acquire()
-        self._run_lock.release()
+    @property
+    def paused(self):
+        return not self._resume.is_set()
+
+    def pause(self):
+        """Checkpoint the session and wait until `resume` is called"""
+        if not self.paused:
+            log.info("Pausing cracker")
+            self._resume.clear()
+            self._checkpoint()
+
+    def resume(self):
+        if self.paused:
+            log.info("Resuming cracker")
+            self._resume.set()
+
+    def stop(self):
+        """Stop cracking and keep the passwords cracked so far"""
+        log.info("Stopping cracker")
+        self._finishing = True
+        self._checkpoint()
+        self._resume.set()
+
+    def suspend(self):
+        """Save the session and exit without collecting the results
+
+        A new instance with the same root directory can pick up where this
+        one left off if it is created with `restore=True`."""
+        log.info("Suspending cracker")
+        self._suspended = True
+        self._checkpoint()
+        self._resume.set()
+
+    def wait_until_finished(self, timeout=-1):
+        """Return True if the cracker finished within the timeout"""
+        if self._run_lock.acquire(timeout=timeout):
+            self._run_lock.release()
+            return True
+        return False
 
     def get_status(self):
-        # Return None if process has not yet started or already finished
-        if not self._process:
+        """Return the latest status sample
+
+        The sample is a dictionary which includes its age in seconds. If
+        there is no sample, a string describing the state is returned."""
+        if self.paused:
+            return "Paused"
+        elif not self._process:
             return "Process hasn't started"
         elif self._process.returncode is not None:
             return "Process finished"
-        return self._get_status()
+        sample = self._status_sample
+        if not sample:
+            return "Waiting for status"
+        timestamp, status = sample
+        return dict(
+            status,
+            age=(dt.now() - timestamp).total_seconds(),
+            stage=self.stage + 1,
+            stages=len(self.stages),
+        )
+
+    def _request_status(self):
+        """Ask the process to print its status right away"""
+        pass
+
+    def _sample_status(self):
+        """Collect the status in the background whenever the process
+        reports it, so `get_status` never blocks"""
+        try:
+            if not self._stopped.wait(1):
+                self._request_status()
+        except Exception as e:
+            log.error("Could not request cracker status: %s" % e)
+        while not self._stopped.is_set():
+            self._status_updated.wait(STATUS_INTERVAL)
+            self._status_updated.clear()
+            try:
+                status = self._get_status()
+                if status:
+                    timestamp = self.status_events[-1]['time']
+                    self._status_sample = (timestamp, status)
+                    self.status_history.add(StatusSample(
+                        timestamp,
+                        tuple(status.get('devices', [status['speed']])),
+                        status['progress'],
+                        status['guesses'],
+                    ))
+            except Exception as e:
+                log.error("Could not determine cracker status: %s" % e)
+
+    def _read_potfile(self):
+        """Read what has been appended to the potfile since the last call and
+        pass newly cracked hashes on to the callback"""
+        with self._potfile_lock:
+            try:
+                with open(self._potfile, 'rb') as f:
+                    f.seek(self._potfile_offset)
+                    data = f.read()
+            except OSError:
+                return
+            # The last line may not be complete yet
+            data = data[:data.rfind(b'\n') + 1]
+            self._potfile_offset += len(data)
+            new = {}
+            for line in data.decode('utf8', 'replace').splitlines():
+                entry = parse_potfile_line(line)
+                if entry and entry[0] not in self.cracked:
+                    new[entry[0]] = entry[1]
+            self.cracked.update(new)
+        if new and self.cb_cracked:
+            try:
+                self.cb_cracked(new)
+            except Exception as e:
+                log.error("Could not process cracked hashes: %s" % e)
+                log.exception(e)
+
+    def _tail_potfile(self):
+        while not self._stopped.wait(POTFILE_INTERVAL):
+            self._read_potfile()
+
+    @property
+    def output(self):
+        """Return the tail of stdout and stderr"""
+        return {k: ''.join(v) for k, v in self._output.items()}
+
+    def _add_status_event(self, status):
+        self._status_count += 1
+        status.update(time=dt.now(), seq=self._status_count)
+        self.status_events.append(status)
+        self._status_updated.set()
+
+    def _parse_status(self, line, buffer):
+        """Return a dictionary if the line contains a status update"""
+        return None
 
     def _capture(self, stream, buffer):
-        while self._process.returncode is None:
-            data = stream.readline()
-            if not re.match(self.password_regex, data):
-                self.output[buffer] += data
+        for data in iter(stream.readline, ''):
+            if re.match(self.password_regex, data):
+                data = "*** SENSITIVE DATA REMOVED ***\n"
             else:
-                self.output[buffer] += "*** SENSITIVE DATA REMOVED ***\n"
+                try:
+                    status = self._parse_status(data, buffer)
+                except Exception as e:
+                    log.error("Could not parse status line: %s" % e)
+                    status = None
+                if status:
+                    self._add_status_event(status)
+            self._output[buffer].append(data)
 
     def _start_capture_threads(self):
-        t_stdout = Thread(
-            target=self._capture,
-            args=(self._process.stdout, 'stdout')
-        )
-        t_stdout.start()
-        t_stderr = Thread(
-            target=self._capture,
-            args=(self._process.stderr, 'stderr')
+        for buffer in ['stdout', 'stderr']:
+            t = Thread(
+                target=self._capture,
+                args=(getattr(self._process, buffer), buffer)
+            )
+            t.start()
+            self._capture_threads.append(t)
+
+    def _run_process(self, cmd):
+        # Don't start while paused
+        self._resume.wait()
+        if self._aborted or self._finishing or self._suspended:
+            return None
+        log.debug("Running command: " + " ".join(cmd))
+        self.status_events.clear()
+        self._process = Popen(
+            cmd,
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=PIPE,
+            encoding='utf8',
+            preexec_fn=lambda: os.nice(19),
+            # Put the process in its own process group, so signals reach
+            # all forked processes
+            start_new_session=True,
         )
-        t_stderr.start()
+        self._start_capture_threads()
+        self._process.wait()
+        for t in self._capture_threads:
+            t.join()
+        self._capture_threads = []
+        return self._process.returncode
+
+    def _load_stage(self):
+        """Return the index of the stage an earlier instance was in"""
+        try:
+            with open(self._stage_file, 'r') as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    def _save_stage(self):
+        with open(self._stage_file, 'w') as f:
+            f.write(str(self.stage))
 
     def run(self):
         try:
-            cmd = self.command_line()
-            log.debug("Running command: " + " ".join(cmd))
-            self._process = Popen(
-                cmd,
-                stdin=PIPE,
-                stdout=PIPE,
-                stderr=PIPE,
-                encoding='utf8',
-                preexec_fn=lambda: os.nice(19),
-            )
-
-            self._start_capture_threads()
-            self._process.wait()
-            self.returncode = self._process.returncode
-            if not self.returncode == self.expected_returncode:
-                log.error("Process failed with return code %d: %s" %
-                          (self._process.returncode,
-                           self.output['stderr'] or self.output['stdout']))
-                self.passwords = None
+            Thread(target=self._sample_status, daemon=True).start()
+            Thread(target=self._tail_potfile, daemon=True).start()
+            first_stage = self._load_stage() if self._restore else 0
+            for i, stage in enumerate(self.stages):
+                if i < first_stage:
+                    continue
+                self.stage = i
+                self._save_stage()
+                log.info("Running stage %d of %d: %s" % (
+                    i + 1, len(self.stages), stage.get('name', stage['attack'])
+                ))
+                if self._restore and \
+                        os.path.exists(self._session + self.restore_suffix):
+                    log.info("Restoring session")
+                    cmd = self.restore_command_line()
+                else:
+                    cmd = self.command_line(stage)
+                self._restore = False
+                if cmd is None:
+                    log.info("Nothing to do in this part of the keyspace")
+                    continue
+                while True:
+                    self.returncode = self._run_process(cmd)
+                    if not self._interrupted or self._finishing \
+                            or self._aborted or self._suspended:
+                        break
+                    # Paused; continue where we left off
+                    self._interrupted = False
+                    cmd = self.restore_command_line()
+                if self._aborted or self._suspended:
+                    self.passwords = None
+                    return
+                if self._finishing:
+                    log.info("Skipping remaining stages")
+                    break
+                if self.returncode not in self.expected_returncodes:
+                    log.error("Process failed with return code %d: %s" %
+                              (self.returncode,
+                               self.output['stderr'] or self.output['stdout']))
+                    self.passwords = None
+                    return
+                log.debug("Process exited with return code %d: %s" %
+                          (self.returncode, self.output['stdout']))
+            self._stopped.set()
+            self._status_updated.set()
+            self._read_potfile()
+            if self._hash_type == 'lm':
+                self.passwords = self._get_lm_passwords()
             else:
-                log.debug("Process exited with return code 0: %s" %
-                          self.output['stdout'])
                 self.passwords = self._get_passwords()
+        except Exception as e:
+            # Nothing cracked is not the same as nothing crackable
+            log.error("Cracking failed: %s" % e)
+            log.exception(e)
+            self.passwords = None
         finally:
             try:
-                os.remove(self._potfile)
+                # The potfile is needed to restore the session
+                if not self._suspended:
+                    os.remove(self._potfile)
             except OSError:
                 pass
             finally:
+                self._stopped.set()
                 self._run_lock.release()
 
 
 class Hashcat(Cracker):
     password_regex = '^[a-f0-9]{32}:.*$'
-    expected_returncode = 1
-    # 1 means 'exhausted', which is fine for a wordlist attack
-
-    def command_line(self):
-        return [
+    # 0 means 'cracked', 1 means 'exhausted' and 4 means 'aborted by
+    # runtime', which are all fine
+    expected_returncodes = [0, 1, 4]
+    # Hashcat saves its session when it receives SIGINT
+    checkpoint_signal = signal.SIGINT
+    restore_suffix = '.restore'
+    hash_modes = {'nt': '1000', 'lm': '3000'}
+
+    def _attack_args(self, stage):
+        attack = stage['attack']
+        if attack == 'wordlist':
+            return ['-a', '0', stage['wordlist']]
+        elif attack == 'rules':
+            return ['-a', '0', '--rules-file', stage['rules'],
+                    stage['wordlist']]
+        elif attack == 'mask' and 'charset1' in stage:
+            return ['-a', '3', '-1', stage['charset1'], stage['mask']]
+        elif attack == 'mask':
+            return ['-a', '3', stage['mask']]
+        elif attack == 'hybrid':
+            return ['-a', '6', stage['wordlist'], stage['mask']]
+        elif attack == 'combinator':
+            return ['-a', '1', stage['wordlist'], stage['wordlist2']]
+
+    def _get_keyspace(self, stage):
+        output = run(
+            [self._bin_path, '-m', self.hash_modes[self._hash_type],
+             '--keyspace']
+            + self._attack_args(stage),
+            stdout=PIPE,
+            encoding='utf8',
+        )
+        return int(output.stdout.split()[-1])
+
+    def _amplifier(self, stage):
+        """Return the number of candidates per unit of the keyspace
+        reported by --keyspace, which --skip and --limit count in"""
+        attack = stage['attack']
+        if attack == 'rules':
+            return max(count_lines(stage['rules'], rules=True), 1)
+        elif attack == 'hybrid':
+            return mask_keyspace(stage['mask'])
+        elif attack == 'combinator':
+            return max(count_lines(stage['wordlist2']), 1)
+        elif attack == 'mask':
+            # Hashcat splits the mask into a base and an amplifier itself
+            keyspace = mask_keyspace(stage['mask'], stage.get('charset1'))
+            return max(keyspace // max(self._get_keyspace(stage), 1), 1)
+        return 1
+
+    def command_line(self, stage):
+        cmd = [
             self._bin_path,
-            self._hash_file,
-            '-m', '1000',
-            '-a', '0',
+            stage.get('hash_file', self._hash_file),
+            '-m', self.hash_modes[self._hash_type],
             '--outfile-autohex-disable',
             '--status',
+            '--status-timer=%d' % STATUS_INTERVAL,
             '--machine-readable',
             '--potfile-path', self._potfile,
-            '--rules-file', self._rules,
-            self._wordlist,
-            *self._args,
+            '--session', 'crackomatic',
+            '--restore-file-path', self._session + self.restore_suffix,
+        ] + self._attack_args(stage)
+        if stage.get('increment'):
+            cmd.append('--increment')
+        if 'max_runtime' in stage:
+            cmd.append('--runtime=%d' % stage['max_runtime'])
+        limit = stage.get('max_candidates')
+        if limit:
+            # max_candidates counts candidates like John does, --limit the
+            # units of the keyspace
+            limit = -(-limit // self._amplifier(stage))
+        if self._partition:
+            # Both --skip and --limit refer to the keyspace as reported by
+            # --keyspace, which is what the partitions are based on
+            first, last, total = self._partition
+            keyspace = self._get_keyspace(stage)
+            skip = keyspace * (first - 1) // total
+            part = keyspace * last // total - skip
+            if not part:
+                return None
+            if limit:
+                limit = min(part, -(-limit * (last - first + 1) // total))
+            else:
+                limit = part
+            cmd.append('--skip=%d' % skip)
+        if limit:
+            cmd.append('--limit=%d' % limit)
+        return cmd + self._args
+
+    def restore_command_line(self):
+        return [
+            self._bin_path,
+            '--session', 'crackomatic',
+            '--restore',
+            '--restore-file-path', self._session + self.restore_suffix,
         ]
 
     def _get_passwords(self):
@@ -151,41 +596,83 @@ class Hashcat(Cracker):
                 break
         return result
 
-    def _get_version(self):
+    @classmethod
+    def probe_version(cls, bin_path):
+        output = run(
+            [bin_path, '--version'],
+            stdout=PIPE,
+            encoding='utf8',
+        )
+        return output.stdout.strip()
+
+    @classmethod
+    def probe_devices(cls, bin_path):
         output = run(
-            [self._bin_path],
+            [bin_path, '-I'],
             stdout=PIPE,
             encoding='utf8',
         )
-        return output.stdout
+        return re.findall(r'^\s*Name\.*: (.*)$', output.stdout, re.M)
+
+    @classmethod
+    def probe_speed(cls, bin_path):
+        # With --machine-readable, each device prints a line like
+        # 1:1000:768:32:1.23:12345678.90 ending in hashes per second
+        output = run(
+            [bin_path, '-b', '-m', '1000', '--machine-readable'],
+            stdout=PIPE,
+            encoding='utf8',
+        )
+        return sum(
+            float(line.split(':')[-1])
+            for line in output.stdout.splitlines()
+            if re.match('^[0-9]+:1000:', line)
+        )
+
+    def _parse_status(self, line, buffer):
+        # With --machine-readable, the status is printed periodically as a
+        # record of keys followed by their values, e.g.:
+        # STATUS 3 SPEED 1234 1000 5678 1000 EXEC_RUNTIME 1.2 3.4 ...
+        # Some keys have a value for each device.
+        if not line.startswith('STATUS'):
+            return None
+        record = {}
+        key = None
+        for token in line.split():
+            if re.match('^[A-Z_]+$', token):
+                key = token
+                record[key] = []
+            elif key:
+                record[key].append(token)
+
+        # Each device reports the number of hashes computed in a given
+        # number of milliseconds
+        devices = [
+            int(h) * 1000 / int(ms) if int(ms) else 0
+            for h, ms in zip(record['SPEED'][::2], record['SPEED'][1::2])
+        ]
+        speed = sum(devices)
+        if not speed:
+            # Still initializing
+            return None
+        done, total = map(int, record['PROGRESS'][:2])
+        recovered, hash_count = map(int, record['RECHASH'][:2])
+        return {
+            'state': int(record['STATUS'][0]),
+            'guesses': recovered,
+            'hashes': hash_count,
+            'ETA': dt.now() + timedelta(seconds=(total - done)/speed),
+            'progress': 100 * done / total if total else 0,
+            'speed': speed,
+            'devices': devices,
+        }
 
     def _get_status(self):
-        # Status is printed periodically
-        for line in reversed(self.output['stdout'].splitlines()):
-            m = re.match(
-                r'.*SPEED\s+(?P<speed>([0-9]+\s+)+)[A-Z_].*'
-                r'PROGRESS\s+(?P<progress>[0-9]+)\s+(?P<remaining>[0-9]+)\s.*'
-                r'RECHASH\s+(?P<rechash>[0-9]+)\s.*',
-                line,
-            )
-            if m:
-                guesses = int(m.groupdict()['rechash'])
-                percentage = 100 * int(m.groupdict()['progress']) / \
-                    (int(m.groupdict()['progress']) +
-                     int(m.groupdict()['remaining']))
-                speed = re.sub(r'\s+', ' ', m.groupdict()['speed'])
-                factor = speed.split()[1::2]
-                speed = speed.split()[::2]
-                speed = sum(int(x1) * int(x2)/1000
-                            for x1, x2 in zip(speed, factor))
-                ETA = dt.now() + \
-                    timedelta(seconds=int(m.groupdict()['remaining'])/speed)
-                return {
-                    'guesses': guesses,
-                    'ETA': ETA,
-                    'progress': percentage,
-                    'speed': speed,
-                }
+        # Each record has been parsed when it arrived
+        if self.status_events:
+            status = self.status_events[-1]
+            return {k: status[k] for k in
+                    ['guesses', 'ETA', 'progress', 'speed', 'devices']}
 
 
 class John(Cracker):
@@ -194,27 +681,66 @@ class John(Cracker):
     # We do this here by making a negative lookahead assertion for the
     # expression in the parenthesis.
     password_regex = r'^.* +\((?!NT \[MD4).*\) *$'
-    expected_returncode = 0
-
-    def command_line(self):
+    expected_returncodes = [0]
+    supported_attacks = [a for a in ATTACKS if a != 'combinator']
+    # John saves its session when it receives SIGTERM
+    checkpoint_signal = signal.SIGTERM
+    # Each forked process is a node of its own
+    part_per_core = True
+
+    def command_line(self, stage):
         cores = len(os.sched_getaffinity(0))
         cmd = [
             self._bin_path,
-            self._hash_file,
-            '--format=nt',
+            stage.get('hash_file', self._hash_file),
+            '--format=%s' % self._hash_type,
             '--pot=%s' % self._potfile,
             '--no-log',
-            '--wordlist=%s' % self._wordlist,
-            '--rules=%s' % self._rules,
-            *self._args,
+            '--progress-every=%d' % STATUS_INTERVAL,
+            '--session=%s' % self._session,
         ]
+        attack = stage['attack']
+        if attack not in self.supported_attacks:
+            raise ValueError("John does not support '%s' attacks" % attack)
+        if attack in ['wordlist', 'rules', 'hybrid']:
+            cmd.append('--wordlist=%s' % stage['wordlist'])
+        if attack == 'rules':
+            cmd.append('--rules=%s' % stage['rules'])
+        elif attack == 'mask':
+            if 'charset1' in stage:
+                cmd.append('-1=%s' % stage['charset1'])
+            cmd.append('--mask=%s' % stage['mask'])
+            if stage.get('increment'):
+                # Shorter candidates are generated from the start of the mask
+                cmd.append('--min-length=1')
+        elif attack == 'hybrid':
+            # ?w is the placeholder for the word from the wordlist
+            cmd.append('--mask=?w%s' % stage['mask'])
+        if 'max_runtime' in stage:
+            cmd.append('--max-run-time=%d' % stage['max_runtime'])
+        if 'max_candidates' in stage:
+            cmd.append('--max-candidates=%d' % stage['max_candidates'])
+        cmd += self._args
+        if self._partition:
+            # The coordinator assigns each worker one node per core, all
+            # with the same total, so the nodes of all workers add up
+            first, last, total = self._partition
+            cores = last - first + 1
+            if cores > 1:
+                cmd.append('--node=%d-%d/%d' % (first, last, total))
+            else:
+                cmd.append('--node=%d/%d' % (first, total))
         if cores > 1:
             cmd.append('--fork=%d' % cores)
         return cmd
 
-    def _get_version(self):
+    def restore_command_line(self):
+        return [self._bin_path, '--restore=%s' % self._session]
+
+    @classmethod
+    def probe_version(cls, bin_path):
         output = run(
-            [self._bin_path],
+            [bin_path],
             stdout=PIPE,
             encoding='utf8',
         )
@@ -226,11 +752,59 @@ class John(Cracker):
                                    % version)
             return version
 
-    def _get_status(self):
-        # Save output length before we trigger status update
-        lines_before = len(self.output['stderr'].splitlines())
+    @classmethod
+    def probe_devices(cls, bin_path):
+        return ['CPU (%d cores)' % len(os.sched_getaffinity(0))]
 
-        # Sending SIGUSR1 to all threads will trigger status update
+    @classmethod
+    def probe_speed(cls, bin_path):
+        output = run(
+            [bin_path, '--test=5', '--format=nt'],
+            stdout=PIPE,
+            encoding='utf8',
+        )
+        m = re.search(r'Raw:\s+([0-9.]+)([KMG]?) c/s real', output.stdout)
+        if not m:
+            raise RuntimeError("Could not run the benchmark: %s"
+                               % output.stdout)
+        factors = {'K': 10**3, 'M': 10**6, 'G': 10**9, '': 1}
+        # The test runs in a single process, but we fork one per core
+        return float(m[1]) * factors[m[2]] * len(os.sched_getaffinity(0))
+
+    def _parse_status(self, line, buffer):
+        if buffer != 'stderr':
+            return None
+        m = re.match(
+            r'.*(^|\s)(?P<guesses>[0-9]+)g '
+            r'[0-9:]+ (?P<percentage>[0-9.]+)% '
+            r'\(ETA: (?P<ETA>[0-9: -]+)\).*'
+            r' (?P<speed>[0-9.]+)(?P<factor>[KMG]?)p/s.*',
+            line,
+        )
+        if not m:
+            return None
+        factors = {'K': 10**3, 'M': 10**6, 'G': 10**9, '': 1}
+        eta = m.groupdict()['ETA']
+        if '-' in eta:
+            eta = dt.strptime(eta, '%Y-%m-%d %H:%M')
+        else:
+            eta = dt.combine(
+                date.today(),
+                dt.strptime(eta, '%H:%M:%S').time(),
+            )
+        factor = factors[m.groupdict()['factor']]
+        # If John forks, each line is prefixed with the node number
+        node = re.match(r'^([0-9]+) [0-9]+g ', line)
+        return {
+            'node': int(node[1]) if node else 0,
+            'guesses': int(m.groupdict()['guesses']),
+            'ETA': eta,
+            'percentage': float(m.groupdict()['percentage']),
+            'speed': float(m.groupdict()['speed'])*factor,
+        }
+
+    def _request_status(self):
+        # Sending SIGUSR1 to all processes will trigger a status update
         ps_output = run(
             ['ps', '-opid', '--no-headers', '--ppid',
              str(self._process.pid)],
@@ -240,55 +814,23 @@ class John(Cracker):
         child_pids = [int(line) for line in ps_output.stdout.splitlines()]
         for p in child_pids:
             os.kill(p, signal.SIGUSR1)
-        self._process.send_signal(10)
-
-        # Wait until the status update made its way to the output buffer
-        time.sleep(1)
-
-        ETA = []
-        percentage = []
-        speed = []
-        guesses = []
-        factors = {'K': 10**3, 'M': 10**6, 'G': '10**9', '': 1}
-
-        # Parse each line that got added since we triggered the status
-        # update; each thread has added one line
-        for line in self.output['stderr'].splitlines()[lines_before:]:
-            m = re.match(
-                r'.*(^|\s)(?P<guesses>[0-9]+)g '
-                r'[0-9:]+ (?P<percentage>[0-9.]+)% '
-                r'\(ETA: (?P<ETA>[0-9: -]+)\).*'
-                r' (?P<speed>[0-9.]+)(?P<factor>[KMG]?)p/s.*',
-                line,
-            )
-            if m:
-                guesses.append(int(m.groupdict()['guesses']))
-                eta = m.groupdict()['ETA']
-                if '-' in eta:
-                    eta = dt.strptime(eta, '%Y-%m-%d %H:%M')
-                else:
-                    eta = dt.combine(
-                        date.today(),
-                        dt.strptime(eta, '%H:%M:%S').time(),
-                    )
-                ETA.append(eta)
-                percentage.append(float(m.groupdict()['percentage']))
-                factor = factors[m.groupdict()['factor']]
-                speed.append(float(m.groupdict()['speed'])*factor)
-        if guesses and ETA and percentage and speed:
+        self._process.send_signal(signal.SIGUSR1)
+
+    def _get_status(self):
+        # John prints a status line every few seconds for each node, so
+        # combine the latest line of each node
+        latest = {}
+        for e in list(self.status_events):
+            latest[e['node']] = e
+        events = list(latest.values())
+        if events:
             return {
-                'guesses': sum(guesses),
-                'ETA': max(ETA),
-                'progress': sum(percentage)/len(percentage),
-                'speed': sum(speed),
+                'guesses': sum(e['guesses'] for e in events),
+                'ETA': max(e['ETA'] for e in events),
+                'progress': sum(e['percentage'] for e in events)/len(events),
+                'speed': sum(e['speed'] for e in events),
+                'devices': [latest[n]['speed'] for n in sorted(latest)],
             }
-        else:
-            log.error(
-                (
-                    "Something went wrong:\nGuesses: %s\nETA: %s\n"
-                    "Percentage: %s\nSpeed: %s"
-                ) % (guesses, ETA, percentage, speed)
-            )
 
     def _get_passwords(self):
         command_line = [
@@ -312,3 +854,6 @@ class John(Cracker):
             else:
                 break
         return result
+
+
+ENGINES = {'John': John, 'Hashcat': Hashcat}
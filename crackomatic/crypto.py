@@ -0,0 +1,53 @@
+import hashlib
+import hmac
+import os
+from logging import getLogger
+
+log = getLogger(__name__)
+
+_KEY_FILE = 'crackomatic.key'
+_key = None
+
+
+def load_key():
+    """Return the secret key used to protect data at rest
+
+    The key is created on first use and stored in the data directory with
+    restrictive permissions."""
+    global _key
+    if _key is None:
+        from cryptography.fernet import Fernet
+        from xdg.BaseDirectory import save_data_path
+        DATA_DIR = save_data_path('crackomatic')
+
+        key_file = os.path.join(DATA_DIR, _KEY_FILE)
+        if not os.path.exists(key_file):
+            log.info("Generating new secret key in %s" % key_file)
+            fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(Fernet.generate_key())
+        with open(key_file, 'rb') as f:
+            _key = f.read().strip()
+    return _key
+
+
+def encrypt(data):
+    """Encrypt and authenticate bytes; returns a URL-safe token"""
+    from cryptography.fernet import Fernet
+    return Fernet(load_key()).encrypt(data)
+
+
+def decrypt(token):
+    """Reverse `encrypt`; raises an exception if the token was tampered
+    with"""
+    from cryptography.fernet import Fernet
+    return Fernet(load_key()).decrypt(token)
+
+
+def fingerprint(value):
+    """Return a keyed hash of a string
+
+    Use this instead of storing sensitive values such as NT hashes, which
+    are as good as a password."""
+    subkey = hmac.new(load_key(), b'fingerprint', hashlib.sha256).digest()
+    return hmac.new(subkey, value.encode(), hashlib.sha256).hexdigest()
@@ -0,0 +1,462 @@
+"""Split the keyspace of an audit across several workers
+
+The coordinator listens on a TCP port while the audit is in the cracking
+stage. Workers (``crackomatic worker``) connect to it, authenticate with a
+shared key and each receive the hashes and one part of the keyspace. They
+report their status periodically and send back the passwords from their
+potfile when they are done, which the coordinator merges into one result.
+Workers run their own cracker binary with their own arguments; the
+coordinator only chooses the engine and the stages.
+
+Messages are JSON objects sent over `multiprocessing.connection`, which
+takes care of framing and of authenticating both sides.
+"""
+
+from datetime import datetime as dt
+import json
+from logging import getLogger
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+import os
+import socket
+from tempfile import TemporaryDirectory
+from threading import Thread, Lock, Event
+import time
+
+from ._version import __version__
+from .cracker import get_cracker, TimeSeries, StatusSample, \
+    STATUS_INTERVAL, ENGINES
+from .plan import default_stage, ATTACKS, BUDGETS
+
+log = getLogger(__name__)
+
+# Seconds to wait before connecting to the coordinator again
+RETRY_INTERVAL = 10
+# Actions the coordinator may ask a worker's cracker to perform
+CONTROL_ACTIONS = ['pause', 'resume', 'stop', 'suspend', 'abort']
+# Parameters of a stage a worker accepts besides those of its attack
+STAGE_PARAMETERS = BUDGETS + ['attack', 'name', 'hash_file', 'generated',
+                              'charset1', 'increment']
+
+
+def parse_address(address):
+    """Turn a string like 'host:port' into a tuple"""
+    host, _, port = address.rpartition(':')
+    return (host or 'localhost', int(port))
+
+
+def assign_parts(units):
+    """Split the keyspace among workers
+
+    `units` holds the number of parts each worker takes. Return a list of
+    tuples (first, last, total), which all refer to the same total."""
+    total = sum(units)
+    result = []
+    first = 1
+    for count in units:
+        result.append((first, first + count - 1, total))
+        first += count
+    return result
+
+
+def check_work(engine, stages):
+    """Raise a ValueError unless the engine and the stages sent by the
+    coordinator are safe to run
+
+    The values end up on the command line of the cracker, so they must
+    not look like options."""
+    if engine not in ENGINES:
+        raise ValueError("Unknown engine: %s" % engine)
+    for i, stage in enumerate(stages, 1):
+        attack = stage.get('attack')
+        if attack not in ENGINES[engine].supported_attacks:
+            raise ValueError("Stage %d: unsupported attack '%s'" % (i, attack))
+        unknown = set(stage) - set(ATTACKS[attack]) - set(STAGE_PARAMETERS)
+        if unknown:
+            raise ValueError("Stage %d: unknown parameters: %s"
+                             % (i, ', '.join(sorted(unknown))))
+        for key, value in stage.items():
+            if isinstance(value, str) and value.startswith('-'):
+                raise ValueError("Stage %d: invalid value of '%s': %s"
+                                 % (i, key, value))
+
+
+def send(conn, message):
+    conn.send_bytes(json.dumps(message, default=str).encode())
+
+
+def receive(conn):
+    return json.loads(conn.recv_bytes().decode())
+
+
+class Coordinator(Thread):
+    """Distribute the attack across workers
+
+    This class behaves like a `Cracker`, so the job can control it the same
+    way."""
+
+    def __init__(self, engine, hash_file, wordlist, rules, bin_path,
+                 root_dir='/tmp', args=[], stages=None, restore=False,
+                 workers=1, address=('localhost', 0), authkey=b'',
+                 cb_cracked=None, version=None):
+        self._run_lock = Lock()
+        self._run_lock.acquire()
+        super().__init__()
+        self._engine = engine
+        self._hash_file = hash_file
+        self._wordlist = wordlist
+        self._rules = rules
+        self._bin_path = bin_path
+        self._args = args
+        self.stages = stages or [default_stage(wordlist, rules)]
+        self.stage = 0
+        self.workers = workers
+        if restore:
+            log.warning("Distributed sessions can't be restored; starting"
+                        " over")
+        if args:
+            log.warning("Additional arguments are not passed on to workers;"
+                        " pass them to 'crackomatic worker' instead")
+        self._listener = Listener(address, authkey=authkey)
+        self.address = self._listener.address
+        # Registered workers, their number of cores and those which have
+        # been assigned work
+        self._connections = []
+        self._cores = []
+        self._assigned = []
+        self._send_lock = Lock()
+        self._resume = Event()
+        self._resume.set()
+        self._finishing = False
+        self._aborted = False
+        self._suspended = False
+
+        self.passwords = {}
+        self.cracked = {}
+        self.cb_cracked = cb_cracked  # cb = callback
+        # Latest status of each worker
+        self._status = {}
+        self._status_time = None
+        self.status_history = TimeSeries()
+        self.version = version
+        self.start()
+
+    def _broadcast(self, message):
+        with self._send_lock:
+            for conn in self._assigned:
+                try:
+                    send(conn, message)
+                except OSError as e:
+                    log.error("Could not reach worker: %s" % e)
+
+    def _control(self, action):
+        if len(self._connections) < self.workers:
+            # Stop waiting for workers by connecting to ourselves
+            try:
+                socket.create_connection(self.address, timeout=1).close()
+            except OSError:
+                pass
+        self._broadcast(dict(type='control', action=action))
+
+    @property
+    def _cancelled(self):
+        return self._finishing or self._aborted or self._suspended
+
+    @property
+    def paused(self):
+        return not self._resume.is_set()
+
+    def pause(self):
+        if not self.paused:
+            log.info("Pausing workers")
+            self._resume.clear()
+            self._control('pause')
+
+    def resume(self):
+        if self.paused:
+            log.info("Resuming workers")
+            self._resume.set()
+            self._control('resume')
+
+    def stop(self):
+        """Stop cracking and keep the passwords cracked so far"""
+        log.info("Stopping workers")
+        self._finishing = True
+        self._control('stop')
+
+    def suspend(self):
+        log.info("Suspending workers")
+        self._suspended = True
+        self._control('suspend')
+
+    def abort(self):
+        self._aborted = True
+        self._control('abort')
+
+    def wait_until_finished(self, timeout=-1):
+        """Return True if all workers finished within the timeout"""
+        if self._run_lock.acquire(timeout=timeout):
+            self._run_lock.release()
+            return True
+        return False
+
+    def get_status(self):
+        """Return the combined status of all workers"""
+        if self.paused:
+            return "Paused"
+        elif len(self._connections) < self.workers:
+            return "Waiting for workers (%d/%d)" % (
+                len(self._connections), self.workers
+            )
+        status = list(self._status.values())
+        if not status:
+            return "Waiting for status"
+        return {
+            'guesses': sum(s['guesses'] for s in status),
+            'ETA': max(dt.fromisoformat(s['ETA']) for s in status),
+            'progress': sum(s['progress'] for s in status) / self.workers,
+            'speed': sum(s['speed'] for s in status),
+            'devices': [d for s in status
+                        for d in s.get('devices', [s['speed']])],
+            'age': (dt.now() - self._status_time).total_seconds(),
+            'stage': min(s['stage'] for s in status),
+            'stages': len(self.stages),
+        }
+
+    def _accept_workers(self):
+        """Return True when all workers have registered or False if cracking
+        has been cancelled in the meantime"""
+        while len(self._connections) < self.workers:
+            if self._cancelled:
+                return False
+            conn = None
+            try:
+                conn = self._listener.accept()
+                message = receive(conn)
+            except (AuthenticationError, EOFError, OSError, ValueError) as e:
+                # Port scanners and health checks end up here as well
+                log.error("Worker failed to register: %s" % e)
+                if conn:
+                    conn.close()
+                continue
+            if not isinstance(message, dict) or \
+                    message.get('type') != 'register' or \
+                    message.get('version') != __version__:
+                log.error("Rejecting worker: %s" % message)
+                conn.close()
+                continue
+            log.info("Worker %d/%d registered: %s" % (
+                len(self._connections) + 1, self.workers, message['host']
+            ))
+            cores = message.get('cores')
+            if not isinstance(cores, int) or cores < 1:
+                cores = 1
+            self._connections.append(conn)
+            self._cores.append(cores)
+        return True
+
+    def _handle_worker(self, node, conn, results):
+        try:
+            while True:
+                message = receive(conn)
+                if message['type'] == 'status':
+                    self._status[node] = message['status']
+                    self._status_time = dt.now()
+                    self.stage = min(s['stage'] for s in
+                                     self._status.values()) - 1
+                    status = self.get_status()
+                    if isinstance(status, dict):
+                        self.status_history.add(StatusSample(
+                            self._status_time,
+                            tuple(status['devices']),
+                            status['progress'],
+                            status['guesses'],
+                        ))
+                elif message['type'] == 'cracked':
+                    new = message['passwords']
+                    self.cracked.update(new)
+                    if self.cb_cracked:
+                        try:
+                            self.cb_cracked(new)
+                        except Exception as e:
+                            log.error("Could not process cracked hashes: %s"
+                                      % e)
+                elif message['type'] == 'result':
+                    results[node] = message['passwords']
+                    return
+        except (EOFError, OSError) as e:
+            log.error("Lost connection to worker %d: %s" % (node, e))
+        finally:
+            conn.close()
+
+    def run(self):
+        try:
+            if not self._accept_workers():
+                for conn in self._connections:
+                    conn.close()
+                self.passwords = None if (
+                    self._aborted or self._suspended
+                ) else {}
+                return
+            self._listener.close()
+            with open(self._hash_file, 'r') as f:
+                hashes = f.read()
+            # Wordlists generated for this audit and the hashes of each tier
+            # only exist on this machine
+            files = {}
+            for stage in self.stages:
+                paths = [stage.get('hash_file')]
+                if stage.get('generated'):
+                    paths.append(stage['wordlist'])
+                for path in paths:
+                    if path and path not in files:
+                        with open(path, 'r') as f:
+                            files[path] = f.read()
+            if ENGINES[self._engine].part_per_core:
+                parts = assign_parts(self._cores)
+            else:
+                parts = assign_parts([1] * len(self._connections))
+            results = {}
+            threads = []
+            with self._send_lock:
+                for node, conn in enumerate(self._connections, 1):
+                    send(conn, dict(
+                        type='work',
+                        engine=self._engine,
+                        hashes=hashes,
+                        wordlist=self._wordlist,
+                        rules=self._rules,
+                        stages=self.stages,
+                        files=files,
+                        partition=parts[node - 1],
+                    ))
+                    self._assigned.append(conn)
+                    t = Thread(target=self._handle_worker,
+                               args=(node, conn, results))
+                    t.start()
+                    threads.append(t)
+            # Catch up on what happened while the work was being assigned
+            if self._aborted:
+                self._control('abort')
+            elif self._suspended:
+                self._control('suspend')
+            elif self._finishing:
+                self._control('stop')
+            elif self.paused:
+                self._control('pause')
+            for t in threads:
+                t.join()
+            if self._aborted or self._suspended:
+                self.passwords = None
+            elif len(results) < self.workers or None in results.values():
+                log.error("Not all workers finished successfully")
+                self.passwords = None
+            else:
+                # Merge the potfiles
+                for passwords in results.values():
+                    self.passwords.update(passwords)
+        except Exception as e:
+            log.error("Distributed cracking failed: %s" % e)
+            log.exception(e)
+            self.passwords = None
+        finally:
+            self._listener.close()
+            self._run_lock.release()
+
+
+def _receive_control(conn, cracker):
+    """Pass control messages from the coordinator on to the cracker"""
+    try:
+        while True:
+            message = receive(conn)
+            if message.get('type') == 'control' and \
+                    message.get('action') in CONTROL_ACTIONS:
+                getattr(cracker, message['action'])()
+    except (EOFError, OSError):
+        pass
+
+
+def work(conn, bin_path, args=[]):
+    """Carry out the work assigned by the coordinator with the cracker
+    binary at `bin_path`"""
+    send(conn, dict(
+        type='register',
+        host=socket.gethostname(),
+        version=__version__,
+        cores=len(os.sched_getaffinity(0)),
+    ))
+    message = receive(conn)
+    partition = tuple(message['partition'])
+    try:
+        check_work(message['engine'], message['stages'])
+    except ValueError as e:
+        log.error("Rejecting work: %s" % e)
+        send(conn, dict(type='result', passwords=None))
+        return
+    log.info("Cracking parts %d to %d of %d" % partition)
+    send_lock = Lock()
+
+    def report(message):
+        # Called from the cracker's threads as well
+        with send_lock:
+            send(conn, message)
+
+    with TemporaryDirectory(prefix='crackomatic_worker') as root_dir:
+        hash_file = os.path.join(root_dir, 'hashfile')
+        with open(hash_file, 'w') as f:
+            f.write(message['hashes'])
+        stages = message['stages']
+        for i, (path, content) in enumerate(message['files'].items()):
+            local_path = os.path.join(root_dir, 'file%d' % i)
+            with open(local_path, 'w') as f:
+                f.write(content)
+            for stage in stages:
+                for key in ['wordlist', 'hash_file']:
+                    if stage.get(key) == path:
+                        stage[key] = local_path
+        cracker = get_cracker(
+            message['engine'],
+            hash_file,
+            message['wordlist'],
+            message['rules'],
+            bin_path,
+            root_dir=root_dir,
+            args=args,
+            stages=stages,
+            partition=partition,
+            cb_cracked=lambda p: report(dict(type='cracked', passwords=p)),
+        )
+        Thread(target=_receive_control, args=(conn, cracker),
+               daemon=True).start()
+        while not cracker.wait_until_finished(timeout=STATUS_INTERVAL):
+            status = cracker.get_status()
+            if isinstance(status, dict):
+                report(dict(type='status', status=status))
+        report(dict(type='result', passwords=cracker.passwords))
+    log.info("Finished parts %d to %d of %d" % partition)
+
+
+def run_worker(address, authkey, bin_path, args=[], once=False):
+    """Connect to the coordinator and crack whatever it assigns with the
+    cracker binary at `bin_path` and the additional arguments `args`
+
+    Unless `once` is set, wait for the next audit afterwards."""
+    while True:
+        try:
+            conn = Client(address, authkey=authkey)
+        except OSError:
+            log.debug("Coordinator not reachable, retrying")
+            time.sleep(RETRY_INTERVAL)
+            continue
+        except AuthenticationError:
+            log.error("The coordinator rejected the key")
+            time.sleep(RETRY_INTERVAL)
+            continue
+        try:
+            work(conn, bin_path, args)
+        except (EOFError, OSError) as e:
+            log.error("Lost connection to the coordinator: %s" % e)
+        finally:
+            conn.close()
+        if once:
+            break
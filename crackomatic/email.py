@@ -44,8 +44,11 @@ def send_mail(receiver_email, subject, body, config):
 
 
 def send_mails(addresses, subject, body, config):
+    """Send a mail to a list of addresses; return True on success"""
     try:
         send_mail(addresses, subject, body, config)
+        return True
     except Exception as e:
         log.error("Sending mail failed: %s" % e)
         log.exception(e)
+        return False
@@ -0,0 +1,122 @@
+import json
+from logging import getLogger
+import os
+from threading import Lock
+
+from .cracker import ENGINES
+from .estimate import count_lines
+from .models import session_scope, freeze, EngineInfo, LineCount
+
+log = getLogger(__name__)
+
+# Don't probe the same binary twice at the same time
+_probe_lock = Lock()
+
+
+def _thaw(entry):
+    info = freeze(entry)
+    info.attacks = json.loads(info.attacks)
+    info.devices = json.loads(info.devices)
+    return info
+
+
+def probe_engine(engine, binary_path):
+    """Determine the version, supported attacks, devices and speed of a
+    cracking engine"""
+    cls = ENGINES[engine]
+    log.info("Probing %s at %s" % (engine, binary_path))
+    info = dict(
+        version=cls.probe_version(binary_path),
+        attacks=cls.supported_attacks,
+        devices=cls.probe_devices(binary_path),
+    )
+    try:
+        info['speed'] = cls.probe_speed(binary_path)
+    except Exception as e:
+        log.error("Benchmark of %s failed: %s" % (binary_path, e))
+        info['speed'] = None
+    log.info("%s runs at %s NT hashes per second" % (engine, info['speed']))
+    return info
+
+
+def get_engine_info(engine, binary_path, probe=True):
+    """Return what is known about the engine with the given binary
+
+    Each binary is probed once and the results are kept in the database
+    until the binary changes. If `probe` is False, return None instead of
+    probing."""
+    mtime = os.stat(binary_path).st_mtime
+    with session_scope(expire_on_commit=False) as s:
+        entry = s.query(EngineInfo).filter(
+            EngineInfo.binary_path == binary_path
+        ).first()
+        if entry and entry.engine == engine and entry.mtime == mtime:
+            return _thaw(entry)
+    if not probe:
+        return None
+    with _probe_lock:
+        # Someone else may have probed it in the meantime
+        info = get_engine_info(engine, binary_path, probe=False)
+        if info:
+            return info
+        info = probe_engine(engine, binary_path)
+        with session_scope(expire_on_commit=False) as s:
+            s.query(EngineInfo).filter(
+                EngineInfo.binary_path == binary_path
+            ).delete()
+            entry = EngineInfo(
+                engine=engine,
+                binary_path=binary_path,
+                mtime=mtime,
+                version=info['version'],
+                attacks=json.dumps(info['attacks']),
+                devices=json.dumps(info['devices']),
+                speed=info['speed'],
+            )
+            s.add(entry)
+            s.flush()
+            return _thaw(entry)
+
+
+def get_line_counts(files):
+    """Return the known number of lines of wordlists and rule files
+
+    `files` holds tuples (path, rules) like those of `estimate.plan_files`.
+    The result maps them to their number of lines, as long as the file has
+    not changed since it was counted."""
+    result = {}
+    with session_scope() as s:
+        for path, rules in files:
+            st = os.stat(path)
+            entry = s.query(LineCount).filter(
+                (LineCount.path == path) & (LineCount.rules == rules)
+            ).first()
+            if entry and entry.size == st.st_size \
+                    and entry.mtime == st.st_mtime:
+                result[(path, rules)] = entry.count
+    return result
+
+
+def count_files(files):
+    """Count the lines of the files which have not been counted yet and keep
+    the results in the database until the files change
+
+    Large wordlists take a while, so this is meant to run in the
+    background."""
+    known = get_line_counts(files)
+    for path, rules in set(files) - set(known):
+        st = os.stat(path)
+        count = count_lines(path, rules)
+        with session_scope() as s:
+            s.query(LineCount).filter(
+                (LineCount.path == path) & (LineCount.rules == rules)
+            ).delete()
+            s.add(LineCount(
+                path=path,
+                rules=rules,
+                size=st.st_size,
+                mtime=st.st_mtime,
+                count=count,
+            ))
+        log.info("Counted %d %s in %s"
+                 % (count, 'rules' if rules else 'lines', path))
@@ -0,0 +1,178 @@
+"""Estimate how long the cracking stage of an audit will take
+
+The number of candidates of each stage follows from the size of its
+wordlists, rule files and masks. Dividing it by the speed measured when the
+engine was probed gives the expected duration. NT hashes are not salted, so
+the speed does not depend on the number of hashes.
+"""
+
+import json
+from logging import getLogger
+
+from .plan import parse_attack_plan, ATTACKS, FILES
+
+log = getLogger(__name__)
+
+# Number of candidates for each built-in charset of a mask
+CHARSETS = {
+    'l': 26,
+    'u': 26,
+    'd': 10,
+    'h': 16,
+    'H': 16,
+    's': 33,
+    'a': 95,
+    'b': 256,
+}
+CHUNK_SIZE = 2**20
+
+
+class NotCounted(Exception):
+    """The lines of a wordlist or rule file have not been counted yet"""
+
+
+def _count_lines(path):
+    count = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            count += chunk.count(b'\n')
+        # The last line may lack a line break
+        if f.tell() and not chunk.endswith(b'\n'):
+            count += 1
+    return count
+
+
+def _count_rules(path):
+    count = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith(b'#'):
+                count += 1
+    return count
+
+
+def count_lines(path, rules=False):
+    """Return the number of lines in a wordlist, or the number of rules in a
+    rule file
+
+    This reads the whole file; `engines.count_files` keeps the counts of the
+    configured files in the database."""
+    return _count_rules(path) if rules else _count_lines(path)
+
+
+def charset_size(charset):
+    """Return the number of characters of a custom charset like '?l?d_'"""
+    result = 0
+    i = 0
+    while i < len(charset):
+        if charset[i] == '?' and i + 1 < len(charset):
+            result += CHARSETS.get(charset[i+1], 1)
+            i += 2
+        else:
+            result += 1
+            i += 1
+    return result
+
+
+def mask_keyspace(mask, charset1=None):
+    """Return the number of candidates of a mask like '?u?l?l?d?d', which
+    may use the custom charset `charset1` as '?1'"""
+    result = 1
+    i = 0
+    while i < len(mask):
+        if mask[i] == '?' and i + 1 < len(mask):
+            if mask[i+1] == '?':
+                pass
+            elif mask[i+1] in CHARSETS:
+                result *= CHARSETS[mask[i+1]]
+            elif mask[i+1] == '1' and charset1:
+                result *= charset_size(charset1)
+            else:
+                raise ValueError("Unknown charset in mask: ?%s" % mask[i+1])
+            i += 2
+        else:
+            i += 1
+    return result
+
+
+def plan_files(stages):
+    """Return the set of tuples (path, rules) of the wordlists and rule
+    files the stages read"""
+    result = set()
+    for stage in stages:
+        for key in ATTACKS[stage['attack']]:
+            if key in FILES:
+                result.add((stage[key], key == 'rules'))
+    return result
+
+
+def stage_candidates(stage, line_counts):
+    """Return the number of candidates a stage of an attack plan tries
+
+    See `estimate` for `line_counts`."""
+    def lines(key, rules=False):
+        path = stage[key]
+        if (path, rules) not in line_counts:
+            raise NotCounted(path)
+        return line_counts[(path, rules)]
+
+    attack = stage['attack']
+    if attack == 'wordlist':
+        result = lines('wordlist')
+    elif attack == 'rules':
+        result = lines('wordlist') * max(lines('rules', rules=True), 1)
+    elif attack == 'mask':
+        result = mask_keyspace(stage['mask'], stage.get('charset1'))
+    elif attack == 'hybrid':
+        result = lines('wordlist') * mask_keyspace(stage['mask'])
+    elif attack == 'combinator':
+        result = lines('wordlist') * lines('wordlist2')
+    else:
+        raise ValueError("Unknown attack: %s" % attack)
+    if stage.get('max_candidates'):
+        result = min(result, stage['max_candidates'])
+    return result
+
+
+def unique_hashes(report):
+    """Return the number of distinct hashes in a report
+
+    Accounts sharing a password form a clique, so all but one hash of each
+    clique are duplicates."""
+    cliques = json.loads(report.cliques or '{}')
+    duplicates = sum((int(k) - 1)*v for k, v in cliques.items())
+    return report.total_hashes - duplicates
+
+
+def estimate(cracker_config, speed, line_counts, report=None):
+    """Estimate the candidates and duration of the cracking stage
+
+    `speed` is the number of candidates per second, `line_counts` maps the
+    tuples of `plan_files` to their number of lines, as returned by
+    `engines.get_line_counts`, and `report` is the report of the last audit
+    of the domain, if any. Raise NotCounted if a file is missing from
+    `line_counts`. Return a dictionary."""
+    stages = parse_attack_plan(
+        cracker_config.get('attack_plan'),
+        cracker_config.get('wordlist_path'),
+        cracker_config.get('rule_path'),
+        cracker_config.get('cracker'),
+    )
+    candidates = 0
+    duration = 0
+    for stage in stages:
+        count = stage_candidates(stage, line_counts)
+        candidates += count
+        if speed:
+            seconds = count / speed
+            if stage.get('max_runtime'):
+                seconds = min(seconds, stage['max_runtime'])
+            duration += seconds
+    return dict(
+        candidates=candidates,
+        stages=len(stages),
+        hashes=unique_hashes(report) if report else None,
+        speed=speed,
+        duration=duration if speed else None,
+    )
@@ -10,7 +10,7 @@ from babel.dates import format_datetime
 from .user import User
 from ._version import __version__
 from .forms import LoginForm, NewAuditForm
-from .backend import Backend
+from .backend import Backend, format_speed
 from .constants import AuditState, AuditFrequency
 
 app = flask.Flask(__name__)
@@ -159,6 +159,10 @@ def audit():
     try:
         audit_uuid = flask.request.args.get('id')
         _, audit_record = backend.get_report_and_audit(audit_uuid)
+        from .reports import throughput_chart
+        throughput = throughput_chart(
+            backend.get_status_history(audit_uuid)
+        )
 
         audit = {}
         dummy_form = NewAuditForm()
@@ -189,6 +193,7 @@ def audit():
         'audit.html',
         display_str=display_str,
         audit=audit,
+        throughput=throughput,
         **get_context(),
     )
 
@@ -273,6 +278,22 @@ Please contact your IT department if you have further questions.
     )
 
 
+@app.route('/audits/estimate')
+@login_required
+def estimate_audit():
+    args = flask.request.args
+    try:
+        result = backend.estimate_audit(
+            args.get('domain'),
+            frequency=args.get('frequency'),
+            max_duration=args.get('max_duration'),
+        )
+    except Exception as e:
+        log.error("Could not estimate the duration of an audit: %s" % str(e))
+        result = dict(error=str(e))
+    return flask.jsonify(result)
+
+
 @app.route('/events')
 @login_required
 def events():
@@ -320,8 +341,12 @@ def config():
             log.error("Error while updating the config: %s" % str(e))
             log.exception(e)
             flask.flash(str(e), 'danger')
+    engine = backend.get_engine_info() if section == 'cracker' else None
     return flask.render_template(
         'config.html',
+        engine=engine,
+        engine_speed=format_speed(engine.speed) if engine and engine.speed
+        else None,
         config=config,
         section=section,
         sections=sections,
@@ -1,11 +1,15 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, HiddenField, \
-        DateTimeField, SelectField, TextAreaField
-from wtforms.validators import DataRequired, Optional
+        DateTimeField, SelectField, TextAreaField, IntegerField
+from wtforms.validators import DataRequired, Optional, NumberRange, Regexp
 
 from .constants import AuditFrequency
 
 
+TIME_REGEX = '^([01][0-9]|2[0-3]):[0-5][0-9]$'
+TIME_MESSAGE = "Use the format HH:MM"
+
+
 class LoginForm(FlaskForm):
     user = StringField('user', validators=[DataRequired()])
     password = PasswordField('password', validators=[DataRequired()])
@@ -21,6 +25,15 @@ class NewAuditForm(FlaskForm):
             help="FQDN of the domain to be audited",
         ),
     )
+    child_domains = StringField(
+        "Further domains",
+        description=dict(
+            placeholder="emea.contoso.local, apac.contoso.local",
+            help="Optional; FQDNs of further domains of the forest, which"
+                 " are replicated with the same account and cracked"
+                 " together with the domain above",
+        ),
+    )
     user = StringField(
         "User",
         validators=[DataRequired()],
@@ -114,6 +127,15 @@ class NewAuditForm(FlaskForm):
         ),
         validators=[DataRequired()],
     )
+    priority_filter = StringField(
+        "LDAP filter (priority accounts)",
+        description=dict(
+            placeholder="(adminCount=1)",
+            help="Optional; hashes of users passing this LDAP filter are"
+                 " attacked with all stages first, the remaining hashes only"
+                 " with plain wordlists",
+        ),
+    )
     subject = StringField(
         "Subject",
         description=dict(
@@ -136,3 +158,57 @@ class NewAuditForm(FlaskForm):
                  " report",
         ),
     )
+    max_duration = IntegerField(
+        "Max. cracking duration",
+        description=dict(
+            placeholder="48",
+            help="Optional maximum number of hours to spend cracking; after"
+                 " that, the audit is finished with the passwords cracked so"
+                 " far",
+        ),
+        validators=[Optional(), NumberRange(min=1)],
+    )
+    sample_size = IntegerField(
+        "Sample size (%)",
+        description=dict(
+            placeholder="5",
+            help="Optionally crack only this percentage of the hashes,"
+                 " chosen at random, and extrapolate the results; much"
+                 " cheaper for large domains",
+        ),
+        validators=[Optional(), NumberRange(min=1, max=100)],
+    )
+    window_start = StringField(
+        "Cracking window start",
+        description=dict(
+            placeholder="20:00",
+            help="Optional time of day (HH:MM) at which cracking may begin,"
+                 " e.g. outside of business hours",
+        ),
+        validators=[Optional(), Regexp(TIME_REGEX, message=TIME_MESSAGE)],
+    )
+    window_end = StringField(
+        "Cracking window end",
+        description=dict(
+            placeholder="06:00",
+            help="Optional time of day (HH:MM) at which cracking is paused"
+                 " until the window opens again",
+        ),
+        validators=[Optional(), Regexp(TIME_REGEX, message=TIME_MESSAGE)],
+    )
+
+    def validate(self, *args, **kwargs):
+        result = super().validate(*args, **kwargs)
+        if bool(self.window_start.data) != bool(self.window_end.data):
+            self.window_end.errors = list(self.window_end.errors) + [
+                "Specify both start and end of the window"
+            ]
+            return False
+        if self.window_start.data and \
+                self.window_start.data == self.window_end.data:
+            # The window would never open
+            self.window_end.errors = list(self.window_end.errors) + [
+                "The window must end at a different time than it starts"
+            ]
+            return False
+        return result
@@ -0,0 +1,199 @@
+import collections
+from logging import getLogger
+import re
+
+log = getLogger(__name__)
+
+# The LM hash of an empty password, which is stored if there is no LM hash
+EMPTY_LM = 'aad3b435b51404eeaad3b435b51404ee'
+# Suffix of the user names of previous passwords, as in secretsdump's output
+HISTORY_REGEX = re.compile(r'^(.*)_history(\d+)$')
+# pdbedit prints placeholders like 'XXXX...' or 'NO PASSWORDXXXX...' instead
+# of missing hashes
+HASH_REGEX = re.compile(r'^[0-9a-f]{32}$')
+
+
+def is_hash(value):
+    """Return True if the value is a hash and not a placeholder"""
+    return bool(value and HASH_REGEX.match(value.lower()))
+
+
+class HashRecord(object):
+    """One line in pwdump format
+
+    Domains can have hundreds of thousands of accounts, so records are kept
+    small and streamed from the replication to the hash index instead of
+    being collected in one large string."""
+
+    __slots__ = ('user', 'rid', 'lm', 'nt', 'flags')
+
+    def __init__(self, user, rid, lm, nt, flags=''):
+        self.user = user
+        self.rid = rid
+        self.lm = lm
+        self.nt = nt
+        # The account flags printed by pdbedit, e.g. '[DU         ]'
+        self.flags = flags
+
+    @classmethod
+    def from_line(cls, line):
+        fields = line.rstrip('\r\n').split(':')
+        return cls(fields[0], fields[1], fields[2].lower(), fields[3].lower(),
+                   fields[4] if len(fields) > 4 else '')
+
+    def __str__(self):
+        return "%s:%s:%s:%s:%s::" % (self.user, self.rid, self.lm, self.nt,
+                                     self.flags)
+
+    @property
+    def history(self):
+        """The account and the age of the password if this is the hash of a
+        previous password, otherwise None"""
+        match = HISTORY_REGEX.match(self.user)
+        if match:
+            return match.group(1), int(match.group(2))
+        return None
+
+
+def parse_pwdump(lines):
+    """Generate a record for each non-empty line in pwdump format"""
+    for line in lines:
+        if line.strip():
+            yield HashRecord.from_line(line)
+
+
+class HashIndex(object):
+    """Keep track of which accounts share the same NT hash
+
+    Active Directory does not salt its hashes, so each unique hash only
+    needs to be cracked once. The result is then fanned out to all accounts
+    using that hash. Hashes of previous passwords are deduplicated along
+    with the current ones, but they don't count as accounts.
+    """
+
+    def __init__(self):
+        # NT hash -> list of accounts
+        self._accounts = collections.OrderedDict()
+        # NT hash -> LM hash
+        self._lm = {}
+        self._count = 0
+        # Account -> list of NT hashes of previous passwords, newest first
+        self._history = collections.OrderedDict()
+
+    @classmethod
+    def from_records(cls, records):
+        """Create an index from an iterable of `HashRecord`s"""
+        index = cls()
+        for record in records:
+            if not is_hash(record.nt):
+                # Accounts without a password like the Guest account
+                log.debug("Skipping %s, which has no NT hash" % record.user)
+                continue
+            history = record.history
+            if history:
+                index.add_history(history[0], history[1], record.nt)
+            else:
+                index.add(record.user, record.lm, record.nt)
+        log.debug("Deduplicated %d accounts to %d unique hashes"
+                  % (len(index), len(index._accounts)))
+        return index
+
+    def __len__(self):
+        return self._count
+
+    def add(self, user, lm, nt):
+        self._accounts.setdefault(nt, []).append(user)
+        self._lm.setdefault(nt, lm)
+        self._count += 1
+
+    def add_history(self, user, age, nt):
+        """Add the hash of the previous password of an account; an age of 0
+        is the current one"""
+        history = self._history.setdefault(user, [])
+        history.extend([None] * (age + 1 - len(history)))
+        history[age] = nt
+
+    @property
+    def hashes(self):
+        """List of unique NT hashes"""
+        return list(self._accounts.keys())
+
+    @property
+    def lm_hashes(self):
+        """List of unique NT hashes whose accounts also have an LM hash"""
+        return [nt for nt, lm in self._lm.items()
+                if is_hash(lm) and lm.lower() != EMPTY_LM]
+
+    @property
+    def all_hashes(self):
+        """List of unique NT hashes including those of previous passwords"""
+        result = collections.OrderedDict.fromkeys(self._accounts)
+        for history in self._history.values():
+            result.update((nt, None) for nt in history if nt)
+        return list(result)
+
+    def password_histories(self, cracked):
+        """Return a dictionary mapping each account with a password history
+        to its passwords, newest first
+
+        Passwords which have not been cracked are None. Repetitions of the
+        same hash, such as the current password at the top of the history,
+        are merged."""
+        current = self.hashes_by_account()
+        result = {}
+        for user, history in self._history.items():
+            hashes = [current.get(user)] + history
+            hashes = [nt for i, nt in enumerate(hashes)
+                      if nt and (i == 0 or nt != hashes[i-1])]
+            result[user] = [cracked.get(nt) for nt in hashes]
+        return result
+
+    def hashes_by_account(self):
+        """Dictionary mapping each account to its NT hash"""
+        return {user: nt for nt, users in self._accounts.items()
+                for user in users}
+
+    def account_counts(self):
+        """Dictionary mapping each unique NT hash to the number of accounts
+        using it"""
+        return {nt: len(users) for nt, users in self._accounts.items()}
+
+    def account_hashes(self):
+        """List of NT hashes with one entry per account"""
+        return [nt for nt, users in self._accounts.items() for _ in users]
+
+    def hashes_of(self, names):
+        """Return the set of NT hashes used by the accounts with the given
+        names, ignoring the domain part and the case"""
+        names = {n.upper() for n in names}
+        return {
+            nt for nt, users in self._accounts.items()
+            for user in users
+            if user.rpartition('\\')[2].upper() in names
+        }
+
+    def write(self, path, exclude=(), include=None):
+        """Write all unique hashes not in `exclude` to a file in pwdump format
+
+        If `include` is given, only write those hashes. The NT hash takes the
+        place of the user name, so the cracker's results can be mapped back
+        to the accounts. Return the number of hashes written."""
+        count = 0
+        with open(path, 'w') as f:
+            for nt in self.all_hashes:
+                if nt in exclude or (include is not None
+                                     and nt not in include):
+                    continue
+                lm = self._lm.get(nt, EMPTY_LM)
+                f.write("%s:0:%s:%s:::\n" % (nt, lm, nt))
+                count += 1
+        return count
+
+    def expand(self, cracked):
+        """Turn a dictionary mapping NT hashes to passwords into one that
+        maps accounts to passwords"""
+        return {
+            user: password
+            for nt, password in cracked.items()
+            for user in self._accounts.get(nt, [])
+        }
@@ -1,19 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
 from logging import getLogger
-from threading import Thread
+from threading import Thread, Event
 from tempfile import TemporaryDirectory
 import os
-from datetime import datetime as dt
+import shutil
+from datetime import datetime as dt, timedelta
 import shlex
 
 from .smb import get_hashes
 from .cracker import get_cracker
-from .reports import create_text_report, create_report
+from .distributed import Coordinator, parse_address
+from .engines import get_engine_info
+from .cache import lookup_cracked, store_cracked, lookup_resisted, \
+    store_resisted
+from .hashes import HashIndex, parse_pwdump
+from .breach import BreachIndex
+from .plan import parse_attack_plan, tier_stages, fingerprint_plan
+from .reports import create_text_report, create_report, \
+    get_domain_breakdown, report_to_dict, report_from_dict
 from .email import send_mails
 from .constants import AuditState, FINISHED_STATES
 from .ldap import ldap_query
+from .wordlist import write_wordlist, LDAP_ATTRIBUTES, LDAP_FILTER
+from . import accounts
+from . import checkpoint
+from . import lm
+from .sampling import draw_sample, extrapolate
 
 log = getLogger(__name__)
 
+# Seconds between checks of the cracking budget and window
+SUPERVISE_INTERVAL = 10
+# Names of the checkpoints in the working directory holding the replicated
+# hashes, the results of the cracking stage and the report
+HASH_DUMP = 'hashes.enc'
+CRACKED = 'cracked.enc'
+REPORT = 'report.enc'
+# Marks that the users have been notified, so they are not notified twice
+NOTIFIED = 'notified'
+# Attempts to send the notifications again and the seconds between them
+NOTIFY_RETRIES = 3
+NOTIFY_RETRY_INTERVAL = 300
+# Number of domains of a forest audit which are replicated at the same time
+MAX_REPLICATIONS = 4
+
 
 ADMIN_MSG = """
 This is the report of the latest Crack-O-Matic audit.
@@ -28,25 +58,110 @@ End: %(END)s
 %(CRACKED_LIST)s"""
 
 
+class JobSuspended(Exception):
+    """Raised when a job is interrupted so it can be resumed later"""
+    pass
+
+
+def get_work_dir(audit_uuid):
+    """Return the path of the persistent working directory of an audit"""
+    from xdg.BaseDirectory import save_data_path
+    return os.path.join(save_data_path('crackomatic', 'jobs'), audit_uuid)
+
+
+def can_resume(audit_uuid):
+    """Check whether an interrupted audit has left enough data behind to be
+    resumed"""
+    return os.path.exists(os.path.join(get_work_dir(audit_uuid), HASH_DUMP))
+
+
+def notifications_pending(audit_uuid):
+    """Check whether a failed audit got as far as sending the notifications,
+    so it can be resumed with that stage"""
+    return os.path.exists(os.path.join(get_work_dir(audit_uuid), REPORT))
+
+
+def remove_work_dir(audit_uuid):
+    shutil.rmtree(get_work_dir(audit_uuid), ignore_errors=True)
+
+
+def in_window(now, start, end):
+    """Check whether the time of day `now` lies within the window from
+    `start` to `end` (strings in the format HH:MM)
+
+    The window may span midnight, e.g. from 20:00 to 06:00."""
+    if not start or not end:
+        return True
+    now = now.strftime('%H:%M')
+    if start <= end:
+        return start <= now < end
+    return now >= start or now < end
+
+
+def parse_domains(value):
+    """Turn a comma or space separated list of domains into a list"""
+    return [d for d in (value or '').replace(',', ' ').split() if d]
+
+
+def dump(records, f):
+    """Write each record to the file object `f` while passing it on"""
+    for record in records:
+        f.write("%s\n" % record)
+        yield record
+
+
 class Job(Thread):
     def __init__(self, audit, lock, cracker_config, email_config,
-                 cb_update=None, cb_cleanup=None, password=None):
+                 cb_update=None, cb_cleanup=None, password=None,
+                 resume=False, crack_lock=None):
         self.audit = audit
         log.debug("Starting job for audit %s" % self.audit.uuid)
         self.lock = lock
+        # Shared by all jobs using the same cracker, so only one of them
+        # cracks at a time
+        self.crack_lock = crack_lock
+        self._holds_crack_lock = False
+        # True while waiting for another job to finish cracking
+        self.waiting = False
         self.cracker_config = cracker_config
         self.email_config = email_config
         self.cb_update = cb_update  # cb = callback
         self.cb_cleanup = cb_cleanup
         self.password = password
         self.cracker = None
+        self.index = None
+        # NT hashes cracked so far
+        self.cracked = {}
+        # NT hashes to crack if the audit only cracks a sample
+        self.sample = None
+        # NT hashes which resisted the same attack plan in an earlier audit
+        self.resisted = set()
+        # The hash file attacked with all stages of the attack plan, and
+        # whether they all ran to completion
+        self._full_hash_file = None
+        self.exhausted = False
+        # LDAP filter -> attributes and the future result of the query
+        self._directory = {}
+        # The audited domain followed by further domains of the forest
+        self.domains = [self.audit.domain] + [
+            d for d in parse_domains(self.audit.get('child_domains'))
+            if d.lower() != self.audit.domain.lower()
+        ]
 
         self.report = None
         self.text_report = "Report not yet generated"
-        self._root_dir = TemporaryDirectory(
-            prefix='crackomatic_job',
-            suffix=self.audit.uuid,
-        )
+        # Continue an audit that was interrupted earlier
+        self.resume = resume
+        self._suspended = Event()
+        if self.audit.uuid:
+            # Keep the data of the audit across restarts, so it can be
+            # resumed
+            self._tmp_dir = None
+            self.work_dir = get_work_dir(self.audit.uuid)
+        else:
+            # Server-less audits can't be resumed
+            self._tmp_dir = TemporaryDirectory(prefix='crackomatic_job')
+            self.work_dir = self._tmp_dir.name
         super().__init__()
 
     def update_state(self, state):
@@ -64,65 +179,730 @@ class Job(Thread):
         self.lock.acquire()
         self.lock.release()
 
+    def suspend(self):
+        """Interrupt the job such that it can be resumed later
+
+        Only the replication and the cracking stage can be interrupted; the
+        remaining stages are quick and run to completion."""
+        self._suspended.set()
+        if self.cracker:
+            self.cracker.suspend()
+
+    def _remove_work_dir(self):
+        if self._tmp_dir:
+            self._tmp_dir.cleanup()
+        else:
+            remove_work_dir(self.audit.uuid)
+
     def run(self):
+        suspended = False
+        keep_work_dir = False
         try:
             self.lock.acquire()
-            self.update_state(AuditState.REPLICATING)
-            hashes = get_hashes(
-                self.audit.domain,
-                self.audit.user,
-                self.password or self.audit.password,
-                ip=self.audit.dc_ip,
-                root_dir=self._root_dir.name,
-            )
-            self.update_state(AuditState.CRACKING)
-            hash_file = os.path.join(self._root_dir.name, 'hashfile')
-            with open(hash_file, 'w') as f:
-                f.write(hashes)
-            self.cracker = get_cracker(
-                self.cracker_config['cracker'],
-                hash_file,
-                self.cracker_config['wordlist_path'],
-                self.cracker_config['rule_path'],
-                self.cracker_config['binary_path'],
-                root_dir=self._root_dir.name,
-                args=shlex.split(self.cracker_config.get('additional_args')),
-            )
-            self.cracker.wait_until_finished()
-            if self.cracker.passwords is None:
-                raise RuntimeError(
-                    "Something went wrong while cracking; check the logs"
+            os.makedirs(self.work_dir, mode=0o700, exist_ok=True)
+            self.prefetch_directory()
+            hash_dump = os.path.join(self.work_dir, HASH_DUMP)
+            if self.resume and os.path.exists(hash_dump):
+                log.info("Resuming audit with ID %s" % self.audit.uuid)
+                index = HashIndex.from_records(
+                    parse_pwdump(checkpoint.read_lines(hash_dump))
+                )
+            else:
+                self.update_state(AuditState.REPLICATING)
+                records = self.replicate()
+                if self._tmp_dir:
+                    # Server-less audits can't be resumed anyway
+                    index = HashIndex.from_records(records)
+                else:
+                    # The records are written and indexed in a single pass
+                    with checkpoint.Writer(hash_dump) as f:
+                        index = HashIndex.from_records(dump(records, f))
+            self.index = index
+            results = self.load_checkpoint(CRACKED)
+            if results:
+                log.info("Audit with ID %s has already been cracked"
+                         % self.audit.uuid)
+                cracked = results['cracked']
+                breached = results['breached']
+                if results['sample'] is not None:
+                    self.sample = set(results['sample'])
+            else:
+                self.update_state(AuditState.CRACKING)
+                cracked, breached = self.crack_all()
+                self.save_checkpoint(CRACKED, dict(
+                    cracked=cracked,
+                    breached=breached,
+                    sample=None if self.sample is None else list(self.sample),
+                ))
+            passwords = index.expand(cracked)
+            sample = None
+            analyzed = passwords
+            if self.sample is not None:
+                # Cached passwords outside of the sample would skew the
+                # statistics
+                sample = extrapolate(index, self.sample, cracked)
+                analyzed = index.expand({nt: p for nt, p in cracked.items()
+                                         if nt in self.sample})
+            results = self.load_checkpoint(REPORT)
+            if results:
+                self.report = report_from_dict(results['report'])
+                self.text_report = results['text_report']
+            else:
+                self.update_state(AuditState.ANALYZING)
+                domains = None
+                if len(self.domains) > 1:
+                    domains = self.get_domain_breakdown(analyzed, breached)
+                self.analyze(
+                    [p for p in analyzed.values() if p is not None],
+                    index.account_hashes(),
+                    breached,
+                    sample,
+                    index.password_histories(cracked),
+                    domains,
                 )
-            self.update_state(AuditState.ANALYZING)
-            passwords = [p for p in self.cracker.passwords.values()
-                         if p is not None]
-            hashes = [h.split(':')[3] for h in hashes.splitlines()]
-            self.analyze(passwords, hashes)
-            users = list(self.cracker.passwords.keys())
+                self.save_checkpoint(REPORT, dict(
+                    report=report_to_dict(self.report),
+                    text_report=self.text_report,
+                ))
+            users = list(passwords.keys())
+            breached_users = {
+                user: breached[nt]
+                for nt in (breached or {})
+                for user in index.expand({nt: None})
+            }
             self.update_state(AuditState.SENDING_EMAILS)
-            self.send_notifications(users)
+            self.notify(users, breached_users)
             self.update_state(AuditState.FINISHED)
+        except JobSuspended:
+            suspended = True
+            log.info("Audit with ID %s has been suspended and will be"
+                     " resumed on the next start" % self.audit.uuid)
         except Exception as e:
+            # The audit is failed, but if only the notifications could not be
+            # sent, the checkpoints are kept so that stage alone is repeated
+            # on the next start
+            keep_work_dir = (self.audit.state == AuditState.SENDING_EMAILS
+                             and not self._tmp_dir)
             self.update_state(AuditState.FAILED)
             log.exception(e)
             raise e
         finally:
             try:
-                if self.cb_cleanup:
+                if self.cb_cleanup and not suspended:
                     self.cb_cleanup(self.audit.uuid)
             finally:
                 self.lock.release()
-                self._root_dir.cleanup()
+                if not suspended and not keep_work_dir:
+                    self._remove_work_dir()
 
-    def get_email_addresses(self, filter, audit):
-        dn = 'DC=' + ',DC='.join(audit.domain.split('.'))
-        bind = "%s@%s" % (audit.user, audit.domain)
-        emails = ldap_query(
+    def crack_all(self):
+        """Check the hashes against the breach corpus and the cache and crack
+        the remaining ones
+
+        Return a dictionary mapping NT hashes to passwords and one mapping
+        breached NT hashes to their prevalence, or None."""
+        index = self.index
+        breached = None
+        if self.cracker_config.get('breach_index'):
+            breached = self.check_breaches(index.hashes)
+        cracked = {}
+        if self.cracker_config.get('use_cache'):
+            cracked = lookup_cracked(index.all_hashes)
+        self.cracked = dict(cracked)
+        stages = self.get_stages()
+        plan = None
+        if self.cracker_config.get('skip_resisted'):
+            plan = self.get_plan_fingerprint(stages)
+        if plan:
+            # Hashes with an LM hash are attacked through it in each audit,
+            # which the plan doesn't cover
+            lm_hashes = set(index.lm_hashes)
+            self.resisted = lookup_resisted(
+                [nt for nt in index.all_hashes
+                 if nt not in cracked and nt not in lm_hashes],
+                plan,
+            )
+            log.info("Skipping %d hashes which resisted the attack plan"
+                     " before" % len(self.resisted))
+        if self.audit.get('sample_size'):
+            self.sample = self.get_sample()
+        # Only crack what we don't know yet
+        hash_file = os.path.join(self.work_dir, 'hashfile')
+        if index.write(hash_file, exclude=set(cracked) | self.resisted,
+                       include=self.sample):
+            try:
+                new = self.crack(hash_file, stages)
+            finally:
+                self._release_cracker()
+            if self.cracker_config.get('use_cache'):
+                store_cracked(new)
+            cracked.update(new)
+            if plan and self.exhausted:
+                self.remember_resisted(new, plan)
+        return cracked, breached
+
+    def get_stages(self):
+        """Return the stages of the attack plan including the wordlist
+        generated from the directory"""
+        stages = parse_attack_plan(
+            self.cracker_config.get('attack_plan'),
+            self.cracker_config['wordlist_path'],
+            self.cracker_config['rule_path'],
+            self.cracker_config['cracker'],
+        )
+        if self.cracker_config.get('targeted_wordlist'):
+            wordlist = self.build_wordlist()
+            if wordlist:
+                # Cheap, so it goes first
+                stages.insert(0, dict(
+                    attack='wordlist',
+                    wordlist=wordlist,
+                    name='organisation',
+                    generated=True,
+                ))
+        return stages
+
+    def get_plan_fingerprint(self, stages):
+        """Return the fingerprint of the stages or None"""
+        # Not critical; all hashes are cracked without it
+        try:
+            return fingerprint_plan(
+                stages,
+                self.cracker_config['cracker'],
+                self.cracker_config.get('additional_args'),
+            )
+        except Exception as e:
+            log.error("Could not determine the fingerprint of the attack"
+                      " plan: %s" % e)
+            return None
+
+    def remember_resisted(self, passwords, plan):
+        """Remember the hashes which resisted all stages of the attack plan,
+        so the next audit skips them"""
+        # This step is not critical, so we wrap it in a try-block
+        try:
+            with open(self._full_hash_file, 'r') as f:
+                # The NT hash takes the place of the user name
+                attacked = set(line.split(':')[0] for line in f if line)
+            resisted = attacked - set(passwords)
+            store_resisted(resisted, plan)
+            log.info("%d hashes resisted the attack plan" % len(resisted))
+        except Exception as e:
+            log.error("An error occurred while storing the hashes which"
+                      " resisted the attack plan in audit with ID %s"
+                      % self.audit.uuid)
+            log.exception(e)
+
+    def save_checkpoint(self, name, data):
+        """Save the results of a stage, so the audit can be resumed after
+        it"""
+        if self._tmp_dir:
+            return
+        checkpoint.save(os.path.join(self.work_dir, name), data)
+
+    def load_checkpoint(self, name):
+        """Return the results of a stage if the audit is resumed after it"""
+        if not self.resume:
+            return None
+        return checkpoint.load(os.path.join(self.work_dir, name))
+
+    def notify(self, users, breached_users):
+        """Send the notifications and retry if that fails
+
+        The results are kept meanwhile, so even a restart of the service
+        only repeats this stage."""
+        for attempt in range(NOTIFY_RETRIES + 1):
+            try:
+                return self.send_notifications(users, breached_users)
+            except Exception as e:
+                if attempt == NOTIFY_RETRIES:
+                    raise
+                log.error("Sending the notifications of audit with ID %s"
+                          " failed, retrying in %d seconds: %s" % (
+                              self.audit.uuid, NOTIFY_RETRY_INTERVAL, e))
+                if self._suspended.wait(NOTIFY_RETRY_INTERVAL):
+                    raise JobSuspended()
+
+    def _acquire_cracker(self, deadline):
+        """Wait until no other job is cracking with the same cracker
+
+        Return False if the time budget was exhausted in the meantime."""
+        if not self.crack_lock:
+            return True
+        if not self.crack_lock.acquire(blocking=False):
+            log.info("Audit %s is waiting for another audit to finish"
+                     " cracking" % self.audit.uuid)
+            self.waiting = True
+            try:
+                while not self.crack_lock.acquire(timeout=SUPERVISE_INTERVAL):
+                    if self._suspended.is_set():
+                        raise JobSuspended()
+                    if deadline and dt.now() >= deadline:
+                        log.info("Time budget of audit %s exhausted"
+                                 % self.audit.uuid)
+                        return False
+            finally:
+                self.waiting = False
+        self._holds_crack_lock = True
+        return True
+
+    def _release_cracker(self):
+        if self._holds_crack_lock:
+            self._holds_crack_lock = False
+            self.crack_lock.release()
+
+    def crack(self, hash_file, stages):
+        """Run the cracker on a file of deduplicated hashes with the stages
+        of the attack plan
+
+        Return a dictionary mapping NT hashes to passwords."""
+        self.exhausted = False
+        window = (self.audit.get('window_start'),
+                  self.audit.get('window_end'))
+        deadline = None
+        if self.audit.get('max_duration'):
+            deadline = dt.now() + timedelta(
+                hours=int(self.audit.get('max_duration'))
+            )
+            # The budget is not renewed when the audit is resumed
+            deadline_file = os.path.join(self.work_dir, 'deadline')
+            if self.resume and os.path.exists(deadline_file):
+                with open(deadline_file, 'r') as f:
+                    deadline = dt.fromisoformat(f.read().strip())
+            with open(deadline_file, 'w') as f:
+                f.write(deadline.isoformat())
+        if not in_window(dt.now(), *window):
+            log.info("Waiting for the cracking window of audit %s to open"
+                     % self.audit.uuid)
+            while not in_window(dt.now(), *window):
+                if deadline and dt.now() >= deadline:
+                    log.info("Time budget of audit %s exhausted"
+                             % self.audit.uuid)
+                    return {}
+                if self._suspended.wait(SUPERVISE_INTERVAL):
+                    break
+        if self._suspended.is_set():
+            raise JobSuspended()
+        if not self._acquire_cracker(deadline):
+            return {}
+        version = None
+        try:
+            version = get_engine_info(
+                self.cracker_config['cracker'],
+                self.cracker_config['binary_path'],
+            ).version
+        except Exception as e:
+            log.error("Could not probe the cracker: %s" % e)
+        lm_wordlist = self.crack_lm(window, deadline, version)
+        args = [
+            self.cracker_config['cracker'],
+            hash_file,
+            self.cracker_config['wordlist_path'],
+            self.cracker_config['rule_path'],
+            self.cracker_config['binary_path'],
+        ]
+        stages = list(stages)
+        if lm_wordlist:
+            # Cracks the NT hashes of the LM hashes in no time
+            stages.insert(0, dict(
+                attack='wordlist',
+                wordlist=lm_wordlist,
+                name='LM passwords',
+                generated=True,
+            ))
+        if self.audit.get('priority_filter'):
+            stages = self.prioritize(stages)
+        # The first tier faces all stages
+        self._full_hash_file = stages[0].get('hash_file', hash_file)
+        kwargs = dict(
+            root_dir=self.work_dir,
+            args=shlex.split(self.cracker_config.get('additional_args')),
+            stages=stages,
+            restore=self.resume,
+            cb_cracked=self.on_cracked,
+            version=version,
+        )
+        workers = int(self.cracker_config.get('workers') or 0)
+        if workers:
+            self.cracker = Coordinator(
+                *args,
+                workers=workers,
+                address=parse_address(
+                    self.cracker_config['coordinator_address']
+                ),
+                authkey=self.cracker_config['worker_key'].encode(),
+                **kwargs,
+            )
+        else:
+            self.cracker = get_cracker(*args, **kwargs)
+        # In case we were suspended while the cracker was being created
+        if self._suspended.is_set():
+            self.cracker.suspend()
+        completed = self.supervise(window, deadline)
+        if self._suspended.is_set():
+            raise JobSuspended()
+        if self.cracker.passwords is None:
+            raise RuntimeError(
+                "Something went wrong while cracking; check the logs"
+            )
+        # Only a successful run shows that the remaining hashes resisted
+        self.exhausted = completed
+        return dict(self.cracker.passwords)
+
+    def crack_lm(self, window, deadline, version=None):
+        """Crack the LM hashes, if there are any
+
+        Return the path of a wordlist with all case variants of their
+        passwords or None."""
+        path = os.path.join(self.work_dir, 'lm.txt')
+        if self.resume and os.path.exists(path):
+            return path if os.path.getsize(path) else None
+        include = set(self.index.lm_hashes)
+        if self.sample is not None:
+            include &= self.sample
+        root_dir = os.path.join(self.work_dir, 'lm')
+        os.makedirs(root_dir, mode=0o700, exist_ok=True)
+        hash_file = os.path.join(root_dir, 'hashfile')
+        count = self.index.write(hash_file,
+                                 exclude=set(self.cracked) | self.resisted,
+                                 include=include)
+        if not count:
+            return None
+        log.info("Cracking %d LM hashes first" % count)
+        # This step is not critical, so we wrap it in a try-block
+        try:
+            wordlist = self.cracker_config['wordlist_path']
+            self.cracker = get_cracker(
+                self.cracker_config['cracker'],
+                hash_file,
+                wordlist,
+                self.cracker_config['rule_path'],
+                self.cracker_config['binary_path'],
+                root_dir=root_dir,
+                args=shlex.split(self.cracker_config.get('additional_args')),
+                stages=lm.get_stages(wordlist),
+                restore=self.resume,
+                version=version,
+                hash_type='lm',
+            )
+            if self._suspended.is_set():
+                self.cracker.suspend()
+            self.supervise(window, deadline)
+            if self._suspended.is_set():
+                raise JobSuspended()
+            passwords = self.cracker.passwords
+            if passwords is None:
+                raise RuntimeError("Cracking the LM hashes failed")
+            log.info("Cracked %d of %d LM hashes" % (len(passwords), count))
+            # Also written if empty, so a resumed audit does not start over
+            if lm.write_candidates(path, passwords.values()):
+                return path
+        except JobSuspended:
+            raise
+        except Exception as e:
+            log.error("An error occurred while cracking the LM hashes of"
+                      " audit with ID %s" % self.audit.uuid)
+            log.exception(e)
+        finally:
+            self.cracker = None
+        return None
+
+    def check_breaches(self, nt_hashes):
+        """Return a dictionary mapping the NT hashes which appear in the
+        breach corpus to their prevalence, or None if that failed"""
+        # This step is not critical, so we wrap it in a try-block
+        try:
+            with BreachIndex(self.cracker_config['breach_index']) as corpus:
+                breached = corpus.lookup(nt_hashes)
+            log.info("%d of %d hashes appear in breaches"
+                     % (len(breached), len(nt_hashes)))
+            return breached
+        except Exception as e:
+            log.error("An error occurred while checking the hashes of audit"
+                      " with ID %s against the breach corpus"
+                      % self.audit.uuid)
+            log.exception(e)
+        return None
+
+    def replicate(self):
+        """Replicate all domains of the audit and return an iterable of
+        their `HashRecord`s
+
+        The domains of a forest audit are replicated in parallel and their
+        hashes are cracked together, which also reveals passwords shared
+        across domains."""
+        if len(self.domains) == 1:
+            return self._replicate(self.domains[0])
+        log.info("Replicating %d domains" % len(self.domains))
+        with ThreadPoolExecutor(max_workers=MAX_REPLICATIONS) as executor:
+            futures = [executor.submit(lambda d: list(self._replicate(d)), d)
+                       for d in self.domains]
+            # Keep the order of the domains
+            return [r for future in futures for r in future.result()]
+
+    def _replicate(self, domain):
+        audit = self.audit
+        history = bool(self.cracker_config.get('password_history'))
+        if domain == audit.domain:
+            records = get_hashes(
+                audit.domain,
+                audit.user,
+                self.password or audit.password,
+                ip=audit.dc_ip,
+                root_dir=self.work_dir,
+                history=history,
+            )
+            return self.filter_accounts(records)
+        # The account of the audit is a member of the root domain. Each
+        # child domain is replicated from one of its own DCs.
+        root_dir = os.path.join(self.work_dir, domain)
+        os.makedirs(root_dir, mode=0o700, exist_ok=True)
+        records = get_hashes(
+            domain,
+            "%s@%s" % (audit.user, audit.domain),
+            self.password or audit.password,
+            root_dir=root_dir,
+            history=history,
+        )
+        # The directory of the audited domain knows nothing about the
+        # accounts of other domains, so only their flags count
+        return self.filter_accounts(self._qualify(records, domain),
+                                    use_directory=False)
+
+    def _qualify(self, records, domain):
+        """Prefix the account names of another domain with that domain"""
+        for record in records:
+            name = record.user.rpartition('\\')[2]
+            record.user = "%s\\%s" % (domain, name)
+            yield record
+
+    def domain_of(self, user):
+        """Return the domain an account in the hash index belongs to"""
+        prefix = user.rpartition('\\')[0].lower()
+        for domain in self.domains[1:]:
+            if prefix == domain.lower():
+                return domain
+        return self.audit.domain
+
+    def get_domain_breakdown(self, passwords, breached=None):
+        """Return the results of each domain of a forest audit and the share
+        of accounts whose password is used in another domain as well"""
+        accounts = {d: {} for d in self.domains}
+        for user, nt in self.index.hashes_by_account().items():
+            if self.sample is None or nt in self.sample:
+                accounts[self.domain_of(user)][user] = nt
+        return get_domain_breakdown(accounts, passwords, breached)
+
+    def prefetch_directory(self):
+        """Start all LDAP queries of the audit in the background
+
+        They run while the hashes are being replicated and cracked, so the
+        results are available right away when they are needed. Queries with
+        the same filter are merged."""
+        audit = self.audit
+        queries = {}
+
+        def add(filter, attributes):
+            if filter:
+                queries.setdefault(filter, set()).update(attributes)
+
+        add(audit.user_filter, ['sAMAccountName', audit.email_field])
+        add(audit.admin_filter, ['sAMAccountName', audit.email_field])
+        if self.cracker_config.get('targeted_wordlist'):
+            add(LDAP_FILTER, LDAP_ATTRIBUTES)
+        if self.cracker_config.get('ldap_accounts'):
+            add(accounts.LDAP_FILTER, accounts.LDAP_ATTRIBUTES)
+        add(audit.get('priority_filter'), ['sAMAccountName'])
+        if not queries:
+            return
+        executor = ThreadPoolExecutor(max_workers=len(queries))
+        for filter, attributes in queries.items():
+            self._directory[filter] = (attributes, executor.submit(
+                self._query_directory, filter, sorted(attributes),
+            ))
+        # Don't wait for the queries here
+        executor.shutdown(wait=False)
+
+    def _query_directory(self, filter, attributes):
+        audit = self.audit
+        return ldap_query(
             audit.ldap_url,
-            dn,
+            'DC=' + ',DC='.join(audit.domain.split('.')),
             audit.ca_file,
-            bind,
-            self.password,
+            "%s@%s" % (audit.user, audit.domain),
+            self.password or audit.password,
+            filter,
+            attributes,
+        )
+
+    def query_directory(self, filter, attributes):
+        """Return the result of an LDAP query, waiting for the prefetched
+        one if there is one
+
+        Entries may contain more attributes than requested. A prefetched
+        query which failed is dropped and run again, so retries don't keep
+        raising the same error."""
+        attributes_fetched, future = self._directory.get(filter, (set(), None))
+        if future and set(attributes) <= attributes_fetched:
+            try:
+                return future.result()
+            except Exception as e:
+                log.warning("Prefetched LDAP query failed, trying again: %s"
+                            % e)
+                self._directory.pop(filter, None)
+        return self._query_directory(filter, attributes)
+
+    def build_wordlist(self):
+        """Generate a wordlist from attributes in the directory
+
+        Return its path or None if that failed."""
+        path = os.path.join(self.work_dir, 'organisation.txt')
+        if self.resume and os.path.exists(path):
+            return path
+        # This step is not critical, so we wrap it in a try-block
+        try:
+            entries = self.query_directory(LDAP_FILTER, LDAP_ATTRIBUTES)
+            if write_wordlist(path, entries, self.audit.domain):
+                return path
+        except Exception as e:
+            log.error("An error occurred while generating the wordlist for"
+                      " audit with ID %s" % self.audit.uuid)
+            log.exception(e)
+        return None
+
+    def filter_accounts(self, records, use_directory=True):
+        """Remove the accounts which the cracker config asks to skip"""
+        skip = accounts.get_skipped_categories(self.cracker_config)
+        if not skip:
+            return records
+        directory = None
+        stale_before = None
+        if self.cracker_config.get('ldap_accounts') and use_directory:
+            # Not critical either; the flags from the replication remain
+            try:
+                directory = accounts.parse_ldap_entries(self.query_directory(
+                    accounts.LDAP_FILTER,
+                    accounts.LDAP_ATTRIBUTES,
+                ))
+            except Exception as e:
+                log.error("An error occurred while retrieving the accounts"
+                          " of audit with ID %s from LDAP" % self.audit.uuid)
+                log.exception(e)
+            if directory and self.cracker_config.get('stale_days'):
+                stale_before = dt.now() - timedelta(
+                    days=int(self.cracker_config['stale_days'])
+                )
+        return accounts.filter_records(
+            records,
+            skip,
+            directory,
+            stale_before,
+        )
+
+    def get_sample(self):
+        """Draw a random sample of the unique hashes, or read it back if the
+        audit is being resumed"""
+        path = os.path.join(self.work_dir, 'sample')
+        if self.resume and os.path.exists(path):
+            with open(path, 'r') as f:
+                return set(f.read().split())
+        sample = draw_sample(self.index, int(self.audit.sample_size) / 100)
+        with open(path, 'w') as f:
+            f.write('\n'.join(sorted(sample)))
+        log.info("Cracking a sample of %d of %d hashes"
+                 % (len(sample), len(self.index.hashes)))
+        return sample
+
+    def get_priority_hashes(self):
+        """Return the set of NT hashes of accounts matching the priority
+        filter or None if that failed"""
+        # This step is not critical, so we wrap it in a try-block
+        try:
+            entries = self.query_directory(
+                self.audit.priority_filter,
+                ['sAMAccountName'],
+            )
+            return self.index.hashes_of(
+                v['sAMAccountName'][0].decode() for v in entries.values()
+                if 'sAMAccountName' in v
+            )
+        except Exception as e:
+            log.error("An error occurred while looking up the priority"
+                      " accounts of audit with ID %s" % self.audit.uuid)
+            log.exception(e)
+        return None
+
+    def prioritize(self, stages):
+        """Split the hashes into tiers
+
+        The hashes of priority accounts are attacked with all stages before
+        the remaining hashes are attacked with the cheap stages only."""
+        tiers = [os.path.join(self.work_dir, 'priority'),
+                 os.path.join(self.work_dir, 'others')]
+        # The stages must not change when the audit is resumed
+        if not self.resume:
+            priority = self.get_priority_hashes()
+            if not priority:
+                return stages
+            exclude = set(self.cracked) | self.resisted
+            if self.sample is not None:
+                priority &= self.sample
+            count = self.index.write(tiers[0], exclude=exclude,
+                                     include=priority)
+            self.index.write(tiers[1], exclude=exclude | priority,
+                             include=self.sample)
+            log.info("%d hashes of priority accounts are attacked first"
+                     % count)
+        if not os.path.exists(tiers[0]):
+            return stages
+        # Crackers refuse to run without hashes
+        tiers = [t for t in tiers if os.path.getsize(t)]
+        return tier_stages(stages, tiers,
+                           self.cracker_config['wordlist_path'])
+
+    def on_cracked(self, passwords):
+        """Called by the cracker with NT hashes as soon as they are cracked"""
+        self.cracked.update(passwords)
+        # Don't lose them if the audit is interrupted
+        if self.cracker_config.get('use_cache'):
+            store_cracked(passwords)
+
+    def get_cracked_accounts(self):
+        """Return the number of accounts cracked so far"""
+        if not self.index:
+            return 0
+        return len(self.index.expand(dict(self.cracked)))
+
+    def supervise(self, window, deadline):
+        """Wait for the cracker while enforcing the time budget and the
+        cracking window of the audit
+
+        When the deadline has passed, the cracker is stopped and the passwords
+        cracked so far are used. Outside of the window, the cracker is
+        paused. Return False if the cracker was stopped."""
+        stopped = False
+        while not self.cracker.wait_until_finished(
+            timeout=SUPERVISE_INTERVAL
+        ):
+            now = dt.now()
+            if deadline and now >= deadline:
+                if not stopped:
+                    log.info("Time budget of audit %s exhausted"
+                             % self.audit.uuid)
+                    self.cracker.stop()
+                    stopped = True
+            elif not in_window(now, *window):
+                if not self.cracker.paused:
+                    log.info("Pausing audit %s outside of its cracking window"
+                             % self.audit.uuid)
+                    self.cracker.pause()
+            elif self.cracker.paused:
+                log.info("Resuming audit %s" % self.audit.uuid)
+                self.cracker.resume()
+        return not stopped
+
+    def get_email_addresses(self, filter, audit):
+        emails = self.query_directory(
             filter,
             ['sAMAccountName', audit.email_field],
         )
@@ -134,11 +914,20 @@ class Job(Thread):
         }
         return emails
 
-    def send_notifications(self, compromised_users):
+    def send_notifications(self, cracked_users, breached_users={}):
         from .constants import URL
         audit = self.audit
+        # Breached passwords are as good as cracked
+        cracked = set(cracked_users)
+        compromised_users = list(cracked_users) + [
+            u for u in breached_users if u not in cracked
+        ]
         user_emails = self.get_email_addresses(audit.user_filter, audit)
         admin_emails = self.get_email_addresses(audit.admin_filter, audit)
+        # The directory only contains the accounts of the audited domain;
+        # accounts of other domains with the same name are different people
+        compromised_users = [u for u in compromised_users
+                             if self.domain_of(u) == audit.domain]
         # Only inform compromised users
         user_emails = [
             user_emails.get(u.split('\\')[1].upper()) if '\\' in u else
@@ -147,19 +936,29 @@ class Job(Thread):
         # Remove invalid entries
         user_emails = [address for address in user_emails
                        if address and '@' in address]
-        if user_emails:
-            send_mails(
+        notified = os.path.join(self.work_dir, NOTIFIED)
+        if user_emails and not os.path.exists(notified):
+            if not send_mails(
                 user_emails,
                 audit.subject,
                 audit.message,
                 self.email_config,
-            )
+            ):
+                raise RuntimeError("Could not notify the users")
+        # In case sending the report to the admins fails
+        open(notified, 'w').close()
 
         # Send report to admins
         if audit.include_cracked:
             cracked_list = (
                 "\n\nThe following users' passwords were recovered:\n\n"
-            ) + '\n'.join(sorted(compromised_users))
+            ) + '\n'.join(sorted(cracked_users))
+            if breached_users:
+                cracked_list += (
+                    "\n\nThe following users' passwords appear in known"
+                    " breaches (number of occurrences in parentheses):\n\n"
+                ) + '\n'.join("%s (%d)" % (u, c)
+                              for u, c in sorted(breached_users.items()))
         else:
             cracked_list = ""
         url = ("%s/report?id=%s" % (URL, audit.uuid)) if URL else ''
@@ -173,19 +972,22 @@ class Job(Thread):
         admin_emails = list(admin_emails.values())
 
         if admin_emails:
-            send_mails(
+            if not send_mails(
                 admin_emails,
                 "Crack-O-Matic: Report",
                 admin_msg,
                 self.email_config,
-            )
+            ):
+                raise RuntimeError("Could not send the report to the admins")
         else:
             log.error("No admin e-mail addresses found")
 
-    def analyze(self, passwords, hashes):
+    def analyze(self, passwords, hashes, breached=None, sample=None,
+                histories=None, domains=None):
         # This step is not critical, so we wrap it in a try-block
         try:
-            self.report = create_report(passwords, hashes)
+            self.report = create_report(passwords, hashes, breached, sample,
+                                        histories, domains)
             self.text_report = create_text_report(self.report)
         except Exception as e:
             log.error("An error occurred while creating the report for audit with ID %s"  # noqa
@@ -0,0 +1,77 @@
+"""Crack LM hashes first where they still exist
+
+An LM hash consists of two DES hashes of seven upper case characters each,
+which take no time to crack. The case-insensitive password then cracks the
+NT hash of the same account almost instantly by trying all variants of its
+case.
+"""
+
+import itertools
+from logging import getLogger
+
+from .cracker import decode_password
+from .hashes import EMPTY_LM
+
+log = getLogger(__name__)
+
+EMPTY_HALF = EMPTY_LM[:16]
+# LM converts the password to upper case
+CHARSET = '?u?d?s'
+MASK = '?1' * 7
+# Limit for the brute force attack in seconds
+MAX_RUNTIME = 3600
+
+
+def get_stages(wordlist):
+    """Return the stages of the attack on the LM hashes"""
+    return [
+        dict(attack='wordlist', wordlist=wordlist, name='LM wordlist'),
+        dict(attack='mask', mask=MASK, charset1=CHARSET, increment=True,
+             max_runtime=MAX_RUNTIME, name='LM brute force'),
+    ]
+
+
+def parse_potfile(path):
+    """Return a dictionary mapping the cracked halves of LM hashes to their
+    passwords"""
+    halves = {EMPTY_HALF: ''}
+    try:
+        with open(path, 'r', errors='replace') as f:
+            for line in f:
+                half, sep, password = line.rstrip('\n').partition(':')
+                if half.startswith('$LM$'):
+                    half = half[4:]
+                if sep and len(half) == 16:
+                    halves[half.lower()] = decode_password(password)
+    except OSError:
+        pass
+    return halves
+
+
+def combine(halves, lm):
+    """Return the password of an LM hash if both halves have been cracked,
+    otherwise None"""
+    lm = lm.lower()
+    first, second = halves.get(lm[:16]), halves.get(lm[16:])
+    if first is None or second is None:
+        return None
+    return first + second
+
+
+def case_variants(password):
+    """Generate all variants of the case of a password"""
+    options = [sorted({c.lower(), c.upper()}) for c in password]
+    for chars in itertools.product(*options):
+        yield ''.join(chars)
+
+
+def write_candidates(path, passwords):
+    """Write all case variants of the passwords to a wordlist and return
+    their number"""
+    count = 0
+    with open(path, 'w') as f:
+        for password in sorted(set(passwords)):
+            for candidate in case_variants(password):
+                f.write(candidate + '\n')
+                count += 1
+    return count
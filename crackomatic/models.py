@@ -1,7 +1,7 @@
 from contextlib import contextmanager
 
-from sqlalchemy import func, create_engine, Column, Integer, String, Boolean, \
-    DateTime, Text, ForeignKey, Float
+from sqlalchemy import func, create_engine, inspect, text, Column, Integer, \
+    String, Boolean, DateTime, Text, ForeignKey, Float, BigInteger
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship, scoped_session
 
@@ -19,6 +19,26 @@ def init_db(path):
     global engine
     engine = create_engine(path, echo=False)
     Base.metadata.create_all(engine)
+    upgrade_db()
+
+
+def upgrade_db():
+    """Add columns which have been introduced after the database has been
+    created
+
+    New columns must be nullable."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = [c['name'] for c in inspector.get_columns(table.name)]
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                conn.execute(text('ALTER TABLE %s ADD COLUMN %s %s' % (
+                    table.name,
+                    column.name,
+                    column.type.compile(engine.dialect),
+                )))
 
 
 @contextmanager
@@ -69,6 +89,17 @@ class Audit(Base):
     end = Column(DateTime, nullable=True)
     state = Column(Integer, nullable=False)
     frequency = Column(Integer, nullable=True)
+    # Maximum number of hours to spend cracking
+    max_duration = Column(Integer, nullable=True)
+    # Cracking is only allowed between these times of day (HH:MM)
+    window_start = Column(String(5), nullable=True)
+    window_end = Column(String(5), nullable=True)
+    # Accounts matching this LDAP filter are attacked with all stages first
+    priority_filter = Column(String(1024), nullable=True)
+    # Percentage of the unique hashes to crack
+    sample_size = Column(Integer, nullable=True)
+    # Further domains of the forest which are cracked along with this one
+    child_domains = Column(String(1024), nullable=True)
     report = relationship(
         'Report',
         backref='audits',
@@ -94,6 +125,15 @@ class Report(Base):
     char_classes = Column(String)
     top_basewords = Column(String)
     top_patterns = Column(String)
+    breached = Column(Float, nullable=True)
+    breach_prevalence = Column(String, nullable=True)
+    sample_share = Column(Float, nullable=True)
+    cracked_low = Column(Float, nullable=True)
+    cracked_high = Column(Float, nullable=True)
+    rotation = Column(Float, nullable=True)
+    # JSON dictionary with the results of each domain of a forest audit
+    domains = Column(String, nullable=True)
+    cross_domain_reuse = Column(Float, nullable=True)
 
 
 class Event(Base):
@@ -132,6 +172,54 @@ class Config(Base):
     config_json = Column(Text)
 
 
+class CrackedHash(Base):
+    __tablename__ = 'cracked_hashes'
+    id = Column(Integer, primary_key=True)
+    # Keyed hash of the NT hash, so the database contains no NT hashes
+    fingerprint = Column(String(64), nullable=False, unique=True, index=True)
+    # Encrypted password
+    password = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+
+
+class ResistedHash(Base):
+    __tablename__ = 'resisted_hashes'
+    id = Column(Integer, primary_key=True)
+    # Keyed hash of the NT hash, see CrackedHash
+    fingerprint = Column(String(64), nullable=False, index=True)
+    # Hash of the attack plan which failed to crack it
+    plan = Column(String(64), nullable=False, index=True)
+    created_at = Column(DateTime, default=func.now())
+
+
+class LineCount(Base):
+    __tablename__ = 'line_counts'
+    id = Column(Integer, primary_key=True)
+    path = Column(String(1024), nullable=False)
+    # Whether only the rules of a rule file were counted
+    rules = Column(Boolean, nullable=False)
+    # Size and modification time of the file when it was counted
+    size = Column(BigInteger, nullable=False)
+    mtime = Column(Float, nullable=False)
+    count = Column(BigInteger, nullable=False)
+
+
+class EngineInfo(Base):
+    __tablename__ = 'engines'
+    id = Column(Integer, primary_key=True)
+    engine = Column(String(32), nullable=False)
+    binary_path = Column(String(1024), nullable=False, unique=True)
+    # Modification time of the binary when it was probed
+    mtime = Column(Float, nullable=False)
+    version = Column(Text)
+    # JSON lists
+    attacks = Column(Text)
+    devices = Column(Text)
+    # NT hashes per second
+    speed = Column(Float, nullable=True)
+    probed_at = Column(DateTime, default=func.now())
+
+
 class LocalUser(Base):
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True)
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+
+# Attack types and the parameters they require
+ATTACKS = {
+    'wordlist': ['wordlist'],
+    'rules': ['wordlist', 'rules'],
+    'mask': ['mask'],
+    'hybrid': ['wordlist', 'mask'],
+    'combinator': ['wordlist', 'wordlist2'],
+}
+
+# Optional limits of each stage
+BUDGETS = ['max_runtime', 'max_candidates']
+
+# Attacks which are cheap enough to run against all hashes
+CHEAP_ATTACKS = ['wordlist']
+# Parameters of a stage which are paths of files
+FILES = ['wordlist', 'wordlist2', 'rules']
+
+
+def default_stage(wordlist, rules):
+    """The stage that is used if there is no attack plan"""
+    if rules:
+        return dict(attack='rules', wordlist=wordlist, rules=rules)
+    return dict(attack='wordlist', wordlist=wordlist)
+
+
+def tier_stages(stages, tiers, wordlist=None):
+    """Run the stages against tiers of hashes
+
+    `tiers` is a list of hash files ordered by priority. The first tier is
+    attacked with all stages, the remaining tiers only with the cheap ones
+    afterwards. Unless one of those already is a plain pass over the
+    configured `wordlist`, they get one, so no tier goes unattacked. Raises
+    a ValueError if there would be no stage for the remaining tiers."""
+    cheap = [s for s in stages if s['attack'] in CHEAP_ATTACKS]
+    if wordlist and not any(s['wordlist'] == wordlist for s in cheap):
+        cheap.append(default_stage(wordlist, None))
+    if len(tiers) > 1 and not cheap:
+        raise ValueError("The attack plan has no stage for the remaining"
+                         " tiers")
+    result = []
+    for i, hash_file in enumerate(tiers, 1):
+        for stage in stages if i == 1 else cheap:
+            stage = dict(stage, hash_file=hash_file)
+            stage['name'] = '%s (tier %d)' % (
+                stage.get('name', stage['attack']), i
+            )
+            result.append(stage)
+    return result
+
+
+def parse_attack_plan(plan, wordlist, rules, engine=None):
+    """Turn the attack plan into a list of stages
+
+    The plan is a JSON list of objects, each of which describes one stage,
+    e.g. ``{"attack": "mask", "mask": "?u?l?l?l?l?d?d", "max_runtime":
+    3600}``. Missing wordlists and rules are taken from the cracker config.
+    An empty plan results in a single stage using the wordlist and the rules.
+    Raises a ValueError if the plan is invalid.
+    """
+    from .cracker import ENGINES
+
+    if not plan or not plan.strip():
+        return [default_stage(wordlist, rules)]
+    try:
+        stages = json.loads(plan)
+    except ValueError as e:
+        raise ValueError("The attack plan is not valid JSON: %s" % e)
+    if not isinstance(stages, list) or not stages:
+        raise ValueError("The attack plan must be a non-empty list of stages")
+
+    result = []
+    for i, stage in enumerate(stages, 1):
+        if not isinstance(stage, dict):
+            raise ValueError("Stage %d is not an object" % i)
+        attack = stage.get('attack')
+        if attack not in ATTACKS:
+            raise ValueError("Stage %d: unknown attack '%s'" % (i, attack))
+        if engine and attack not in ENGINES[engine].supported_attacks:
+            raise ValueError("Stage %d: %s does not support '%s' attacks"
+                             % (i, engine, attack))
+        stage = dict(stage)
+        if 'wordlist' in ATTACKS[attack]:
+            stage.setdefault('wordlist', wordlist)
+        if 'rules' in ATTACKS[attack]:
+            stage.setdefault('rules', rules)
+        for key in ATTACKS[attack]:
+            if not stage.get(key):
+                raise ValueError("Stage %d: '%s' is missing" % (i, key))
+        unknown = set(stage) - set(ATTACKS[attack]) - set(BUDGETS) \
+            - {'attack', 'name'}
+        if unknown:
+            raise ValueError("Stage %d: unknown parameters: %s"
+                             % (i, ', '.join(sorted(unknown))))
+        for key in BUDGETS:
+            value = stage.get(key, 1)
+            if isinstance(value, bool) or not isinstance(value, int) \
+                    or value <= 0:
+                raise ValueError("Stage %d: '%s' must be a positive integer"
+                                 % (i, key))
+        result.append(stage)
+    return result
+
+
+def fingerprint_plan(stages, engine, args=''):
+    """Return a hash identifying an attack plan
+
+    The size and modification time of the wordlists and rules are part of
+    it, so the plan counts as a different one once they have been
+    updated. Generated wordlists are written anew by each audit, so their
+    content takes the place of their path."""
+    files = {}
+    plan = []
+    for stage in stages:
+        stage = dict(stage)
+        for key in FILES:
+            path = stage.get(key)
+            if not path:
+                continue
+            if stage.get('generated'):
+                stage[key] = _digest(path)
+            elif path not in files:
+                st = os.stat(path)
+                files[path] = [st.st_size, st.st_mtime]
+        plan.append(stage)
+    data = json.dumps([engine, args, plan, files], sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def _digest(path):
+    result = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            result.update(chunk)
+    return result.hexdigest()
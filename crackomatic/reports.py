@@ -1,3 +1,4 @@
+from html import escape
 from io import BytesIO
 import collections
 import enum
@@ -17,6 +18,7 @@ class QuantityType(enum.Enum):
     PERCENTAGE = enum.auto()
     DISTRIBUTION = enum.auto()
     RANKINGLIST = enum.auto()
+    TABLE = enum.auto()
 
 
 meta_data = dict(
@@ -93,11 +95,101 @@ using any number of character classes.""",
         </li><li>?: No known pattern</li></ul>
         """,
     ),
+    # Only available if a sample of the hashes has been cracked
+    sample_share=dict(
+        type=QuantityType.PERCENTAGE,
+        title="Percentage of hashes sampled",
+        description="""Only a random sample of this many hashes was cracked.
+The percentage of hashes cracked is extrapolated from the sample, while the
+metrics of the cracked passwords only describe the sample. The clique
+metrics always describe all hashes.""",
+        optional=True,
+    ),
+    cracked_low=dict(
+        type=QuantityType.PERCENTAGE,
+        title="Percentage of hashes cracked (lower bound)",
+        description="""With a confidence of 95%, at least this percentage of
+hashes would have been cracked in a full audit.""",
+        optional=True,
+    ),
+    cracked_high=dict(
+        type=QuantityType.PERCENTAGE,
+        title="Percentage of hashes cracked (upper bound)",
+        description="""With a confidence of 95%, at most this percentage of
+hashes would have been cracked in a full audit.""",
+        optional=True,
+    ),
+    # Only available if the password history has been cracked
+    rotation=dict(
+        type=QuantityType.PERCENTAGE,
+        title="Percentage of accounts rotating predictably",
+        description="""Of all accounts for which at least two consecutive
+passwords were cracked, this is the percentage which changed their password
+by only changing digits or special characters, as in Summer2025 and
+Summer2026. Attackers who know an old password will guess the new one.
+Lower is better.""",
+        optional=True,
+    ),
+    # Only available if a breach corpus has been configured
+    breached=dict(
+        type=QuantityType.PERCENTAGE,
+        title="Percentage of hashes found in breaches",
+        description="""This chart shows you the percentage of accounts
+whose password is known to attackers because it appears in a corpus of
+breached passwords, whether it was cracked or not. Lower is better.""",
+        optional=True,
+    ),
+    breach_prevalence=dict(
+        type=QuantityType.DISTRIBUTION,
+        title="Breach prevalence distribution",
+        description="""This histogram shows how often the passwords found in
+breaches have been seen there, as the number of digits of that count: 1
+means up to nine times, 2 means up to 99 times and so on. Passwords that
+have been seen often are the first ones attackers try.""",
+        xmin=1,
+        optional=True,
+    ),
+    # Only available if several domains have been audited together
+    cross_domain_reuse=dict(
+        type=QuantityType.PERCENTAGE,
+        title="Percentage of accounts reusing passwords across domains",
+        description="""This is the percentage of accounts whose password is
+also used by an account in another domain of the audit, whether it was
+cracked or not. Attackers who compromise one domain can move on to the
+others with these passwords. Lower is better.""",
+        optional=True,
+    ),
+    domains=dict(
+        type=QuantityType.TABLE,
+        title="Results by domain",
+        description="""The number of hashes and the percentages of hashes
+cracked, found in breaches and reused in other domains for each domain of
+the audit. All other metrics describe all domains together.""",
+        optional=True,
+    ),
 )
-
-
-def create_report(passwords, hashes):
-    if len(hashes):
+# Columns of the table of results by domain
+DOMAIN_COLUMNS = [
+    ('total_hashes', "Hashes"),
+    ('cracked', "Cracked"),
+    ('breached', "Breached"),
+    ('reused', "Reused"),
+]
+
+
+def create_report(passwords, hashes, breached=None, sample=None,
+                  histories=None, domains=None):
+    """Create a report from a list of cracked passwords and a list of NT
+    hashes with one entry per account
+
+    `breached` optionally maps NT hashes to the number of times they have
+    been seen in breaches. If only a sample has been cracked, `sample` is the
+    result of `sampling.extrapolate`. `histories` maps accounts to their
+    current and previous passwords, newest first. `domains` is the result of
+    `get_domain_breakdown` if several domains have been audited."""
+    if sample:
+        cracked = sample['cracked']
+    elif len(hashes):
         cracked = len(passwords)/len(hashes)
     else:
         cracked = 0
@@ -128,6 +220,16 @@ def create_report(passwords, hashes):
     top_basewords = get_top_basewords(passwords)
     top_patterns = get_top_patterns(passwords)
 
+    if breached is None:
+        breached_share = None
+        prevalence = None
+    else:
+        counts = [breached[h] for h in hashes if h in breached]
+        breached_share = len(counts)/len(hashes) if len(hashes) else 0
+        prevalence = json.dumps(collections.Counter(
+            len(str(c)) for c in counts
+        ))
+
     return Report(
         cracked=cracked,
         total_hashes=len(hashes),
@@ -139,9 +241,64 @@ def create_report(passwords, hashes):
         char_classes=json.dumps(char_classes),
         top_basewords=json.dumps(top_basewords),
         top_patterns=json.dumps(top_patterns),
+        breached=breached_share,
+        breach_prevalence=prevalence,
+        sample_share=sample['share'] if sample else None,
+        cracked_low=sample['low'] if sample else None,
+        cracked_high=sample['high'] if sample else None,
+        rotation=get_rotation(histories) if histories else None,
+        domains=json.dumps(domains[0]) if domains else None,
+        cross_domain_reuse=domains[1] if domains else None,
     )
 
 
+def get_domain_breakdown(accounts, passwords, breached=None):
+    """Break the results of an audit of several domains down by domain
+
+    `accounts` maps each domain to a dictionary mapping its accounts to
+    their NT hashes and `passwords` maps accounts to their cracked
+    passwords. Return a dictionary with the results of each domain and the
+    share of all accounts whose hash is used in more than one domain."""
+    hash_domains = collections.defaultdict(set)
+    for domain, hashes in accounts.items():
+        for nt in hashes.values():
+            hash_domains[nt].add(domain)
+    result = {}
+    reused = 0
+    for domain, hashes in accounts.items():
+        total = len(hashes)
+        shared = sum(1 for nt in hashes.values() if len(hash_domains[nt]) > 1)
+        reused += shared
+        result[domain] = dict(
+            total_hashes=total,
+            cracked=(sum(1 for user in hashes
+                         if passwords.get(user) is not None) / total
+                     if total else 0),
+            breached=(None if breached is None else
+                      sum(1 for nt in hashes.values() if nt in breached)
+                      / total if total else 0),
+            reused=shared / total if total else 0,
+        )
+    total = sum(len(hashes) for hashes in accounts.values())
+    return result, reused / total if total else 0
+
+
+def report_to_dict(report):
+    """Turn a report which has not been stored yet into a dictionary which
+    can be serialized as JSON"""
+    if report is None:
+        return None
+    return {c.name: getattr(report, c.name) for c in Report.__table__.columns
+            if c.name not in ['id', 'audit_id']}
+
+
+def report_from_dict(dct):
+    """Reverse `report_to_dict`"""
+    if dct is None:
+        return None
+    return Report(**dct)
+
+
 def create_text_report(report):
     result = ""
     for k, v in meta_data.items():
@@ -152,6 +309,16 @@ def create_text_report(report):
             pass
         if not isinstance(value, int) and not value:
             continue
+        elif meta_data[k]['type'] == QuantityType.TABLE:
+            result += "%s:\n    " % v['title']
+            result += "\n    ".join(
+                "%s: %s" % (name, ', '.join(
+                    "%s %s" % (title, format_cell(row[key], key))
+                    for key, title in DOMAIN_COLUMNS
+                    if row.get(key) is not None
+                )) for name, row in value.items()
+            )
+            result += '\n'
         elif meta_data[k]['type'] == QuantityType.PERCENTAGE:
             result += "%s: %.02f%%\n" % (v['title'], value * 100)
         elif (meta_data[k]['type'] == QuantityType.SCALAR
@@ -189,6 +356,34 @@ def get_html_representation(report, quantity):
         return histogram(val, xmin)
     elif type == QuantityType.RANKINGLIST:
         return bar_chart(val)
+    elif type == QuantityType.TABLE:
+        return table(val)
+
+
+def format_cell(value, key):
+    if value is None:
+        return '-'
+    if key == 'total_hashes':
+        return '%d' % value
+    return '%.01f%%' % (value * 100)
+
+
+def table(dct):
+    """Takes a string that is json-convertable to a dictionary mapping row
+    names to dictionaries of values"""
+    dct = json.loads(dct)
+    if not dct:
+        return ''
+    result = '<table class="table is-fullwidth"><thead><tr><th></th>'
+    result += ''.join('<th>%s</th>' % title for _, title in DOMAIN_COLUMNS)
+    result += '</tr></thead><tbody>'
+    for name, row in dct.items():
+        result += '<tr><th>%s</th>' % escape(name)
+        result += ''.join('<td>%s</td>' % format_cell(row.get(key), key)
+                          for key, _ in DOMAIN_COLUMNS)
+        result += '</tr>'
+    result += '</tbody></table>'
+    return result
 
 
 def histogram(dct, xmin=0):
@@ -242,6 +437,31 @@ def get_top_patterns(passwords):
     return counts.most_common(10)
 
 
+def is_predictable(old, new):
+    """Check whether a new password only differs from the old one in its
+    digits and special characters, like Summer2025 and Summer2026"""
+    if old == new:
+        return False
+    old, new = [re.sub('[^a-z]', '', p.lower()) for p in [old, new]]
+    return bool(old) and old == new
+
+
+def get_rotation(histories):
+    """Return the share of accounts with at least two consecutive cracked
+    passwords which rotate them predictably, or None if there are none"""
+    accounts = 0
+    predictable = 0
+    for passwords in histories.values():
+        pairs = [(old, new) for new, old in zip(passwords, passwords[1:])
+                 if old is not None and new is not None]
+        if not pairs:
+            continue
+        accounts += 1
+        if any(is_predictable(old, new) for old, new in pairs):
+            predictable += 1
+    return predictable / accounts if accounts else None
+
+
 def get_char_classes(passwords):
     def get_character_classes(s):
         upper = False
@@ -313,6 +533,8 @@ def create_figures(report):
     figures = []
     for k, v in meta_data.items():
         html = get_html_representation(report, k)
+        if not html and v.get('optional'):
+            continue
         figures.append(dict(
             html=html,
             title=v['title'],
@@ -345,6 +567,28 @@ def bar_chart(lst):
     return svg
 
 
+def throughput_chart(samples):
+    """Plot the speed of each device over time"""
+    if not samples:
+        return ''
+    plt.rcdefaults()
+    fig, ax = plt.subplots(figsize=(8, 4), dpi=100)
+    ax.spines["top"].set_visible(False)
+    ax.spines["right"].set_visible(False)
+    times = [s.time for s in samples]
+    for i in range(max(len(s.devices) for s in samples)):
+        speeds = [s.devices[i] if i < len(s.devices) else 0
+                  for s in samples]
+        ax.plot(times, speeds, label='Device %d' % (i + 1))
+    ax.set_ylabel('Hashes/Second')
+    if ax.get_legend_handles_labels()[0][1:]:
+        ax.legend()
+    fig.autofmt_xdate()
+    svg = get_svg(plt)
+    plt.close()
+    return svg
+
+
 def gauge_chart(value):
     val = [1 - value, value, 1]
     colors = ['lightgray', 'tab:blue', 'k']
@@ -0,0 +1,108 @@
+"""Crack a random sample of the hashes and extrapolate the results
+
+The unique hashes are divided into strata by the number of accounts sharing
+them, because shared hashes are far more likely to be cracked. Each stratum
+contributes the same share of its hashes to the sample. The share of
+cracked accounts is then estimated per stratum with a ratio estimator, i.e.
+the accounts of the cracked hashes drawn divided by the accounts of all
+hashes drawn, and weighted by the number of accounts in the stratum.
+"""
+
+import collections
+import math
+import random
+
+# 95% confidence
+Z = 1.96
+# Upper bounds of the number of accounts sharing a hash in each stratum
+STRATA = [1, 9]
+
+
+def stratum(accounts):
+    """Return the index of the stratum of a hash shared by that many
+    accounts"""
+    for i, bound in enumerate(STRATA):
+        if accounts <= bound:
+            return i
+    return len(STRATA)
+
+
+def _strata(index):
+    result = collections.defaultdict(list)
+    for nt, accounts in index.account_counts().items():
+        result[stratum(accounts)].append(nt)
+    return result
+
+
+def draw_sample(index, share, rng=None):
+    """Return a set of unique NT hashes containing `share` (between 0 and 1)
+    of the hashes of each stratum, but at least one"""
+    rng = rng or random.SystemRandom()
+    sample = set()
+    for hashes in _strata(index).values():
+        size = min(len(hashes), max(1, round(len(hashes) * share)))
+        sample.update(rng.sample(hashes, size))
+    return sample
+
+
+def wilson_interval(k, n, z=Z):
+    """Return the Wilson score interval of the proportion k/n"""
+    if not n:
+        return 0.0, 1.0
+    p = k / n
+    denominator = 1 + z*z/n
+    centre = (p + z*z/(2*n)) / denominator
+    margin = z * math.sqrt(p*(1 - p)/n + z*z/(4*n*n)) / denominator
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+def ratio_interval(accounts, hits, z=Z):
+    """Return the confidence interval of a ratio estimate
+
+    `accounts` holds the number of accounts of each hash drawn and `hits`
+    whether it was cracked. If all hashes have the same number of accounts,
+    the ratio is a proportion and the Wilson score interval is used.
+    Otherwise the variance follows from the residuals of the ratio."""
+    n = len(accounts)
+    if len(set(accounts)) <= 1:
+        return wilson_interval(sum(hits), n, z)
+    ratio = sum(a for a, hit in zip(accounts, hits) if hit) / sum(accounts)
+    mean = sum(accounts) / n
+    residuals = sum((a*hit - ratio*a)**2 for a, hit in zip(accounts, hits))
+    margin = z * math.sqrt(residuals / (n - 1) / n) / mean
+    return max(0.0, ratio - margin), min(1.0, ratio + margin)
+
+
+def extrapolate(index, sample, cracked):
+    """Estimate the share of cracked accounts in the whole index
+
+    `cracked` contains the NT hashes which have been cracked. Return a
+    dictionary with the estimate and the bounds of its confidence interval.
+    The bounds are the weighted bounds of each stratum, which is
+    conservative."""
+    accounts = index.account_counts()
+    total = sum(accounts.values())
+    result = dict(
+        share=len(sample) / len(accounts) if accounts else 0,
+        cracked=0.0,
+        low=0.0,
+        high=0.0,
+    )
+    if not total:
+        return result
+    for hashes in _strata(index).values():
+        weight = sum(accounts[nt] for nt in hashes) / total
+        drawn = [nt for nt in hashes if nt in sample]
+        drawn_accounts = [accounts[nt] for nt in drawn]
+        hits = [nt in cracked for nt in drawn]
+        p = sum(a for a, hit in zip(drawn_accounts, hits) if hit) / \
+            sum(drawn_accounts) if drawn else 0
+        if len(drawn) == len(hashes):
+            # Nothing was left to chance
+            low = high = p
+        else:
+            low, high = ratio_interval(drawn_accounts, hits)
+        result['cracked'] += weight * p
+        result['low'] += weight * low
+        result['high'] += weight * high
+    return result
@@ -1,7 +1,9 @@
 from __future__ import print_function
+import base64
 import shutil
 import os
 import subprocess
+import tempfile
 from logging import getLogger
 log = getLogger(__name__)
 
@@ -83,7 +85,12 @@ def replicate(root_dir, domain, ip, username, password, history=False):
 
 
 def read_hashes_from_sam(root_dir):
-    '''Call pdbedit to retrieve hashes from SAM database'''
+    '''Call pdbedit to retrieve hashes from SAM database
+
+    Generate a `HashRecord` for each account while pdbedit's output is
+    being read.'''
+    # Not available when called as a script
+    from .hashes import HashRecord
     log.debug("Read hashes from file in %s/samba" % root_dir)
     cmd = [
         'pdbedit',
@@ -92,6 +99,71 @@ def read_hashes_from_sam(root_dir):
         '-s', '%s/etc/smb.conf' % root_dir,
         '--option=private dir=%s/samba' % root_dir,
     ]
+    # A file, so pdbedit can't block on a full pipe while we read stdout
+    with tempfile.TemporaryFile() as errors:
+        p = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=errors,
+            stdin=subprocess.DEVNULL,
+        )
+        with p.stdout:
+            for line in p.stdout:
+                line = line.decode().rstrip('\r\n')
+                if line:
+                    # Keeps the account flags, e.g. '[DU         ]'
+                    yield HashRecord.from_line(line)
+        if p.wait():
+            errors.seek(0)
+            log.error(errors.read().decode())
+            raise RuntimeError("pdbedit exited with return code %d"
+                               % p.returncode)
+
+
+def parse_ldif(output):
+    '''Turn the LDIF output of ldbsearch into a list of dictionaries
+    mapping attribute names to lists of values (bytes)'''
+    result = []
+    entry = {}
+    lines = []
+    # Join continuation lines, which start with a space
+    for line in output.splitlines():
+        if line.startswith(' ') and lines:
+            lines[-1] += line[1:]
+        else:
+            lines.append(line)
+    for line in lines + ['']:
+        if not line:
+            if entry:
+                result.append(entry)
+            entry = {}
+            continue
+        if line.startswith('#') or ':' not in line:
+            continue
+        name, _, value = line.partition(':')
+        if value.startswith(':'):
+            value = base64.b64decode(value[1:].strip())
+        else:
+            value = value.strip().encode()
+        entry.setdefault(name, []).append(value)
+    return result
+
+
+def read_history_from_sam(root_dir):
+    '''Call ldbsearch to retrieve the password history from the SAM
+    database
+
+    Generate a `HashRecord` for each previous password, where the user name
+    is suffixed with '_history<n>' like in the output of secretsdump.'''
+    from .hashes import HashRecord, EMPTY_LM
+    log.debug("Read password history from file in %s/samba" % root_dir)
+    cmd = [
+        'ldbsearch',
+        '-H', '%s/samba/sam.ldb' % root_dir,
+        '(&(objectClass=user)(ntPwdHistory=*))',
+        'sAMAccountName',
+        'ntPwdHistory',
+    ]
     p = subprocess.Popen(
         cmd,
         stdout=subprocess.PIPE,
@@ -101,21 +173,23 @@ def read_hashes_from_sam(root_dir):
     result, errors = p.communicate()
     if p.returncode:
         log.error(errors.decode())
-        raise RuntimeError("pdbedit exited with return code %d" % p.returncode)
-    result = result.splitlines()
-    result = [x.decode().split(':') for x in result]
-    result = [[x[0], x[1], x[2].lower(), x[3].lower()] for x in result]
-    result = [
-        "%s:%s:%s:%s:::" % tuple(x[:4])
-        for x in result
-    ]
-    result = '\n'.join(result)
-    return result
+        raise RuntimeError("ldbsearch exited with return code %d"
+                           % p.returncode)
+    for entry in parse_ldif(result.decode()):
+        user = entry['sAMAccountName'][0].decode()
+        # The history is a concatenation of NT hashes, newest first
+        history = entry['ntPwdHistory'][0]
+        for i in range(len(history) // 16):
+            nt = history[16*i:16*(i+1)].hex()
+            yield HashRecord('%s_history%d' % (user, i), '0', EMPTY_LM, nt)
 
 
 def get_hashes(domain, username, password, root_dir='/tmp',
                ip=None, history=False):
+    '''Replicate the domain and generate a `HashRecord` for each account,
+    followed by those of the password history if requested
 
+    The replica is removed once all records have been consumed.'''
     root_dir = os.path.join(root_dir, _DIR_NAME)
     remove_dir(root_dir)
     os.mkdir(root_dir)
@@ -133,8 +207,12 @@ def get_hashes(domain, username, password, root_dir='/tmp',
                 password,
                 history,
             )
-        hashes = read_hashes_from_sam(root_dir)
-        return hashes
+        # No 'yield from', this file must remain valid Python 2
+        for record in read_hashes_from_sam(root_dir):
+            yield record
+        if history:
+            for record in read_history_from_sam(root_dir):
+                yield record
     finally:
         remove_dir(root_dir)
 
@@ -0,0 +1,69 @@
+import collections
+from datetime import date
+from logging import getLogger
+import re
+
+log = getLogger(__name__)
+
+# Attributes of users which people like to base their passwords on
+LDAP_ATTRIBUTES = ['company', 'department', 'l', 'givenName', 'sn',
+                   'description']
+LDAP_FILTER = '(objectClass=user)'
+# Shorter words are covered by any generic wordlist
+MIN_LENGTH = 3
+# Number of past years to append to each word
+YEARS = 5
+SUFFIXES = ['', '1', '12', '123', '!', '1!', '123!']
+
+
+def tokenize(value):
+    """Split a string into words, keeping umlauts and the like"""
+    return [w for w in re.split(r'[\W_]+', value)
+            if len(w) >= MIN_LENGTH and not w.isdigit()]
+
+
+def get_base_words(entries, domain=None):
+    """Extract a set of base words from the result of an LDAP query
+
+    All attributes are split into words. From descriptions, only
+    capitalized words are taken, which tend to be names of products,
+    projects or places rather than generic vocabulary."""
+    counter = collections.Counter()
+    for attributes in entries.values():
+        for attribute in LDAP_ATTRIBUTES:
+            for value in attributes.get(attribute, []):
+                if isinstance(value, bytes):
+                    value = value.decode('utf8', 'replace')
+                words = tokenize(value)
+                if attribute == 'description':
+                    words = [w for w in words if w[0].isupper()]
+                counter.update(w.lower() for w in words)
+    if domain:
+        counter.update(w.lower() for w in tokenize(domain.replace('.', ' ')))
+    return set(counter)
+
+
+def get_candidates(words, today=None):
+    """Generate the usual variations of each word"""
+    today = today or date.today()
+    years = [str(today.year - i) for i in range(YEARS)]
+    suffixes = SUFFIXES + years + [y[2:] for y in years] + \
+        [y + '!' for y in years]
+    for word in sorted(words):
+        for variant in sorted({word, word.capitalize(), word.upper()}):
+            for suffix in suffixes:
+                yield variant + suffix
+
+
+def write_wordlist(path, entries, domain=None):
+    """Write an organisation-specific wordlist and return the number of
+    candidates"""
+    words = get_base_words(entries, domain)
+    count = 0
+    with open(path, 'w') as f:
+        for candidate in get_candidates(words):
+            f.write(candidate + '\n')
+            count += 1
+    log.info("Generated %d candidates from %d words in the directory"
+             % (count, len(words)))
+    return count
@@ -36,6 +36,7 @@ setuptools.setup(
         'babel>=2.6.0',
         'toml>=0.10.0',
         'packaging>=19.0',
+        'cryptography',
     ],
     python_requires='>=3.6',
     extras_require={
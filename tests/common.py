@@ -1,5 +1,6 @@
 import time
 from crackomatic.constants import AuditState, AuditFrequency
+from crackomatic.hashes import parse_pwdump
 
 
 # Valid audit config
@@ -79,8 +80,8 @@ def mock_get_hashes(domain, username, password, root_dir='/tmp',
                     ip=None, history=False):
     time.sleep(10)
     with open('tests/data/ntds.txt', 'r') as f:
-        result = f.read()
-    return result
+        for record in parse_pwdump(f):
+            yield record
 
 
 def mock_ldap_query(url, basedn, ca_file, binddn, password, search_filter,
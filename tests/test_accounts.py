@@ -0,0 +1,60 @@
+from datetime import datetime as dt
+import os
+import sys
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_PATH, '..'))
+
+
+HASHES = """\
+alice:1001:aad3b435b51404eeaad3b435b51404ee:a0000000000000000000000000000001:[U          ]::
+bob:1002:aad3b435b51404eeaad3b435b51404ee:a0000000000000000000000000000002:[DU         ]::
+WS01$:1003:aad3b435b51404eeaad3b435b51404ee:a0000000000000000000000000000003:[W          ]::
+krbtgt:502:aad3b435b51404eeaad3b435b51404ee:a0000000000000000000000000000004:[DU         ]::
+CONTOSO$:1004:aad3b435b51404eeaad3b435b51404ee:a0000000000000000000000000000005:[I          ]::
+domain.local\\carol:1005:aad3b435b51404eeaad3b435b51404ee:a0000000000000000000000000000006:::"""  # noqa
+
+
+def test_parse_flags():
+    from crackomatic.accounts import parse_flags, parse_filetime
+    assert parse_flags('[DU         ]') == {'D', 'U'}
+    assert parse_flags('') == set()
+    assert parse_filetime('0') is None
+    assert parse_filetime(b'132539328000000000') == dt(2021, 1, 1)
+
+
+def test_filter_records():
+    import collections
+    from crackomatic.accounts import filter_records, get_skipped_categories
+    from crackomatic.hashes import parse_pwdump
+    skip = get_skipped_categories(dict(
+        skip_machine_accounts=True,
+        skip_trust_accounts=True,
+        skip_disabled_accounts=False,
+        stale_days='',
+    ))
+    assert skip == {'machine', 'trust'}
+    skipped = collections.Counter()
+    records = filter_records(parse_pwdump(HASHES.splitlines()), skip,
+                             skipped=skipped)
+    assert [r.user for r in records] == \
+        ['alice', 'bob', 'domain.local\\carol']
+    assert skipped == {'machine': 1, 'trust': 2}
+
+    skipped = collections.Counter()
+    list(filter_records(parse_pwdump(HASHES.splitlines()), {'disabled'},
+                        skipped=skipped))
+    assert skipped == {'disabled': 2}
+
+    # Details from LDAP take precedence over missing flags
+    directory = {
+        'CAROL': (0x202, dt(2020, 1, 1)),
+        'ALICE': (0x200, dt(2021, 6, 1)),
+    }
+    skipped = collections.Counter()
+    records = filter_records(parse_pwdump(HASHES.splitlines()),
+                             {'disabled', 'stale'}, directory,
+                             dt(2021, 1, 1), skipped)
+    assert [r.user for r in records] == ['alice', 'WS01$', 'CONTOSO$']
+    assert skipped == {'disabled': 3, 'stale': 1}
@@ -82,7 +82,7 @@ def test_scheduler(backend, global_data):
     time.sleep(7)
     # Running
     scheduled = backend.get_scheduled_audits()
-    root_dir = backend._job._root_dir.name
+    root_dir = backend._job.work_dir
     assert scheduled == []
     assert backend._job
     assert int(backend._job.audit.state) > 1
@@ -98,3 +98,40 @@ def test_scheduler(backend, global_data):
     )
     # assert that files are gone
     assert not os.path.isdir(root_dir)
+
+
+def test_queued_audit_with_config_errors(tmp_path):
+    from collections import OrderedDict
+    from threading import RLock
+    from crackomatic.models import init_db, session_scope, Audit, freeze
+    init_db('sqlite:///' + str(tmp_path / 'backend.db'))
+    from crackomatic.backend import Backend
+    from crackomatic.constants import AuditState
+
+    class Config(dict):
+        def get_errors(self):
+            return {'cracker': 1}
+
+    with session_scope(expire_on_commit=False) as s:
+        audit = Audit(
+            uuid='1', user='admin', domain='contoso.local',
+            ldap_url='ldaps://dc.contoso.local', ca_file='',
+            email_field='mail', user_filter='', admin_filter='', subject='',
+            message='',
+            state=AuditState.SCHEDULED,
+        )
+        s.add(audit)
+        s.flush()
+        audit = freeze(audit)
+    backend = Backend.__new__(Backend)
+    backend.config = Config(cracker={})
+    backend._jobs = OrderedDict()
+    backend._queue = [(audit, 'secret', False)]
+    backend._jobs_lock = RLock()
+    backend._stopping = False
+    backend._start_queued()
+
+    # The audit is not left behind as scheduled
+    assert backend._queue == []
+    with session_scope() as s:
+        assert s.query(Audit).one().state == AuditState.FAILED
@@ -0,0 +1,45 @@
+import os
+import random
+import sys
+import time
+
+import pytest
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_PATH, '..'))
+
+
+def test_breach_index(tmp_path):
+    from crackomatic.breach import build_index, BreachIndex
+    random.seed(0)
+    corpus = {'%032x' % random.getrandbits(128): random.randint(1, 10**6)
+              for _ in range(100000)}
+    corpus_path = str(tmp_path / 'corpus.txt')
+    index_path = str(tmp_path / 'corpus.idx')
+    with open(corpus_path, 'w') as f:
+        for nt in sorted(corpus):
+            f.write('%s:%d\n' % (nt.upper(), corpus[nt]))
+    assert build_index(corpus_path, index_path) == len(corpus)
+
+    known = random.sample(sorted(corpus), 1000)
+    unknown = ['%032x' % random.getrandbits(128) for _ in range(99000)]
+    start = time.time()
+    with BreachIndex(index_path) as index:
+        assert len(index) == len(corpus)
+        result = index.lookup(known + unknown)
+        assert time.time() - start < 10
+        # The Guest account has no password
+        assert index.lookup(
+            known[:1] + ['NO PASSWORD' + 'X' * 21]
+        ) == {known[0]: corpus[known[0]]}
+    assert result == {nt: corpus[nt] for nt in known}
+
+
+def test_unsorted_corpus(tmp_path):
+    from crackomatic.breach import build_index
+    corpus_path = str(tmp_path / 'corpus.txt')
+    with open(corpus_path, 'w') as f:
+        f.write('%s:1\n%s:1\n' % ('F' * 32, 'A' * 32))
+    with pytest.raises(ValueError):
+        build_index(corpus_path, str(tmp_path / 'corpus.idx'))
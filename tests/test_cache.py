@@ -0,0 +1,53 @@
+import os
+import sys
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_PATH, '..'))
+
+
+def test_cache(tmp_path, monkeypatch):
+    from cryptography.fernet import Fernet
+    from crackomatic import crypto
+    monkeypatch.setattr(crypto, '_key', Fernet.generate_key())
+    from crackomatic.models import init_db, session_scope, CrackedHash
+    init_db('sqlite:///' + str(tmp_path / 'cache.db'))
+    from crackomatic.cache import lookup_cracked, store_cracked
+
+    hashes = {
+        '31d6cfe0d16ae931b73c59d7e0c089c0': '',
+        '32ed87bdb5fdc5e9cba88547376818d4': '123456',
+    }
+    assert lookup_cracked(hashes.keys()) == {}
+
+    store_cracked(hashes)
+    store_cracked(hashes)
+    assert lookup_cracked(
+        list(hashes.keys()) + ['0' * 32]
+    ) == hashes
+
+    # Neither hashes nor passwords are stored in plain text
+    with session_scope() as s:
+        entries = s.query(CrackedHash).all()
+        assert len(entries) == 2
+        for e in entries:
+            assert e.fingerprint not in hashes
+            assert '123456' not in e.password
+
+
+def test_resisted(tmp_path, monkeypatch):
+    from cryptography.fernet import Fernet
+    from crackomatic import crypto
+    monkeypatch.setattr(crypto, '_key', Fernet.generate_key())
+    from crackomatic.models import init_db
+    init_db('sqlite:///' + str(tmp_path / 'cache.db'))
+    from crackomatic.cache import lookup_resisted, store_resisted
+
+    hashes = ['31d6cfe0d16ae931b73c59d7e0c089c0', '0' * 32]
+    assert lookup_resisted(hashes, 'a' * 64) == set()
+
+    store_resisted(hashes[:1], 'a' * 64)
+    store_resisted(hashes[:1], 'a' * 64)
+    assert lookup_resisted(hashes, 'a' * 64) == set(hashes[:1])
+    # Only for the same plan
+    assert lookup_resisted(hashes, 'b' * 64) == set()
@@ -0,0 +1,41 @@
+import os
+import sys
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_PATH, '..'))
+
+
+def test_checkpoint(tmp_path, monkeypatch):
+    from cryptography.fernet import Fernet
+    from crackomatic import crypto, checkpoint
+    monkeypatch.setattr(crypto, '_key', Fernet.generate_key())
+    monkeypatch.setattr(checkpoint, 'CHUNK_SIZE', 100)
+
+    path = str(tmp_path / 'hashes.enc')
+    lines = ['user%d:%d:%s:%s:::' % (i, i, 'a' * 32, 'b' * 32)
+             for i in range(20)]
+    with checkpoint.Writer(path) as f:
+        for line in lines:
+            f.write(line + '\n')
+    assert list(checkpoint.read_lines(path)) == lines
+    # Several tokens, none of them in plain text
+    with open(path, 'rb') as f:
+        content = f.read()
+    assert content.count(b'\n') == 10
+    assert b'user' not in content
+
+    # An interrupted write leaves no checkpoint behind
+    path = str(tmp_path / 'cracked.enc')
+    try:
+        with checkpoint.Writer(path) as f:
+            f.write('{')
+            raise RuntimeError()
+    except RuntimeError:
+        pass
+    assert checkpoint.load(path) is None
+    assert os.listdir(str(tmp_path)) == ['hashes.enc']
+
+    data = dict(cracked={'b' * 32: 'Summer2026 '}, breached=None)
+    checkpoint.save(path, data)
+    assert checkpoint.load(path) == data
@@ -139,3 +139,295 @@ def test_cracker_status(crack_long):
         assert s['ETA'] > dt.now() - timedelta(seconds=5)
 
     assert not os.path.exists(crack._potfile)
+
+
+def test_output_is_bounded(tmp_path):
+    from crackomatic.cracker import Cracker, OUTPUT_LINES, STATUS_EVENTS
+
+    class Counter(Cracker):
+        password_regex = '^secret$'
+        expected_returncodes = [0]
+
+        def command_line(self, stage):
+            return [self._bin_path, str(20 * OUTPUT_LINES)]
+
+        def _get_version(self):
+            return None
+
+        def _get_passwords(self):
+            return {}
+
+        def _parse_status(self, line, buffer):
+            if line.endswith('0\n'):
+                return {'count': int(line)}
+
+    crack = Counter('', '', '', 'seq', root_dir=str(tmp_path))
+    crack.wait_until_finished()
+
+    lines = crack.output['stdout'].splitlines()
+    assert len(lines) == OUTPUT_LINES
+    assert lines[-1] == str(20 * OUTPUT_LINES)
+    assert len(crack.status_events) == STATUS_EVENTS
+    assert crack.status_events[-1]['count'] == 20 * OUTPUT_LINES
+    assert crack.status_events[-1]['seq'] == 2 * OUTPUT_LINES
+
+
+def test_status_sampler(tmp_path):
+    from crackomatic.cracker import Cracker
+
+    class Ticker(Cracker):
+        password_regex = '^secret$'
+        expected_returncodes = [0]
+
+        def command_line(self, stage):
+            return [self._bin_path, '-c',
+                    'for i in 1 2 3 4; do echo $i; sleep 1; done']
+
+        def _get_version(self):
+            return None
+
+        def _get_passwords(self):
+            return {}
+
+        def _parse_status(self, line, buffer):
+            return {'guesses': int(line)}
+
+        def _get_status(self):
+            return {'guesses': self.status_events[-1]['guesses']}
+
+    crack = Ticker('', '', '', 'sh', root_dir=str(tmp_path))
+    time.sleep(2.5)
+    start = time.time()
+    status = crack.get_status()
+    assert time.time() - start < 0.1
+    assert status['guesses'] >= 2
+    assert 0 <= status['age'] < 2
+    crack.wait_until_finished()
+    assert crack.get_status() == "Process finished"
+
+
+def test_hashcat_status_record():
+    from crackomatic.cracker import Hashcat
+    line = ('STATUS\t3\tSPEED\t25000\t1000\t6000\t500\tEXEC_RUNTIME\t0.12\t'
+            '0.4\tCURKU\t1000\tPROGRESS\t185000\t740000\tRECHASH\t2\t10\t'
+            'RECSALT\t1\t1\tTEMP\t-1\t-1\tREJECTED\t0\tUTIL\t-1\t80\t\n')
+    status = Hashcat._parse_status(None, line, 'stdout')
+    assert status['devices'] == [25000, 12000]
+    assert status['speed'] == 37000
+    assert status['progress'] == 25
+    assert status['guesses'] == 2
+    assert status['hashes'] == 10
+    assert status['ETA'] > dt.now() + timedelta(seconds=14)
+    assert status['ETA'] < dt.now() + timedelta(seconds=16)
+
+    # Hashcat is still initializing
+    line = line.replace('25000', '0').replace('6000', '0')
+    assert Hashcat._parse_status(None, line, 'stdout') is None
+    assert Hashcat._parse_status(None, 'Session..: hashcat\n', 'stdout') \
+        is None
+
+
+def test_time_series():
+    from crackomatic.cracker import TimeSeries, StatusSample
+    series = TimeSeries(size=10, interval=1)
+    start = dt.now()
+    for i in range(100):
+        series.add(StatusSample(
+            start + timedelta(seconds=i), (i,), i, i
+        ))
+    samples = list(series)
+    assert len(samples) < 10
+    assert samples[0].devices == (0,)
+    assert samples[-1].time - samples[0].time > timedelta(seconds=80)
+
+
+class Resumable(object):
+    """Count to six, saving the state in the session file"""
+    password_regex = '^secret$'
+    expected_returncodes = [0]
+
+    def command_line(self, stage):
+        return [
+            self._bin_path, '-c',
+            'i=$(cat %s 2>/dev/null || echo 0); '
+            'while [ $i -lt 6 ]; do '
+            'i=$((i+1)); echo $i; echo $i > %s; sleep 0.5; '
+            'done' % (self._session, self._session),
+        ]
+
+    def restore_command_line(self):
+        return self.command_line(None)
+
+    def _get_version(self):
+        return None
+
+    def _get_passwords(self):
+        with open(self._session, 'r') as f:
+            return {'count': int(f.read())}
+
+
+def test_pause_and_resume(tmp_path):
+    from crackomatic.cracker import Cracker
+
+    class Counter(Resumable, Cracker):
+        pass
+
+    crack = Counter('', '', '', 'sh', root_dir=str(tmp_path))
+    time.sleep(1.2)
+    crack.pause()
+    assert crack.get_status() == "Paused"
+    assert not crack.wait_until_finished(timeout=2)
+    count = int(crack.output['stdout'].splitlines()[-1])
+    assert count < 6
+    crack.resume()
+    assert crack.wait_until_finished(timeout=10)
+    lines = crack.output['stdout'].splitlines()
+    assert lines == [str(i) for i in range(1, 7)]
+    assert crack.passwords == {'count': 6}
+
+
+def test_stop(tmp_path):
+    from crackomatic.cracker import Cracker
+
+    class Counter(Resumable, Cracker):
+        pass
+
+    crack = Counter('', '', '', 'sh', root_dir=str(tmp_path),
+                    stages=[dict(attack='mask', mask='?d')] * 3)
+    time.sleep(1.2)
+    crack.stop()
+    assert crack.wait_until_finished(timeout=2)
+    assert crack.stage == 0
+    assert 0 < crack.passwords['count'] < 6
+
+
+def test_suspend_and_restore(tmp_path):
+    from crackomatic.cracker import Cracker
+
+    class Counter(Resumable, Cracker):
+        restore_suffix = ''
+
+    stages = [dict(attack='mask', mask='?d')] * 2
+    crack = Counter('', '', '', 'sh', root_dir=str(tmp_path), stages=stages)
+    time.sleep(1.2)
+    crack.suspend()
+    assert crack.wait_until_finished(timeout=2)
+    assert crack.passwords is None
+    count = int(crack.output['stdout'].splitlines()[-1])
+    assert count < 6
+
+    # A new instance continues in the same stage
+    crack = Counter('', '', '', 'sh', root_dir=str(tmp_path), stages=stages,
+                    restore=True)
+    assert crack.wait_until_finished(timeout=10)
+    lines = crack.output['stdout'].splitlines()
+    assert lines == [str(i) for i in range(count + 1, 7)]
+    assert crack.passwords == {'count': 6}
+
+
+def test_parse_potfile_line():
+    from crackomatic.cracker import parse_potfile_line
+    nt = '32ed87bdb5fdc5e9cba88547376818d4'
+    # Hashcat
+    assert parse_potfile_line(nt + ':123456\n') == (nt, '123456')
+    assert parse_potfile_line(nt + ':$HEX[3132333a3536]\n') == (nt, '123:56')
+    # John
+    assert parse_potfile_line('$NT$' + nt.upper() + ':a:b\n') == (nt, 'a:b')
+    assert parse_potfile_line('$NT$' + nt + ':$HEX$c3a4\n') == (nt, 'ä')
+    assert parse_potfile_line('$dynamic_1$abc:foo\n') is None
+
+
+def test_cracked_feed(tmp_path):
+    from crackomatic.cracker import Cracker
+
+    hashes = ['%032x' % i for i in range(3)]
+
+    class Feeder(Cracker):
+        password_regex = '^secret$'
+        expected_returncodes = [0]
+
+        def command_line(self, stage):
+            # Write one line every second, the last one in two parts
+            return [self._bin_path, '-c', (
+                'echo %s:one >> {pot}; sleep 1; '
+                'echo %s:two >> {pot}; sleep 2.5; '
+                'printf %s: >> {pot}; sleep 2.5; '
+                'echo three >> {pot}'
+            ).format(pot=self._potfile) % tuple(hashes)]
+
+        def _get_version(self):
+            return None
+
+        def _get_passwords(self):
+            return dict(self.cracked)
+
+    events = []
+    crack = Feeder('', '', '', 'sh', root_dir=str(tmp_path),
+                   cb_cracked=events.append)
+    time.sleep(4.5)
+    assert crack.cracked == {hashes[0]: 'one', hashes[1]: 'two'}
+    crack.wait_until_finished()
+    assert crack.passwords == {
+        hashes[0]: 'one', hashes[1]: 'two', hashes[2]: 'three',
+    }
+    assert len(events) >= 2
+    assert {k: v for e in events for k, v in e.items()} == crack.passwords
+
+
+def test_known_version(tmp_path):
+    from crackomatic.cracker import Cracker
+
+    class Known(Cracker):
+        password_regex = '^secret$'
+        expected_returncodes = [0]
+
+        def command_line(self, stage):
+            return [self._bin_path, '-c', 'true']
+
+        def _get_passwords(self):
+            return {}
+
+    # The binary is not run to determine the version
+    crack = Known('', '', '', 'sh', root_dir=str(tmp_path), version='1.0')
+    assert crack.version == '1.0'
+    assert crack.wait_until_finished(timeout=5)
+
+
+def test_missing_binary(tmp_path):
+    from crackomatic.cracker import get_cracker
+    hash_file = tmp_path / 'hashfile'
+    hash_file.write_text('')
+    crack = get_cracker('John', str(hash_file), '', '', '/nonexistent/john',
+                        root_dir=str(tmp_path), version='1.0')
+    assert crack.wait_until_finished(timeout=5)
+    # A failed run must not look like one that cracked nothing
+    assert crack.passwords is None
+
+
+def test_hashcat_max_candidates(tmp_path):
+    from crackomatic.cracker import Hashcat
+    rules = tmp_path / 'rules'
+    rules.write_text('# comment\n' + ''.join('$%d\n' % i for i in range(10)))
+    hashcat = Hashcat.__new__(Hashcat)
+    hashcat._bin_path = 'hashcat'
+    hashcat._hash_file = 'hashfile'
+    hashcat._potfile = 'potfile'
+    hashcat._session = 'session'
+    hashcat._args = []
+    hashcat._partition = None
+    hashcat._hash_type = 'nt'
+    hashcat._get_keyspace = lambda stage: 26**3
+
+    # --limit counts words, each of which yields a candidate per rule
+    cmd = hashcat.command_line(dict(attack='rules', wordlist='words',
+                                    rules=str(rules), max_candidates=95))
+    assert '--limit=10' in cmd
+    cmd = hashcat.command_line(dict(attack='hybrid', wordlist='words',
+                                    mask='?d?d', max_candidates=1000))
+    assert '--limit=10' in cmd
+    cmd = hashcat.command_line(dict(attack='mask', mask='?l?l?l?d?d',
+                                    max_candidates=1000))
+    assert '--limit=10' in cmd
+    cmd = hashcat.command_line(dict(attack='wordlist', wordlist='words',
+                                    max_candidates=1000))
+    assert '--limit=1000' in cmd
@@ -51,12 +51,12 @@ def test_dc_rep(global_data):
     assert "CRACKREP" not in dump_before
     assert global_data['DOMAIN'] in dump_before
 
-    hashes = get_hashes(
+    hashes = '\n'.join(str(r) for r in get_hashes(
         global_data['DOMAIN'],
         global_data['DOMAINUSER'],
         global_data['DOMAINPASS'],
         ip=global_data['HOST'],
-    )
+    ))
     dump_after = ldap_dump(global_data)
 
     assert "CRACKREP" not in dump_after
@@ -0,0 +1,119 @@
+import multiprocessing
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+import os
+import socket
+import sys
+
+import pytest
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_PATH, '..'))
+
+
+def test_distributed(tmp_path, monkeypatch):
+    from crackomatic.cracker import Cracker, ENGINES
+    from crackomatic.distributed import Coordinator, run_worker
+
+    class Partitioned(Cracker):
+        password_regex = '^secret$'
+        expected_returncodes = [0]
+
+        def command_line(self, stage):
+            return [self._bin_path, '-c', 'sleep 1']
+
+        def _get_version(self):
+            return None
+
+        def _get_passwords(self):
+            first, last, total = self._partition
+            assert first == last and total == 3
+            return {'%032x' % first: 'password%d' % first}
+
+    # Forked workers inherit the fake engine
+    monkeypatch.setitem(ENGINES, 'Fake', Partitioned)
+    hash_file = tmp_path / 'hashfile'
+    hash_file.write_text('')
+    coordinator = Coordinator('Fake', str(hash_file), '', '', 'sh',
+                              workers=3, authkey=b'secret')
+    assert coordinator.get_status() == "Waiting for workers (0/3)"
+
+    with pytest.raises(AuthenticationError):
+        Client(coordinator.address, authkey=b'wrong')
+    # Neither do port scanners get in the way
+    with socket.create_connection(coordinator.address) as s:
+        s.sendall(b'GET / HTTP/1.0\r\n\r\n')
+    socket.create_connection(coordinator.address).close()
+
+    context = multiprocessing.get_context('fork')
+    workers = [
+        context.Process(target=run_worker,
+                        args=(coordinator.address, b'secret', 'sh', [],
+                              True))
+        for _ in range(3)
+    ]
+    for w in workers:
+        w.start()
+    assert coordinator.wait_until_finished(timeout=20)
+    for w in workers:
+        w.join()
+        assert w.exitcode == 0
+    assert coordinator.passwords == {
+        '%032x' % i: 'password%d' % i for i in range(1, 4)
+    }
+
+
+def test_check_work():
+    from crackomatic.distributed import check_work
+    check_work('Hashcat', [
+        dict(attack='rules', wordlist='words', rules='best64',
+             hash_file='priority', name='rules (tier 1)', max_runtime=60),
+        dict(attack='mask', mask='?u?l?l?d', charset1='?l?d',
+             increment=True),
+    ])
+    for engine, stage in [
+        ('sh', dict(attack='wordlist', wordlist='words')),
+        ('John', dict(attack='combinator', wordlist='a', wordlist2='b')),
+        ('Hashcat', dict(attack='wordlist', wordlist='words', args='-O')),
+        ('Hashcat', dict(attack='wordlist', wordlist='--stdout')),
+    ]:
+        with pytest.raises(ValueError):
+            check_work(engine, [stage])
+
+
+def test_stop_while_waiting():
+    from crackomatic.distributed import Coordinator
+    coordinator = Coordinator('John', '', '', '', 'sh', workers=2)
+    coordinator.stop()
+    assert coordinator.wait_until_finished(timeout=5)
+    assert coordinator.passwords == {}
+
+
+def test_john_partition():
+    from crackomatic.cracker import John
+    john = John.__new__(John)
+    john._bin_path = 'john'
+    john._hash_file = 'hashfile'
+    john._potfile = 'potfile'
+    john._session = 'session'
+    john._args = []
+    john._partition = (5, 8, 10)
+    john._hash_type = 'nt'
+    cmd = john.command_line(dict(attack='wordlist', wordlist='words'))
+    assert '--node=5-8/10' in cmd
+    assert '--fork=4' in cmd
+
+    john._partition = (2, 2, 3)
+    cmd = john.command_line(dict(attack='wordlist', wordlist='words'))
+    assert '--node=2/3' in cmd
+    assert not [a for a in cmd if a.startswith('--fork')]
+
+
+def test_assign_parts():
+    from crackomatic.distributed import assign_parts
+    # Workers with different numbers of cores share one total
+    assert assign_parts([4, 16, 1]) == [
+        (1, 4, 21), (5, 20, 21), (21, 21, 21),
+    ]
+    assert assign_parts([1, 1, 1]) == [(1, 1, 3), (2, 2, 3), (3, 3, 3)]
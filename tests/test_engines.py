@@ -0,0 +1,51 @@
+import os
+import sys
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_PATH, '..'))
+
+
+def test_engine_registry(tmp_path, monkeypatch):
+    from crackomatic.models import init_db
+    init_db('sqlite:///' + str(tmp_path / 'engines.db'))
+    from crackomatic.cracker import Cracker, ENGINES
+    from crackomatic.engines import get_engine_info
+
+    probes = []
+
+    class Fake(Cracker):
+        supported_attacks = ['wordlist', 'mask']
+
+        @classmethod
+        def probe_version(cls, bin_path):
+            probes.append(bin_path)
+            return '1.%d' % len(probes)
+
+        @classmethod
+        def probe_devices(cls, bin_path):
+            return ['CPU', 'GPU']
+
+        @classmethod
+        def probe_speed(cls, bin_path):
+            return 12345.0
+
+    monkeypatch.setitem(ENGINES, 'Fake', Fake)
+    binary = tmp_path / 'fake'
+    binary.write_text('')
+
+    assert get_engine_info('Fake', str(binary), probe=False) is None
+    info = get_engine_info('Fake', str(binary))
+    assert info.version == '1.1'
+    assert info.attacks == ['wordlist', 'mask']
+    assert info.devices == ['CPU', 'GPU']
+    assert info.speed == 12345.0
+
+    # Cached
+    assert get_engine_info('Fake', str(binary)).version == '1.1'
+    assert len(probes) == 1
+
+    # The binary has been updated
+    os.utime(str(binary), (0, 0))
+    assert get_engine_info('Fake', str(binary)).version == '1.2'
+    assert len(probes) == 2
@@ -0,0 +1,91 @@
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_PATH, '..'))
+
+
+def test_count_lines(tmp_path):
+    from crackomatic.estimate import count_lines
+    wordlist = str(tmp_path / 'wordlist')
+    with open(wordlist, 'w') as f:
+        f.write('foo\nbar\nbaz')
+    assert count_lines(wordlist) == 3
+
+    rules = str(tmp_path / 'rules')
+    with open(rules, 'w') as f:
+        f.write('# comment\n:\n\nc\n$1\n')
+    assert count_lines(rules, rules=True) == 3
+
+
+def test_mask_keyspace():
+    from crackomatic.estimate import mask_keyspace
+    assert mask_keyspace('?u?l?l?d?d') == 26**3 * 100
+    assert mask_keyspace('Summer?d') == 10
+    assert mask_keyspace('100??') == 1
+
+
+def test_estimate(tmp_path):
+    from crackomatic.estimate import estimate
+    wordlist = str(tmp_path / 'wordlist')
+    with open(wordlist, 'w') as f:
+        f.write('\n'.join(map(str, range(1000))) + '\n')
+    config = dict(
+        cracker='Hashcat',
+        wordlist_path=wordlist,
+        rule_path='',
+        attack_plan=json.dumps([
+            {"attack": "wordlist"},
+            {"attack": "mask", "mask": "?d?d?d?d?d?d", "max_runtime": 10},
+        ]),
+    )
+    report = SimpleNamespace(total_hashes=10, cliques=json.dumps({'3': 2}))
+    line_counts = {(wordlist, False): 1000}
+    result = estimate(config, 1000, line_counts, report)
+    assert result['candidates'] == 1000 + 10**6
+    assert result['stages'] == 2
+    assert result['hashes'] == 6
+    assert result['duration'] == 1 + 10
+
+    result = estimate(config, None, line_counts)
+    assert result['duration'] is None
+    assert result['hashes'] is None
+
+
+def test_line_counts(tmp_path):
+    from crackomatic.models import init_db
+    init_db('sqlite:///' + str(tmp_path / 'counts.db'))
+    from crackomatic.engines import get_line_counts, count_files
+    from crackomatic.estimate import estimate, plan_files, NotCounted
+    wordlist = str(tmp_path / 'wordlist')
+    with open(wordlist, 'w') as f:
+        f.write('foo\nbar\n')
+    config = dict(cracker='Hashcat', wordlist_path=wordlist, rule_path='')
+    files = plan_files([dict(attack='wordlist', wordlist=wordlist)])
+    assert files == {(wordlist, False)}
+
+    assert get_line_counts(files) == {}
+    with pytest.raises(NotCounted):
+        estimate(config, 1000, {})
+
+    count_files(files)
+    counts = get_line_counts(files)
+    assert counts == {(wordlist, False): 2}
+    assert estimate(config, 1000, counts)['candidates'] == 2
+
+    # The wordlist has changed
+    with open(wordlist, 'a') as f:
+        f.write('baz\n')
+    assert get_line_counts(files) == {}
+
+
+def test_charset_size():
+    from crackomatic.estimate import charset_size, mask_keyspace
+    assert charset_size('?l?d') == 36
+    assert charset_size('?u_-') == 28
+    assert mask_keyspace('?1?1?d', '?l?d') == 36 * 36 * 10
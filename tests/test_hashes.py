@@ -0,0 +1,125 @@
+import os
+import sys
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_PATH, '..'))
+
+
+NTDS = os.path.join(SCRIPT_PATH, 'data', 'ntds.txt')
+CRACKED = os.path.join(SCRIPT_PATH, 'data', 'cracked.txt')
+
+
+def test_hash_index(tmp_path):
+    from crackomatic.hashes import HashIndex, parse_pwdump
+    with open(NTDS, 'r') as f:
+        index = HashIndex.from_records(parse_pwdump(f))
+
+    assert len(index) == 1726
+    assert len(index.hashes) == 1194
+    assert len(index.account_hashes()) == 1726
+
+    hash_file = str(tmp_path / 'hashfile')
+    assert index.write(hash_file) == 1194
+    with open(hash_file, 'r') as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 1194
+    assert lines[0] == ('31d6cfe0d16ae931b73c59d7e0c089c0:0:'
+                        'aad3b435b51404eeaad3b435b51404ee:'
+                        '31d6cfe0d16ae931b73c59d7e0c089c0:::')
+
+    exclude = {'31d6cfe0d16ae931b73c59d7e0c089c0': ''}
+    assert index.write(hash_file, exclude=exclude) == 1193
+
+    # Account names are case-insensitive
+    priority = index.hashes_of(['DANIEL', 'Paul'])
+    assert priority == {'32ed87bdb5fdc5e9cba88547376818d4',
+                        '5474747e8e73bed92736f1f8e54b5b70',
+                        'cf641b657b072769366a1451d49d7e6f'}
+    assert index.write(hash_file, include=priority) == 3
+    assert index.write(hash_file, exclude=priority) == 1191
+
+    # Fan out the results to all accounts
+    cracked = {}
+    with open(CRACKED, 'r') as f:
+        for line in f.read().splitlines():
+            line = line.split(':')
+            cracked[line[4]] = line[1]
+    passwords = index.expand(cracked)
+    assert len(passwords) == 1426
+    assert passwords['domain.local\\daniel'] == '123456'
+    assert passwords['domain.local\\paul'] == '123456'
+
+
+def test_password_history(tmp_path):
+    from crackomatic.hashes import HashIndex, parse_pwdump
+    lm = 'aad3b435b51404eeaad3b435b51404ee'
+    index = HashIndex.from_records(parse_pwdump([
+        'alice:1001:%s:%s:::' % (lm, 'a' * 32),
+        'bob:1002:%s:%s:::' % (lm, 'b' * 32),
+        # The current password heads the history
+        'alice_history0:0:%s:%s:::' % (lm, 'a' * 32),
+        'alice_history1:0:%s:%s:::' % (lm, 'c' * 32),
+        'alice_history2:0:%s:%s:::' % (lm, 'b' * 32),
+    ]))
+    # Previous passwords don't count as accounts
+    assert len(index) == 2
+    assert index.hashes == ['a' * 32, 'b' * 32]
+    assert index.all_hashes == ['a' * 32, 'b' * 32, 'c' * 32]
+    hash_file = str(tmp_path / 'hashfile')
+    assert index.write(hash_file) == 3
+
+    cracked = {'a' * 32: 'Summer2026', 'b' * 32: 'Winter2025'}
+    assert index.expand(cracked) == {'alice': 'Summer2026',
+                                     'bob': 'Winter2025'}
+    assert index.password_histories(cracked) == {
+        'alice': ['Summer2026', None, 'Winter2025'],
+    }
+
+
+def test_hash_record():
+    from crackomatic.hashes import HashRecord, HashIndex, parse_pwdump
+    line = ('bob:1002:AAD3B435B51404EEAAD3B435B51404EE:'
+            'A0000000000000000000000000000002:[DU         ]::')
+    record = HashRecord.from_line(line + '\n')
+    assert record.user == 'bob'
+    assert record.nt == 'a0000000000000000000000000000002'
+    assert record.flags == '[DU         ]'
+    assert record.history is None
+    assert str(record) == line.lower().replace('[du', '[DU')
+    assert not hasattr(record, '__dict__')
+
+    # Streams from a file object and skips empty lines
+    with open(NTDS, 'r') as f:
+        records = list(parse_pwdump(f))
+    assert len(records) == 1726
+    index = HashIndex.from_records(iter(records))
+    assert len(index.hashes) == 1194
+
+    record = HashRecord('alice_history1', '0', 'aad3', 'c' * 32)
+    assert record.history == ('alice', 1)
+
+
+def test_lm_placeholders():
+    from crackomatic.hashes import HashIndex, parse_pwdump
+    # As printed by 'pdbedit -w'
+    index = HashIndex.from_records(parse_pwdump([
+        'alice:1001:XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX:%s:[U          ]:LCT-0:'
+        % ('a' * 32),
+        'bob:1002:NO PASSWORDXXXXXXXXXXXXXXXXXXXXX:%s:[U          ]:LCT-0:'
+        % ('b' * 32),
+        'carol:1003:aad3b435b51404eeaad3b435b51404ee:%s:[U          ]::'
+        % ('c' * 32),
+        'dave:1004:E52CAC67419A9A224A3B108F3FA6CB6D:%s:[U          ]::'
+        % ('d' * 32),
+    ]))
+    assert len(index) == 4
+    assert index.lm_hashes == ['d' * 32]
+
+    # Accounts without an NT hash are left out
+    index = HashIndex.from_records(parse_pwdump([
+        'Guest:501:NO PASSWORDXXXXXXXXXXXXXXXXXXXXX:'
+        'NO PASSWORDXXXXXXXXXXXXXXXXXXXXX:[DU         ]:LCT-0:',
+    ]))
+    assert len(index) == 0
+    assert index.all_hashes == []
@@ -0,0 +1,191 @@
+import os
+import sys
+from datetime import datetime as dt
+
+import pytest
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_PATH, '..'))
+
+
+def test_in_window():
+    from crackomatic.job import in_window
+
+    def at(time):
+        return dt.strptime('2021-01-01 ' + time, '%Y-%m-%d %H:%M')
+
+    assert in_window(at('12:00'), None, None)
+    assert in_window(at('12:00'), '08:00', '18:00')
+    assert not in_window(at('18:00'), '08:00', '18:00')
+    assert not in_window(at('07:59'), '08:00', '18:00')
+
+    # Overnight
+    assert in_window(at('23:00'), '20:00', '06:00')
+    assert in_window(at('05:59'), '20:00', '06:00')
+    assert not in_window(at('06:00'), '20:00', '06:00')
+    assert not in_window(at('12:00'), '20:00', '06:00')
+
+
+def test_prefetch_directory(monkeypatch):
+    from types import SimpleNamespace
+    from crackomatic import job as job_module
+
+    queries = []
+
+    def ldap_query(url, dn, ca_file, bind, password, filter, attributes):
+        queries.append((filter, attributes))
+        return {'CN=Alice': {'sAMAccountName': [b'alice']}}
+
+    monkeypatch.setattr(job_module, 'ldap_query', ldap_query)
+    job = job_module.Job.__new__(job_module.Job)
+    job.audit = SimpleNamespace(
+        ldap_url='ldaps://dc.contoso.local', domain='contoso.local',
+        ca_file=None, user='admin', password='secret', email_field='mail',
+        user_filter='(objectClass=user)', admin_filter='(adminCount=1)',
+        get=lambda key, default=None: None,
+    )
+    job.cracker_config = {'ldap_accounts': True}
+    job.password = None
+    job._directory = {}
+    job.prefetch_directory()
+
+    # Queries with the same filter are merged
+    assert len(job._directory) == 2
+    entries = job.query_directory('(objectClass=user)', ['sAMAccountName'])
+    assert entries == {'CN=Alice': {'sAMAccountName': [b'alice']}}
+    job.query_directory('(adminCount=1)', ['mail'])
+    assert len(queries) == 2
+    # Attributes that were not prefetched need another query
+    job.query_directory('(adminCount=1)', ['description'])
+    assert len(queries) == 3
+
+
+def test_prefetch_failure(monkeypatch):
+    from types import SimpleNamespace
+    from crackomatic import job as job_module
+
+    queries = []
+
+    def ldap_query(url, dn, ca_file, bind, password, filter, attributes):
+        queries.append(filter)
+        if len(queries) <= 2:
+            raise ConnectionError("Can't contact LDAP server")
+        return {'CN=Alice': {'sAMAccountName': [b'alice']}}
+
+    monkeypatch.setattr(job_module, 'ldap_query', ldap_query)
+    job = job_module.Job.__new__(job_module.Job)
+    job.audit = SimpleNamespace(
+        ldap_url='ldaps://dc.contoso.local', domain='contoso.local',
+        ca_file=None, user='admin', password='secret', email_field='mail',
+        user_filter='(objectClass=user)', admin_filter=None,
+        get=lambda key, default=None: None,
+    )
+    job.cracker_config = {}
+    job.password = None
+    job._directory = {}
+    job.prefetch_directory()
+
+    # The prefetched query and the one replacing it fail
+    with pytest.raises(ConnectionError):
+        job.query_directory('(objectClass=user)', ['mail'])
+    assert len(queries) == 2
+    # The retry queries the directory again instead of the failed future
+    entries = job.query_directory('(objectClass=user)', ['mail'])
+    assert entries == {'CN=Alice': {'sAMAccountName': [b'alice']}}
+    assert len(queries) == 3
+
+
+def test_acquire_cracker(monkeypatch):
+    from datetime import timedelta
+    from threading import Event, Lock
+    from types import SimpleNamespace
+    from crackomatic import job as job_module
+
+    monkeypatch.setattr(job_module, 'SUPERVISE_INTERVAL', 0.01)
+    crack_lock = Lock()
+
+    def make_job():
+        job = job_module.Job.__new__(job_module.Job)
+        job.audit = SimpleNamespace(uuid='1')
+        job.crack_lock = crack_lock
+        job._holds_crack_lock = False
+        job.waiting = False
+        job._suspended = Event()
+        return job
+
+    first, second = make_job(), make_job()
+    assert first._acquire_cracker(None)
+    # Only one job cracks at a time
+    assert not second._acquire_cracker(dt.now() + timedelta(seconds=0.05))
+    assert not second.waiting
+    second._release_cracker()
+    assert crack_lock.locked()
+    first._release_cracker()
+    assert second._acquire_cracker(None)
+    second._release_cracker()
+    assert not crack_lock.locked()
+
+
+def test_domains():
+    from types import SimpleNamespace
+    from crackomatic.hashes import HashRecord
+    from crackomatic.job import Job, parse_domains
+
+    assert parse_domains('emea.contoso.local, apac.contoso.local') == \
+        ['emea.contoso.local', 'apac.contoso.local']
+    assert parse_domains(None) == []
+
+    job = Job.__new__(Job)
+    job.audit = SimpleNamespace(domain='contoso.local')
+    job.domains = ['contoso.local', 'emea.contoso.local']
+    records = job._qualify([HashRecord('EMEA\\dave', '1001', '', 'd' * 32)],
+                           'emea.contoso.local')
+    user = next(records).user
+    assert user == 'emea.contoso.local\\dave'
+    assert job.domain_of(user) == 'emea.contoso.local'
+    assert job.domain_of('CONTOSO\\alice') == 'contoso.local'
+    assert job.domain_of('alice') == 'contoso.local'
+
+
+def test_notification_failure(monkeypatch, tmp_path):
+    from threading import Lock
+    from types import SimpleNamespace
+    from crackomatic import job as job_module
+    from crackomatic.constants import AuditState
+
+    monkeypatch.setattr(job_module, 'get_work_dir',
+                        lambda uuid: str(tmp_path / uuid))
+    monkeypatch.setattr(job_module.checkpoint, 'read_lines', lambda path: [])
+    monkeypatch.setattr(job_module, 'report_from_dict', lambda d: d)
+    checkpoints = {
+        job_module.CRACKED: dict(cracked={}, breached=None, sample=None),
+        job_module.REPORT: dict(report={}, text_report=''),
+    }
+
+    def notify(users, breached_users):
+        raise ConnectionError("Can't contact SMTP server")
+
+    job = job_module.Job.__new__(job_module.Job)
+    job.audit = SimpleNamespace(uuid='1', state=AuditState.SCHEDULED,
+                                get=lambda key, default=None: None)
+    job.cb_update = job.cb_cleanup = None
+    job.lock = Lock()
+    job.resume = True
+    job._tmp_dir = None
+    job.work_dir = job_module.get_work_dir('1')
+    job.sample = None
+    job.domains = ['contoso.local']
+    job.prefetch_directory = lambda: None
+    job.load_checkpoint = checkpoints.get
+    job.notify = notify
+    for name in (job_module.HASH_DUMP, job_module.REPORT):
+        os.makedirs(job.work_dir, exist_ok=True)
+        open(os.path.join(job.work_dir, name), 'w').close()
+
+    with pytest.raises(ConnectionError):
+        job.run()
+    assert job.audit.state == AuditState.FAILED
+    # Only the notifications are repeated on the next start
+    assert job_module.notifications_pending('1')
+    assert job_module.can_resume('1')
@@ -0,0 +1,32 @@
+import os
+import sys
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_PATH, '..'))
+
+
+def test_combine_halves(tmp_path):
+    from crackomatic.lm import parse_potfile, combine, EMPTY_HALF
+    potfile = str(tmp_path / 'potfile')
+    with open(potfile, 'w') as f:
+        # Hashcat and John write the halves differently
+        f.write('e52cac67419a9a22:PASSWOR\n')
+        f.write('$LM$664345140a852f61:D1\n')
+        f.write('$LM$4a3b108f3fa6cb6d:$HEX[5445535431]\n')
+    halves = parse_potfile(potfile)
+    assert combine(halves, 'E52CAC67419A9A22664345140A852F61') == \
+        'PASSWORD1'
+    assert combine(halves, '4a3b108f3fa6cb6d' + EMPTY_HALF) == 'TEST1'
+    assert combine(halves, 'e52cac67419a9a22' + '0' * 16) is None
+    assert parse_potfile(str(tmp_path / 'missing')) == {EMPTY_HALF: ''}
+
+
+def test_case_variants(tmp_path):
+    from crackomatic.lm import case_variants, write_candidates
+    assert sorted(case_variants('AB1')) == ['AB1', 'Ab1', 'aB1', 'ab1']
+    wordlist = str(tmp_path / 'wordlist')
+    assert write_candidates(wordlist, ['PASSWORD1', 'AB1', 'AB1']) == \
+        2**8 + 4
+    with open(wordlist, 'r') as f:
+        assert 'Password1\n' in f.readlines()
@@ -0,0 +1,111 @@
+import os
+import sys
+
+import pytest
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_PATH, '..'))
+
+
+def test_attack_plan():
+    from crackomatic.plan import parse_attack_plan
+
+    # No plan
+    assert parse_attack_plan('', 'words.txt', 'best64') == [
+        dict(attack='rules', wordlist='words.txt', rules='best64'),
+    ]
+    assert parse_attack_plan(None, 'words.txt', '') == [
+        dict(attack='wordlist', wordlist='words.txt'),
+    ]
+
+    plan = parse_attack_plan(
+        '[{"attack": "wordlist", "wordlist": "top.txt"},'
+        ' {"attack": "mask", "mask": "?u?l?l?d", "max_runtime": 60},'
+        ' {"attack": "rules", "max_candidates": 1000}]',
+        'words.txt',
+        'best64',
+        'John',
+    )
+    assert plan == [
+        dict(attack='wordlist', wordlist='top.txt'),
+        dict(attack='mask', mask='?u?l?l?d', max_runtime=60),
+        dict(attack='rules', wordlist='words.txt', rules='best64',
+             max_candidates=1000),
+    ]
+
+    for invalid in [
+        '{"attack": "wordlist"}',
+        '[]',
+        '[{"attack": "wordlist"',
+        '[{"attack": "brute"}]',
+        '[{"attack": "mask"}]',
+        '[{"attack": "rules", "rules": ""}]',
+        '[{"attack": "wordlist", "foo": "bar"}]',
+        '[{"attack": "wordlist", "max_runtime": "60"}]',
+        '[{"attack": "wordlist", "max_runtime": 0}]',
+    ]:
+        with pytest.raises(ValueError):
+            parse_attack_plan(invalid, 'words.txt', '', 'Hashcat')
+
+    combinator = '[{"attack": "combinator", "wordlist2": "words.txt"}]'
+    assert parse_attack_plan(combinator, 'words.txt', '', 'Hashcat')
+    with pytest.raises(ValueError):
+        parse_attack_plan(combinator, 'words.txt', '', 'John')
+
+
+def test_tier_stages():
+    from crackomatic.plan import tier_stages, parse_attack_plan
+    stages = [
+        dict(attack='wordlist', wordlist='top.txt', name='top'),
+        dict(attack='rules', wordlist='words.txt', rules='best64'),
+    ]
+    tiered = tier_stages(stages, ['priority', 'others'])
+    assert [(s['attack'], s['hash_file'], s['name']) for s in tiered] == [
+        ('wordlist', 'priority', 'top (tier 1)'),
+        ('rules', 'priority', 'rules (tier 1)'),
+        ('wordlist', 'others', 'top (tier 2)'),
+    ]
+    # The plan itself is left alone
+    assert 'hash_file' not in stages[0]
+
+    # The remaining tiers always get a pass over the configured wordlist
+    stages = parse_attack_plan('', 'words.txt', 'best64')
+    tiered = tier_stages(stages, ['priority', 'others'], 'words.txt')
+    assert [(s['attack'], s['hash_file']) for s in tiered] == [
+        ('rules', 'priority'),
+        ('wordlist', 'others'),
+    ]
+    assert tiered[1]['wordlist'] == 'words.txt'
+    with pytest.raises(ValueError):
+        tier_stages(stages, ['priority', 'others'])
+
+
+def test_fingerprint_plan(tmp_path):
+    from crackomatic.plan import parse_attack_plan, fingerprint_plan
+    wordlist = tmp_path / 'words.txt'
+    wordlist.write_text('password\n')
+    stages = parse_attack_plan('', str(wordlist), '')
+    plan = fingerprint_plan(stages, 'Hashcat')
+    assert plan == fingerprint_plan(stages, 'Hashcat')
+    assert plan != fingerprint_plan(stages, 'John')
+    assert plan != fingerprint_plan(stages, 'Hashcat', '-O')
+
+    # An updated wordlist makes it a different plan
+    wordlist.write_text('password\nletmein\n')
+    assert plan != fingerprint_plan(stages, 'Hashcat')
+
+    # Generated wordlists count with their content, not their path
+    first, second = tmp_path / 'first.txt', tmp_path / 'second.txt'
+    first.write_text('contoso\n')
+    second.write_text('contoso\n')
+
+    def generated(path):
+        return [dict(attack='wordlist', wordlist=str(path),
+                     generated=True)] + stages
+
+    plan = fingerprint_plan(generated(first), 'Hashcat')
+    assert plan == fingerprint_plan(generated(second), 'Hashcat')
+    second.write_text('contoso\nfabrikam\n')
+    assert plan != fingerprint_plan(generated(second), 'Hashcat')
+    assert plan != fingerprint_plan(stages, 'Hashcat')
@@ -92,3 +92,88 @@ def test_text_report(cracked):
     assert figures[7]['html'] == ''
     assert figures[8]['html'] == ''
     assert figures[9]['html'] == ''
+
+
+def test_breach_report(cracked):
+    hashes, passwords = cracked
+    from crackomatic.reports import create_report, create_text_report, \
+        create_figures
+
+    # Breach statistics only show up if there is a corpus
+    r = create_report(passwords, hashes)
+    assert len(create_figures(r)) == 10
+    assert 'breaches' not in create_text_report(r)
+
+    nt = '32ed87bdb5fdc5e9cba88547376818d4'
+    r = create_report(passwords, hashes, {nt: 37359195, '0' * 32: 1})
+    share = hashes.count(nt) / len(hashes)
+    assert r.breached == share
+    assert r.breach_prevalence == '{"8": %d}' % hashes.count(nt)
+    text = create_text_report(r)
+    assert "Percentage of hashes found in breaches: %.02f%%" % (share * 100) \
+        in text
+    figures = create_figures(r)
+    assert len(figures) == 12
+    assert '<svg' in figures[10]['html']
+
+
+def test_sample_report(cracked):
+    hashes, passwords = cracked
+    from crackomatic.reports import create_report, create_text_report, \
+        create_figures
+
+    sample = dict(share=0.05, cracked=0.8, low=0.7, high=0.9)
+    r = create_report(passwords[:100], hashes, sample=sample)
+    assert r.cracked == 0.8
+    assert r.total_hashes == len(hashes)
+    text = create_text_report(r)
+    assert "Percentage of hashes sampled: 5.00%" in text
+    assert "Percentage of hashes cracked (lower bound): 70.00%" in text
+    assert len(create_figures(r)) == 13
+
+
+def test_rotation():
+    from crackomatic.reports import is_predictable, get_rotation
+    assert is_predictable('Summer2025', 'Summer2026')
+    assert is_predictable('Password1', 'Password2!')
+    assert not is_predictable('Summer2025', 'Summer2025')
+    assert not is_predictable('Summer2025', 'Winter2025')
+    assert not is_predictable('123456', '654321')
+    assert get_rotation({
+        'alice': ['Summer2026', 'Summer2025'],
+        'bob': ['Winter2025', None, 'Winter2024'],
+        'carol': ['Secret1', 'Hunter2'],
+    }) == 0.5
+    assert get_rotation({'bob': ['Winter2025', None]}) is None
+
+
+def test_domain_report(cracked):
+    hashes, passwords = cracked
+    from crackomatic.reports import create_report, create_text_report, \
+        create_figures, get_domain_breakdown
+
+    accounts = {
+        'contoso.local': {'alice': 'a' * 32, 'bob': 'b' * 32},
+        'emea.contoso.local': {'emea.contoso.local\\alice': 'a' * 32,
+                               'emea.contoso.local\\dave': 'd' * 32,
+                               'emea.contoso.local\\erin': 'e' * 32,
+                               'emea.contoso.local\\frank': 'f' * 32},
+    }
+    domains = get_domain_breakdown(accounts, {
+        'alice': 'Summer2026',
+        'emea.contoso.local\\alice': 'Summer2026',
+        'emea.contoso.local\\dave': None,
+    })
+    assert domains[0]['contoso.local'] == dict(
+        total_hashes=2, cracked=0.5, breached=None, reused=0.5,
+    )
+    assert domains[0]['emea.contoso.local']['cracked'] == 0.25
+    assert domains[1] == 2 / 6
+
+    r = create_report(passwords, hashes, domains=domains)
+    assert r.cross_domain_reuse == 2 / 6
+    text = create_text_report(r)
+    assert "contoso.local: Hashes 2, Cracked 50.0%, Reused 50.0%" in text
+    figures = create_figures(r)
+    assert len(figures) == 12
+    assert '<td>25.0%</td>' in figures[-1]['html']
@@ -0,0 +1,78 @@
+import os
+import random
+import sys
+
+import pytest
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_PATH, '..'))
+
+
+NTDS = os.path.join(SCRIPT_PATH, 'data', 'ntds.txt')
+CRACKED = os.path.join(SCRIPT_PATH, 'data', 'cracked.txt')
+
+
+def test_wilson_interval():
+    from crackomatic.sampling import wilson_interval
+    low, high = wilson_interval(50, 100)
+    assert low == pytest.approx(0.4038, abs=1e-4)
+    assert high == pytest.approx(0.5962, abs=1e-4)
+    low, high = wilson_interval(0, 20)
+    assert low == 0
+    assert 0 < high < 0.2
+    assert wilson_interval(0, 0) == (0, 1)
+
+
+def test_sample():
+    from crackomatic.hashes import HashIndex, parse_pwdump
+    from crackomatic.sampling import draw_sample, extrapolate, stratum
+    with open(NTDS, 'r') as f:
+        index = HashIndex.from_records(parse_pwdump(f))
+    cracked = {}
+    with open(CRACKED, 'r') as f:
+        for line in f.read().splitlines():
+            line = line.split(':')
+            cracked[line[4]] = line[1]
+    full = len(index.expand(cracked)) / len(index)
+
+    sample = draw_sample(index, 0.2, random.Random(0))
+    counts = index.account_counts()
+    # Every stratum is represented
+    assert {stratum(counts[nt]) for nt in sample} == \
+        {stratum(n) for n in counts.values()}
+    assert len(sample) == pytest.approx(0.2 * len(index.hashes), abs=3)
+
+    result = extrapolate(index, sample, cracked)
+    assert result['share'] == len(sample) / len(index.hashes)
+    assert result['low'] <= result['cracked'] <= result['high']
+    assert result['low'] <= full <= result['high']
+
+    # A full sample leaves no uncertainty
+    result = extrapolate(index, set(index.hashes), cracked)
+    assert result['cracked'] == pytest.approx(full)
+    assert result['low'] == result['cracked'] == result['high']
+
+
+def test_extrapolate_shared_hashes():
+    from crackomatic.hashes import HashIndex
+    from crackomatic.sampling import extrapolate, ratio_interval
+    # One cracked hash of 1000 accounts, nine hashes of ten accounts each
+    # and 100 hashes of one account each
+    index = HashIndex()
+    sizes = [1000] + [10] * 9 + [1] * 100
+    for i, size in enumerate(sizes):
+        for j in range(size):
+            index.add('DOMAIN\\user%d_%d' % (i, j), '', '%032x' % i)
+    cracked = {'%032x' % 0: 'password'}
+    accounts = sum(sizes)
+    assert len(index.expand(cracked)) / accounts == pytest.approx(0.840, 1e-3)
+
+    # A full sample gives the share of the full audit
+    result = extrapolate(index, set(index.hashes), cracked)
+    assert result['cracked'] == pytest.approx(1000 / accounts)
+    assert result['low'] == result['cracked'] == result['high']
+
+    # Accounts sharing a hash count as often as they share it
+    low, high = ratio_interval([10, 10, 1], [True, False, False])
+    assert low < 10 / 21 < high
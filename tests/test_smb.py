@@ -0,0 +1,30 @@
+import os
+import sys
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_PATH, '..'))
+
+
+LDIF = """\
+# record 1
+dn: CN=Alice,CN=Users,DC=contoso,DC=local
+sAMAccountName: alice
+ntPwdHistory:: qqqqqqqqqqqqqqqqqqqqqru7u7u7u7u7u7u7u7u7u7
+ s=
+
+# record 2
+dn: CN=Bob,CN=Users,DC=contoso,DC=local
+sAMAccountName: bob
+
+# returned 2 records
+"""
+
+
+def test_parse_ldif():
+    from crackomatic.smb import parse_ldif
+    entries = parse_ldif(LDIF)
+    assert len(entries) == 2
+    assert entries[0]['sAMAccountName'] == [b'alice']
+    assert entries[0]['ntPwdHistory'] == [b'\xaa' * 16 + b'\xbb' * 16]
+    assert entries[1]['dn'] == [b'CN=Bob,CN=Users,DC=contoso,DC=local']
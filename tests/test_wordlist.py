@@ -0,0 +1,49 @@
+from datetime import date
+import os
+import sys
+
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_PATH, '..'))
+
+
+ENTRIES = {
+    'CN=Alice,OU=Users,DC=contoso,DC=local': {
+        'givenName': [b'Alice'],
+        'sn': [b'M\xc3\xbcller-Schmidt'],
+        'company': [b'Contoso Ltd'],
+        'department': [b'R&D'],
+        'l': [b'Berlin'],
+        'description': [b'Product owner for Fabrikam and the new portal'],
+    },
+    'CN=Bob,OU=Users,DC=contoso,DC=local': {
+        'givenName': [b'Bob'],
+        'company': [b'Contoso Ltd'],
+        'l': [b'Berlin'],
+    },
+}
+
+
+def test_base_words():
+    from crackomatic.wordlist import get_base_words
+    words = get_base_words(ENTRIES, 'contoso.local')
+    assert words == {
+        'alice', 'müller', 'schmidt', 'contoso', 'ltd', 'berlin', 'product',
+        'fabrikam', 'bob', 'local',
+    }
+
+
+def test_wordlist(tmp_path):
+    from crackomatic.wordlist import write_wordlist, get_candidates
+    path = str(tmp_path / 'wordlist.txt')
+    count = write_wordlist(path, ENTRIES)
+    with open(path, 'r') as f:
+        candidates = f.read().splitlines()
+    assert len(candidates) == count == len(set(candidates))
+    year = date.today().year
+    for c in ['berlin', 'Berlin1', 'BERLIN!', 'Berlin%d' % year,
+              'Contoso%d!' % (year - 1), 'Müller%02d' % (year % 100)]:
+        assert c in candidates
+
+    assert list(get_candidates({'bob'}, date(2021, 1, 1)))[:3] == \
+        ['BOB', 'BOB1', 'BOB12']